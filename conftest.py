@@ -3,6 +3,10 @@ import pytest
 def pytest_addoption(parser):
   parser.addoption( "--dump-vcd", action="store_true",
                     help="dump vcd for each test" )
+  parser.addoption( "--vcd-gzip", action="store_true",
+                    help="compress dumped vcd files with gzip" )
+  parser.addoption( "--vcd-window", action="store", type="int", default=0,
+                    help="only dump the last N cycles of failing tests" )
   parser.addoption( "--dump-asm", action="store_true",
                     help="dump asm file for each test" )
   parser.addoption( "--dump-bin", action="store_true",
@@ -15,7 +19,8 @@ def pytest_funcarg__dump_vcd(request):
   if request.config.option.dump_vcd:
     test_module = request.module.__name__
     test_name   = request.node.name
-    return '{}.{}.vcd'.format( test_module, test_name )
+    suffix      = '.gz' if request.config.option.vcd_gzip else ''
+    return '{}.{}.vcd{}'.format( test_module, test_name, suffix )
   else:
     return ''
 
@@ -36,7 +41,24 @@ def pytest_cmdline_preparse(config, args):
   import sys
   sys.dont_write_bytecode = True
 
+def pytest_configure(config):
+  """Only keep a window of the vcd of each simulation if requested."""
+  if config.option.vcd_window:
+    from pymtl.tools.simulation import vcd
+    vcd.DEFAULT_WINDOW = config.option.vcd_window
+
 def pytest_runtest_setup(item):
+  from pymtl.tools.simulation.vcd import clear_vcd_windows
+  clear_vcd_windows()
   test_verilog = item.config.option.test_verilog
   if test_verilog and 'test_verilog' not in item.funcargnames:
     pytest.skip("ignoring non-Verilog tests")
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+  """Write the vcd windows of the simulations of failing tests."""
+  outcome = yield
+  report  = outcome.get_result()
+  if report.when == 'call' and report.failed:
+    from pymtl.tools.simulation.vcd import flush_vcd_windows
+    flush_vcd_windows()
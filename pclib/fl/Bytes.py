@@ -8,17 +8,23 @@
 # Date   : May 26, 2014
 
 from pymtl import Bits
-import struct
 import binascii
 
+from SparseMemory import SparseMemory
+
 class Bytes (object):
 
   #-----------------------------------------------------------------------
   # Constructor
   #-----------------------------------------------------------------------
+  # If sparse is True, the bytes are stored in a SparseMemory which only
+  # allocates the pages which are actually written.
 
-  def __init__( self, size ):
-    self.mem = bytearray(size)
+  def __init__( self, size, sparse=False ):
+    if sparse:
+      self.mem = SparseMemory(size)
+    else:
+      self.mem = bytearray(size)
 
   #-----------------------------------------------------------------------
   # setitem
@@ -58,8 +64,15 @@ class Bytes (object):
       else:
         bits = Bits( num_bytes*8, value )
 
-      for i in range(num_bytes):
-        self.mem[start_addr+i] = bits[i*8:i*8+8]
+      # Write all of the bytes with a single slice assignment, checking
+      # the range first so we never resize a bytearray
+
+      if start_addr < 0 or start_addr + num_bytes > len(self.mem):
+        raise IndexError( "Bytes index out of range" )
+
+      data = bits.uint()
+      self.mem[start_addr:start_addr+num_bytes] = \
+        bytearray( ( data >> (i*8) ) & 0xff for i in xrange(num_bytes) )
 
   #-----------------------------------------------------------------------
   # getitem
@@ -71,17 +84,20 @@ class Bytes (object):
 
       start_addr = int(key.start)
       num_bytes = int(key.stop) - int(key.start)
-      bits = Bits( 8*num_bytes )
 
-      for i in range(num_bytes):
-        bits[i*8:i*8+8] = \
-          struct.unpack_from("<B",buffer(self.mem,start_addr+i,1))[0]
+      data = self.mem[start_addr:start_addr+num_bytes]
+      if start_addr < 0 or len(data) != num_bytes:
+        raise IndexError( "Bytes index out of range" )
+
+      value = 0
+      for i, byte in enumerate( data ):
+        value |= byte << (i*8)
 
-      return bits
+      return Bits( 8*num_bytes, value )
 
     else:
       idx = int(key)
-      return Bits( 8, struct.unpack_from("<B",buffer(self.mem,idx,1))[0] )
+      return Bits( 8, self.mem[idx] )
 
   #-----------------------------------------------------------------------
   # eq
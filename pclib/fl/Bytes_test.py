@@ -84,9 +84,10 @@ def test_writing_bits():
 #-------------------------------------------------------------------------
 # test_reading_bits
 #-------------------------------------------------------------------------
-def test_reading_bits():
+@pytest.mark.parametrize( "sparse", [ False, True ] )
+def test_reading_bits( sparse ):
 
-  mem = Bytes(8)
+  mem = Bytes( 8, sparse )
 
   # Write first four bytes
 
@@ -123,3 +124,10 @@ def test_reading_bits():
   mem[0:8] = Bits( 64, 0xdeadbeefcafecade )
   assert mem[0:8] == Bits( 64, 0xdeadbeefcafecade )
 
+
+  # Accesses past the end of memory
+
+  with pytest.raises( IndexError ):
+    mem[6:10]
+  with pytest.raises( IndexError ):
+    mem[6:10] = Bits( 32, 0 )
@@ -0,0 +1,236 @@
+#=========================================================================
+# SparseMemory
+#=========================================================================
+# Byte-addressable memory made of lazily allocated 4KB pages. Supports
+# the subset of the bytearray interface used by the functional and test
+# memories (indexing and slicing to read and write bytes, and len), so
+# it can be used in place of a bytearray(size) without allocating the
+# whole address space up front.
+#
+# Memory images can be mapped into the memory with map(). Pages which
+# are completely covered by the image data refer directly to that data
+# (e.g., a buffer into an mmap'ed ELF file, see elf.elf_mmap_reader) and
+# are only copied the first time they are written. Pages which have
+# never been mapped or written read as zero.
+
+import struct
+
+PAGE_BITS = 12
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+zero_page = buffer( '\0' * PAGE_SIZE )
+
+unpack_byte  = struct.Struct("<B").unpack_from
+unpack_hword = struct.Struct("<H").unpack_from
+unpack_word  = struct.Struct("<I").unpack_from
+pack_hword   = struct.Struct("<H").pack_into
+pack_word    = struct.Struct("<I").pack_into
+
+class SparseMemory (object):
+
+  #-----------------------------------------------------------------------
+  # Constructor
+  #-----------------------------------------------------------------------
+
+  def __init__( self, size=2**32 ):
+
+    self.size = size
+
+    self.pages    = {}   # page number -> writable bytearray
+    self.ro_pages = {}   # page number -> read-only buffer (image data)
+
+  #-----------------------------------------------------------------------
+  # len
+  #-----------------------------------------------------------------------
+
+  def __len__( self ):
+    return self.size
+
+  #-----------------------------------------------------------------------
+  # read_page
+  #-----------------------------------------------------------------------
+  # Returns the page holding the given page number for reading. The
+  # returned object supports the buffer interface but may be read-only.
+
+  def read_page( self, page_num ):
+    try:
+      return self.pages[ page_num ]
+    except KeyError:
+      return self.ro_pages.get( page_num, zero_page )
+
+  #-----------------------------------------------------------------------
+  # write_page
+  #-----------------------------------------------------------------------
+  # Returns the page holding the given page number as a bytearray,
+  # allocating it (or copying it from the mapped image) if needed.
+
+  def write_page( self, page_num ):
+    try:
+      return self.pages[ page_num ]
+    except KeyError:
+      page = bytearray( self.ro_pages.pop( page_num, zero_page ) )
+      self.pages[ page_num ] = page
+      return page
+
+  #-----------------------------------------------------------------------
+  # map
+  #-----------------------------------------------------------------------
+  # Make the given data appear at addr. Full pages refer to the data
+  # without copying it, so the data must not be modified afterwards.
+
+  def map( self, addr, data ):
+
+    self._check( addr, len(data) )
+
+    offset = 0
+    end    = len(data)
+    while offset < end:
+
+      page_num    = ( addr + offset ) >> PAGE_BITS
+      page_offset = ( addr + offset ) &  PAGE_MASK
+      nbytes      = min( PAGE_SIZE - page_offset, end - offset )
+
+      if nbytes == PAGE_SIZE:
+        self.pages.pop( page_num, None )
+        self.ro_pages[ page_num ] = buffer( data, offset, PAGE_SIZE )
+      else:
+        page = self.write_page( page_num )
+        page[ page_offset : page_offset + nbytes ] = \
+          buffer( data, offset, nbytes )
+
+      offset += nbytes
+
+  #-----------------------------------------------------------------------
+  # read
+  #-----------------------------------------------------------------------
+  # Returns the little-endian unsigned integer stored in nbytes bytes at
+  # addr.
+
+  def read( self, addr, nbytes ):
+
+    page_offset = addr & PAGE_MASK
+    if page_offset + nbytes <= PAGE_SIZE and 0 <= addr < self.size:
+      page = self.read_page( addr >> PAGE_BITS )
+      if nbytes == 4:
+        return unpack_word( page, page_offset )[0]
+      if nbytes == 2:
+        return unpack_hword( page, page_offset )[0]
+      if nbytes == 1:
+        return unpack_byte( page, page_offset )[0]
+
+    # Access crossing a page boundary
+
+    self._check( addr, nbytes )
+    value = 0
+    for i, byte in enumerate( self[ addr : addr + nbytes ] ):
+      value |= byte << ( 8*i )
+    return value
+
+  #-----------------------------------------------------------------------
+  # write
+  #-----------------------------------------------------------------------
+  # Stores value as a little-endian unsigned integer in nbytes bytes at
+  # addr.
+
+  def write( self, addr, nbytes, value ):
+
+    page_offset = addr & PAGE_MASK
+    if page_offset + nbytes <= PAGE_SIZE and 0 <= addr < self.size:
+      page = self.write_page( addr >> PAGE_BITS )
+      if nbytes == 4:
+        pack_word( page, page_offset, value )
+        return
+      if nbytes == 2:
+        pack_hword( page, page_offset, value )
+        return
+      if nbytes == 1:
+        page[ page_offset ] = value
+        return
+
+    # Access crossing a page boundary
+
+    self._check( addr, nbytes )
+    self[ addr : addr + nbytes ] = \
+      bytearray( ( value >> ( 8*i ) ) & 0xff for i in xrange( nbytes ) )
+
+  #-----------------------------------------------------------------------
+  # getitem
+  #-----------------------------------------------------------------------
+  # Like a bytearray, indexing returns an integer and slicing returns a
+  # new bytearray.
+
+  def __getitem__( self, key ):
+
+    if isinstance( key, slice ):
+
+      start, stop = self._range( key )
+      data = bytearray()
+      addr = start
+      while addr < stop:
+        page_offset = addr & PAGE_MASK
+        nbytes      = min( PAGE_SIZE - page_offset, stop - addr )
+        page        = self.read_page( addr >> PAGE_BITS )
+        data       += buffer( page, page_offset, nbytes )
+        addr       += nbytes
+      return data
+
+    else:
+      addr = self._index( key )
+      return unpack_byte( self.read_page( addr >> PAGE_BITS ),
+                          addr & PAGE_MASK )[0]
+
+  #-----------------------------------------------------------------------
+  # setitem
+  #-----------------------------------------------------------------------
+  # Like a bytearray, but the length of a slice cannot be changed.
+
+  def __setitem__( self, key, value ):
+
+    if isinstance( key, slice ):
+
+      start, stop = self._range( key )
+      if len( value ) != stop - start:
+        raise ValueError( "Cannot resize SparseMemory (slice of {} bytes "
+                          "assigned {} bytes)".format( stop - start,
+                                                      len( value ) ) )
+      data = buffer( value ) if not isinstance( value, list ) \
+                             else bytearray( value )
+      offset = 0
+      addr   = start
+      while addr < stop:
+        page_offset = addr & PAGE_MASK
+        nbytes      = min( PAGE_SIZE - page_offset, stop - addr )
+        page        = self.write_page( addr >> PAGE_BITS )
+        page[ page_offset : page_offset + nbytes ] = \
+          buffer( data, offset, nbytes )
+        offset += nbytes
+        addr   += nbytes
+
+    else:
+      addr = self._index( key )
+      self.write_page( addr >> PAGE_BITS )[ addr & PAGE_MASK ] = value
+
+  #-----------------------------------------------------------------------
+  # Helpers
+  #-----------------------------------------------------------------------
+
+  def _index( self, key ):
+    addr = int( key )
+    if addr < 0:
+      addr += self.size
+    if not 0 <= addr < self.size:
+      raise IndexError( "SparseMemory index out of range" )
+    return addr
+
+  def _range( self, key ):
+    if key.step not in ( None, 1 ):
+      raise ValueError( "SparseMemory does not support extended slices" )
+    start, stop, _ = slice( None if key.start is None else int(key.start),
+                            None if key.stop  is None else int(key.stop) ) \
+                       .indices( self.size )
+    return start, max( start, stop )
+
+  def _check( self, addr, nbytes ):
+    if addr < 0 or addr + nbytes > self.size:
+      raise IndexError( "SparseMemory address range out of range" )
@@ -0,0 +1,104 @@
+#=========================================================================
+# SparseMemory_test.py
+#=========================================================================
+
+import pytest
+
+from SparseMemory import SparseMemory, PAGE_SIZE
+
+#-------------------------------------------------------------------------
+# test_zero
+#-------------------------------------------------------------------------
+def test_zero():
+
+  mem = SparseMemory()
+
+  assert len(mem) == 2**32
+  assert mem[0] == 0
+  assert mem[2**32-1] == 0
+  assert mem[0x1000:0x1004] == bytearray(4)
+  assert mem.read( 0x80000000, 4 ) == 0
+
+  # Reading never allocates pages
+
+  assert mem.pages == {}
+
+#-------------------------------------------------------------------------
+# test_read_write
+#-------------------------------------------------------------------------
+def test_read_write():
+
+  mem = SparseMemory()
+
+  mem.write( 0x1000, 4, 0xdeadbeef )
+  assert mem[0x1000:0x1004] == bytearray("\xef\xbe\xad\xde")
+  assert mem.read( 0x1000, 4 ) == 0xdeadbeef
+  assert mem.read( 0x1002, 2 ) == 0xdead
+  assert mem.read( 0x1003, 1 ) == 0xde
+
+  mem.write( 0x1001, 2, 0x1234 )
+  mem.write( 0x1000, 1, 0x56 )
+  assert mem.read( 0x1000, 4 ) == 0xde123456
+
+  mem[0x2000] = 0xab
+  mem[0x2001:0x2003] = [ 0xcd, 0xef ]
+  assert mem.read( 0x2000, 4 ) == 0x00efcdab
+
+  assert sorted( mem.pages.keys() ) == [ 1, 2 ]
+
+#-------------------------------------------------------------------------
+# test_cross_page
+#-------------------------------------------------------------------------
+def test_cross_page():
+
+  mem = SparseMemory()
+
+  mem.write( PAGE_SIZE-2, 4, 0x01020304 )
+  assert mem.read( PAGE_SIZE-2, 4 ) == 0x01020304
+  assert mem[PAGE_SIZE-2:PAGE_SIZE+2] == bytearray("\x04\x03\x02\x01")
+
+  data = bytearray( i & 0xff for i in xrange( 3*PAGE_SIZE ) )
+  mem[100:100+len(data)] = data
+  assert mem[100:100+len(data)] == data
+
+#-------------------------------------------------------------------------
+# test_map
+#-------------------------------------------------------------------------
+def test_map():
+
+  mem = SparseMemory()
+
+  # Image covering one full page and part of two others
+
+  data = bytearray( i & 0xff for i in xrange( 2*PAGE_SIZE ) )
+  addr = PAGE_SIZE + PAGE_SIZE/2
+  mem.map( addr, data )
+
+  assert mem[addr:addr+len(data)] == data
+  assert sorted( mem.ro_pages.keys() ) == [ 2 ]
+  assert sorted( mem.pages.keys()    ) == [ 1, 3 ]
+
+  # Writing to a mapped page copies it and leaves the image untouched
+
+  mem.write( 2*PAGE_SIZE, 4, 0xffffffff )
+  assert mem.read( 2*PAGE_SIZE, 4 ) == 0xffffffff
+  assert data[PAGE_SIZE/2:PAGE_SIZE/2+4] == bytearray("\x00\x01\x02\x03")
+  assert mem.ro_pages == {}
+
+#-------------------------------------------------------------------------
+# test_errors
+#-------------------------------------------------------------------------
+def test_errors():
+
+  mem = SparseMemory( 0x2000 )
+
+  with pytest.raises( IndexError ):
+    mem[0x2000]
+  with pytest.raises( IndexError ):
+    mem.read( 0x1ffe, 4 )
+  with pytest.raises( IndexError ):
+    mem.write( 0x2000, 1, 0 )
+  with pytest.raises( IndexError ):
+    mem.map( 0x1f00, bytearray( 0x200 ) )
+  with pytest.raises( ValueError ):
+    mem[0:4] = bytearray( 2 )
@@ -6,6 +6,7 @@ from GreenletWrapper       import GreenletWrapper
 from ListBytesProxy        import ListBytesProxy
 from QueuePortProxy        import InQueuePortProxy,OutQueuePortProxy
 from Queue                 import Queue
+from SparseMemory          import SparseMemory
 from ListMemPortAdapter    import ListMemPortAdapter
 from ListMemPortAdapterOld import ListMemPortAdapterOld
 
@@ -17,7 +17,7 @@ import pclib.ifcs.mem_msgs as mem_msgs
 class TestMemory( Model ):
 
   def __init__( s, memreq_params, memresp_params, nports,
-                   max_mem_delay = 0, mem_nbytes=2**20 ):
+                   max_mem_delay = 0, mem_nbytes=2**20, sparse=False ):
 
     req_dtype  = memreq_params.nbits
     resp_dtype = memresp_params.nbits
@@ -37,7 +37,8 @@ class TestMemory( Model ):
 
     # simple test memory with no delays
 
-    s.mem = TestSimpleMemory(memreq_params, memresp_params, nports, mem_nbytes)
+    s.mem = TestSimpleMemory(memreq_params, memresp_params, nports, mem_nbytes,
+                             sparse)
 
     # Connect
 
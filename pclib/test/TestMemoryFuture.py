@@ -9,6 +9,7 @@ from pclib.ifcs import MemMsg, MemReqMsg, MemRespMsg
 from pclib.ifcs import InValRdyBundle, OutValRdyBundle
 from pclib.cl   import InValRdyRandStallAdapter
 from pclib.cl   import OutValRdyInelasticPipeAdapter
+from pclib.fl   import SparseMemory
 
 #-----------------------------------------------------------------------
 # TestMemory
@@ -22,7 +23,7 @@ class TestMemory( Model ):
   '''
 
   def __init__( s, mem_ifc_dtypes=MemMsg(32,32), nports=1,
-                stall_prob=0, latency=0, mem_nbytes=2**20 ):
+                stall_prob=0, latency=0, mem_nbytes=2**20, sparse=False ):
 
     # Interface
 
@@ -45,9 +46,13 @@ class TestMemory( Model ):
     for resp in s.resps:
       s.resps_q.append( OutValRdyInelasticPipeAdapter( resp, latency ) )
 
-    # Actual memory
+    # Actual memory, a sparse memory only allocates the pages which are
+    # actually loaded or written so mem_nbytes can be large
 
-    s.mem = bytearray( mem_nbytes )
+    if sparse:
+      s.mem = SparseMemory( mem_nbytes )
+    else:
+      s.mem = bytearray( mem_nbytes )
 
     # Local constants
 
@@ -89,9 +94,10 @@ class TestMemory( Model ):
 
             # Copy the bytes from the bytearray into read data bits
 
+            addr      = memreq.addr.uint()
             read_data = Bits( s.mem_ifc_dtypes.req.data.nbits )
             for j in range( nbytes ):
-              read_data[j*8:j*8+8] = s.mem[ memreq.addr + j ]
+              read_data[j*8:j*8+8] = s.mem[ addr + j ]
 
             # Create and enqueu response message
 
@@ -108,9 +114,10 @@ class TestMemory( Model ):
 
             # Copy write data bits into bytearray
 
-            write_data = memreq.data
+            addr       = memreq.addr.uint()
+            write_data = memreq.data.uint()
             for j in range( nbytes ):
-              s.mem[ memreq.addr + j ] = write_data[j*8:j*8+8].uint()
+              s.mem[ addr + j ] = ( write_data >> j*8 ) & 0xff
 
             # Create and enqueu response message
 
@@ -22,7 +22,7 @@ from pclib.ifcs       import MemMsg
 class TestHarness( Model ):
 
   def __init__( s, nports, src_msgs, sink_msgs, stall_prob, latency,
-                src_delay, sink_delay ):
+                src_delay, sink_delay, mem_nbytes=2**20, sparse=False ):
 
     # Messge type
 
@@ -34,7 +34,8 @@ class TestHarness( Model ):
     for i in range(nports):
       s.srcs.append( TestSource( mem_msgs.req, src_msgs[i], src_delay ) )
 
-    s.mem  = TestMemory( mem_msgs, nports, stall_prob, latency )
+    s.mem  = TestMemory( mem_msgs, nports, stall_prob, latency,
+                         mem_nbytes, sparse )
 
     s.sinks = []
     for i in range(nports):
@@ -241,7 +242,11 @@ def test_2port( test_params, dump_vcd ):
 # Test Read/Write Mem
 #-------------------------------------------------------------------------
 
-def test_read_write_mem( dump_vcd ):
+@pytest.mark.parametrize( "mem_nbytes,sparse", [
+  ( 2**20, False ),
+  ( 2**32, True  ),
+])
+def test_read_write_mem( dump_vcd, mem_nbytes, sparse ):
 
   rgen = random.Random()
   rgen.seed(0x05a3e95b)
@@ -264,7 +269,8 @@ def test_read_write_mem( dump_vcd ):
 
   # Create test harness with above memory messages
 
-  th = TestHarness( 1, [msgs[::2]], [msgs[1::2]], 0, 0, 0, 0 )
+  th = TestHarness( 1, [msgs[::2]], [msgs[1::2]], 0, 0, 0, 0,
+                    mem_nbytes, sparse )
 
   # Write the data into the test memory
 
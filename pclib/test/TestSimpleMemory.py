@@ -8,6 +8,7 @@ from __future__ import print_function
 
 from pymtl      import *
 from pclib.ifcs import InValRdyBundle, OutValRdyBundle
+from pclib.fl   import SparseMemory
 
 import pclib.ifcs.valrdy   as valrdy
 import pclib.ifcs.mem_msgs as mem_msgs
@@ -19,7 +20,7 @@ class TestSimpleMemory (Model):
   #-----------------------------------------------------------------------
 
   def __init__( s, memreq_params, memresp_params, nports,
-                mem_nbytes=2**20 ):
+                mem_nbytes=2**20, sparse=False ):
 
     # Local constant - store the number of ports
 
@@ -69,8 +70,12 @@ class TestSimpleMemory (Model):
 
     s.memreq_full = [ Wire(1) for _ in range( nports ) ]
 
-    # Actual memory
-    s.mem = bytearray( s.mem_nbytes )
+    # Actual memory, a sparse memory only allocates the pages which are
+    # actually loaded or written so mem_nbytes can be large
+    if sparse:
+      s.mem = SparseMemory( s.mem_nbytes )
+    else:
+      s.mem = bytearray( s.mem_nbytes )
 
     # Connect memreq_msg port list to Unpack port list
     for i in range( nports ):
@@ -129,9 +134,10 @@ class TestSimpleMemory (Model):
 
             # Copy the bytes from the bytearray into read data bits
 
+            addr      = s.memreq_addr[i].uint()
             read_data = Bits( s.memreq_params.data_nbits )
             for j in range( nbytes ):
-              read_data[j*8:j*8+8] = s.mem[ s.memreq_addr[i] + j ]
+              read_data[j*8:j*8+8] = s.mem[ addr + j ]
 
             # Create the response message
 
@@ -145,9 +151,10 @@ class TestSimpleMemory (Model):
 
             # Copy write data bits into bytearray
 
-            write_data = s.memreq_data[i]
+            addr       = s.memreq_addr[i].uint()
+            write_data = s.memreq_data[i].uint()
             for j in range( nbytes ):
-              s.mem[ s.memreq_addr[i] + j ] = write_data[j*8:j*8+8].uint()
+              s.mem[ addr + j ] = ( write_data >> j*8 ) & 0xff
 
             # Create the response message
 
@@ -44,9 +44,7 @@ class TestSrcSinkSim( object ):
     print()
 
     sim.reset()
-    while not self.model.done():
-      sim.print_line_trace()
-      sim.cycle()
+    sim.run( None, self.model.done, trace_every=1 )
 
     # Add a couple extra ticks so that the VCD dump is nicer
 
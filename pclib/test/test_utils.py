@@ -58,9 +58,7 @@ def run_sim( model, dump_vcd=None, test_verilog=False, max_cycles=5000 ):
 
   # Run simulation
 
-  while not model.done() and sim.ncycles < max_cycles:
-    sim.print_line_trace()
-    sim.cycle()
+  sim.run( max_cycles - sim.ncycles, model.done, trace_every=1 )
 
   # Force a test failure if we timed out
 
@@ -76,7 +74,8 @@ def run_sim( model, dump_vcd=None, test_verilog=False, max_cycles=5000 ):
 # run_test_vector_sim
 #-------------------------------------------------------------------------
 
-def run_test_vector_sim( model, test_vectors, dump_vcd=None, test_verilog=False ):
+def run_test_vector_sim( model, test_vectors, dump_vcd=None, test_verilog=False,
+                         batch=False ):
 
   # First row in test vectors contains port names
 
@@ -94,6 +93,14 @@ def run_test_vector_sim( model, test_vectors, dump_vcd=None, test_verilog=False
   model.vcd_file = dump_vcd
   if test_verilog:
     model = TranslationTool( model )
+
+    # Run all the test vectors with a single call into the verilated
+    # model, no line trace is printed
+
+    if batch:
+      run_test_vector_batch( model, port_names, test_vectors )
+      return
+
   model.elaborate()
 
   # Create a simulator
@@ -158,3 +165,36 @@ def run_test_vector_sim( model, test_vectors, dump_vcd=None, test_verilog=False
   sim.cycle()
   sim.cycle()
 
+#-------------------------------------------------------------------------
+# run_test_vector_batch
+#-------------------------------------------------------------------------
+
+def run_test_vector_batch( model, port_names, test_vectors ):
+
+  sim = VerilatorBatchSim( model )
+  sim.reset()
+
+  # Apply test inputs, all ports are named as in the test vectors
+
+  inputs = {}
+  for i, port_name in enumerate( port_names ):
+    if port_name[-1] != "*":
+      inputs[ port_name ] = [ row[i] for row in test_vectors ]
+
+  # Three extra cycles to make VCD easier to read
+
+  outputs = sim.run( inputs, len( test_vectors ) )
+  sim.run( {}, 3 )
+
+  # Check test outputs
+
+  nbits = dict( model._batch_outputs )
+  for i, port_name in enumerate( port_names ):
+    if port_name[-1] == "*":
+      name = port_name[0:-1]
+      for cycle, row in enumerate( test_vectors ):
+        ref_value = row[i]
+        if ( ref_value != '?' ):
+          out_value = Bits( nbits[ name ], outputs[ name ][ cycle ] )
+          assert out_value == ref_value, \
+            "{} in cycle {}".format( name, cycle )
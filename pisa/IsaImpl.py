@@ -75,45 +75,95 @@ class IsaImpl (object):
 
       self.disasm_field_funcs_dict[ inst_name ] = disasm_field_funcs
 
+    # Build the decode table
+
+    self._build_decode_table()
+
   #-----------------------------------------------------------------------
-  # decode_tmpl
+  # _build_decode_table
   #-----------------------------------------------------------------------
-  # For now this is O(n) where n is the number of instructions in the
-  # encoding table. Obviously, this is pretty slow. I am sure we can do
-  # better by creating some kind of tree-based data structure.
+  # Turn the encoding table into a two-level lookup table. The first
+  # level is indexed by the bits which every row of the encoding table
+  # masks (i.e., the major opcode). The rows sharing a major opcode are
+  # then indexed by the bits which all of those rows mask (e.g., the
+  # function field), leaving a short list of candidate rows which we
+  # check in encoding table order. This gives exactly the same result as
+  # a linear search over the whole encoding table.
 
-  def decode_tmpl( self, inst_bits ):
+  def _build_decode_table( self ):
 
+    rows = []
     for row in self.inst_encoding_table:
-
-      # Extract the columns from the row
-
       inst_tmpl    = row[0]
       opcode_mask  = row[1]
       opcode_match = row[2]
+      inst_name    = inst_tmpl.partition(' ')[0]
+      rows.append( ( opcode_mask, opcode_match, inst_tmpl, inst_name ) )
 
-      # If match, then return instruction name
+    # Bits masked by every row select the first level
 
-      if (inst_bits & opcode_mask) == opcode_match:
-        return inst_tmpl
+    major_mask = reduce( lambda x, y: x & y, [ row[0] for row in rows ],
+                         ( 1 << self.nbits ) - 1 )
 
-    # Illegal instruction
+    major_rows = {}
+    for row in rows:
+      major_rows.setdefault( row[1] & major_mask, [] ).append( row )
 
-    raise AssertionError( "Illegal instruction {}!".format( inst_bits ) )
+    # Bits masked by every row with the same major opcode select the
+    # second level
+
+    self.decode_major_mask = major_mask
+    self.decode_table      = {}
+
+    for major, candidates in major_rows.iteritems():
+
+      minor_mask = reduce( lambda x, y: x & y,
+                           [ row[0] for row in candidates ] ) & ~major_mask
+
+      minor_table = {}
+      for row in candidates:
+        minor_table.setdefault( row[1] & minor_mask, [] ).append( row )
+
+      self.decode_table[ major ] = \
+        ( minor_mask, { minor : tuple( rows ) for minor, rows
+                        in minor_table.iteritems() } )
 
   #-----------------------------------------------------------------------
-  # decode_name
+  # decode_row
   #-----------------------------------------------------------------------
+  # Return the ( opcode_mask, opcode_match, inst_tmpl, inst_name ) row of
+  # the decode table matching the given instruction.
 
-  def decode_inst_name( self, inst_bits ):
+  def decode_row( self, inst_bits ):
 
-    # Decode template
+    inst = int( inst_bits )
 
-    inst_tmpl = self.decode_tmpl( inst_bits )
+    try:
+      minor_mask, minor_table = \
+        self.decode_table[ inst & self.decode_major_mask ]
+      for row in minor_table[ inst & minor_mask ]:
+        if (inst & row[0]) == row[1]:
+          return row
+    except KeyError:
+      pass
 
-    # Extract instruction name
+    # Illegal instruction
+
+    raise AssertionError( "Illegal instruction {}!".format( inst_bits ) )
+
+  #-----------------------------------------------------------------------
+  # decode_tmpl
+  #-----------------------------------------------------------------------
+
+  def decode_tmpl( self, inst_bits ):
+    return self.decode_row( inst_bits )[2]
+
+  #-----------------------------------------------------------------------
+  # decode_name
+  #-----------------------------------------------------------------------
 
-    return inst_tmpl.partition(' ')[0]
+  def decode_inst_name( self, inst_bits ):
+    return self.decode_row( inst_bits )[3]
 
   #-----------------------------------------------------------------------
   # assemble_inst
@@ -156,13 +206,11 @@ class IsaImpl (object):
 
   def disassemble_inst( self, inst_bits ):
 
-    # Decode the instruction to find instruction template
-
-    inst_tmpl = self.decode_tmpl( inst_bits )
-
-    # Extract instruction name from asm template
+    # Decode the instruction to find instruction template and name
 
-    inst_name = inst_tmpl.partition(' ')[0]
+    row       = self.decode_row( inst_bits )
+    inst_tmpl = row[2]
+    inst_name = row[3]
 
     # Retrieve the list of disasm field functions for this instruction
 
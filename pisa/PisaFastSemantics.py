@@ -0,0 +1,533 @@
+#=========================================================================
+# PisaFastSemantics
+#=========================================================================
+# Alternative implementation of PisaSemantics for fast functional
+# simulation. Registers are stored in an array of unsigned 32-bit
+# integers, the PC is a plain integer, and memory is a SparseMemory which
+# is accessed with its integer read/write methods. All arithmetic is on
+# Python integers masked to 32 bits, so no Bits objects are created
+# except for values exchanged through the proc/mngr queues and status.
+#
+# The instruction handlers operate on PisaFastInst objects which hold
+# the decoded register specifiers and immediates as integers. Use
+# PisaSemantics (operating on Bits) when verifying against hardware
+# models.
+
+from array import array
+
+from pymtl         import Bits
+from PisaSemantics import PisaSemantics
+
+import pisa_encoding
+
+MASK = 0xffffffff
+SIGN = 0x80000000
+
+#-------------------------------------------------------------------------
+# Syntax Helpers
+#-------------------------------------------------------------------------
+
+def signed( value ):
+  return value - 0x100000000 if value & SIGN else value
+
+#=========================================================================
+# PisaFastInst
+#=========================================================================
+# Decoded instruction with integer fields. The imm field is the raw
+# 16-bit immediate, imm_sext is the immediate sign extended to 32 bits.
+
+class PisaFastInst (object):
+
+  __slots__ = ( 'bits', 'name', 'rs', 'rt', 'rd', 'imm', 'imm_sext',
+                'shamt', 'jtarg' )
+
+  def __init__( self, inst_bits ):
+
+    inst = int( inst_bits )
+
+    self.bits     = inst
+    self.name     = pisa_encoding.decode_inst_name( inst )
+    self.rs       = ( inst >> 21 ) & 0x1f
+    self.rt       = ( inst >> 16 ) & 0x1f
+    self.rd       = ( inst >> 11 ) & 0x1f
+    self.imm      = inst & 0xffff
+    self.imm_sext = self.imm | 0xffff0000 if inst & 0x8000 else self.imm
+    self.shamt    = ( inst >> 6 ) & 0x1f
+    self.jtarg    = inst & 0x3ffffff
+
+  def __str__( self ):
+    return pisa_encoding.disassemble_inst( Bits( 32, self.bits ) )
+
+#=========================================================================
+# PisaFastSemantics
+#=========================================================================
+
+class PisaFastSemantics (object):
+
+  IllegalInstruction = PisaSemantics.IllegalInstruction
+
+  #-----------------------------------------------------------------------
+  # Constructor
+  #-----------------------------------------------------------------------
+  # The memory must be a SparseMemory. If the invalidate attribute is
+  # set, it is called with the [start,stop) address range of every store.
+
+  def __init__( self, memory, mngr2proc_queue, proc2mngr_queue ):
+
+    self.M = memory
+
+    self.mngr2proc_queue = mngr2proc_queue
+    self.proc2mngr_queue = proc2mngr_queue
+
+    self.R = array( 'I', [0]*32 )
+
+    # Accelerator registers
+
+    self.xregs = array( 'I', [0]*32 )
+
+    self.invalidate = None
+
+    self.reset()
+
+  #-----------------------------------------------------------------------
+  # reset
+  #-----------------------------------------------------------------------
+
+  def reset( s ):
+
+    s.PC = 0x00000400
+    s.stats_en = False
+    s.status   = 0
+
+  #-----------------------------------------------------------------------
+  # fetch
+  #-----------------------------------------------------------------------
+
+  def fetch( s, pc ):
+    return PisaFastInst( s.M.read( pc, 4 ) )
+
+  #-----------------------------------------------------------------------
+  # Basic Instructions
+  #-----------------------------------------------------------------------
+
+  def execute_mfc0( s, inst ):
+
+    # CP0 register: mngr2proc
+    if inst.rd == 1:
+      bits = s.mngr2proc_queue.popleft()
+      s.mngr2proc_str = str(bits)
+      if inst.rt:
+        s.R[inst.rt] = int(bits) & MASK
+
+    # CPO register: coreid
+    elif inst.rd == 17:
+      if inst.rt:
+        s.R[inst.rt] = 0
+
+    else:
+      raise PisaSemantics.IllegalInstruction(
+        "Unrecognized CPO register ({}) for mfc0 at PC={}" \
+          .format(inst.rd,Bits(32,s.PC)) )
+
+    s.PC += 4
+
+  def execute_mtc0( s, inst ):
+
+    # CP0 register: status
+    if inst.rd == 1:
+      s.status = Bits( 32, s.R[inst.rt] )
+
+    # CP0 register: proc2mngr
+    elif inst.rd == 2:
+      bits = Bits( 32, s.R[inst.rt] )
+      s.proc2mngr_str = str(bits)
+      s.proc2mngr_queue.append( bits )
+
+    # CPO register: stats_en
+    elif inst.rd == 10:
+      s.stats_en = bool(s.R[inst.rt])
+
+    else:
+      raise PisaSemantics.IllegalInstruction(
+        "Unrecognized CPO register ({}) for mtc0 at PC={}" \
+          .format(inst.rd,Bits(32,s.PC)) )
+
+    s.PC += 4
+
+  def execute_nop( s, inst ):
+    s.PC += 4
+
+  #-----------------------------------------------------------------------
+  # Register-register arithmetic, logical, and comparison instructions
+  #-----------------------------------------------------------------------
+
+  def execute_addu( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = ( s.R[inst.rs] + s.R[inst.rt] ) & MASK
+    s.PC += 4
+
+  def execute_subu( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = ( s.R[inst.rs] - s.R[inst.rt] ) & MASK
+    s.PC += 4
+
+  def execute_and( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = s.R[inst.rs] & s.R[inst.rt]
+    s.PC += 4
+
+  def execute_or( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = s.R[inst.rs] | s.R[inst.rt]
+    s.PC += 4
+
+  def execute_xor( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = s.R[inst.rs] ^ s.R[inst.rt]
+    s.PC += 4
+
+  def execute_nor( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = ~( s.R[inst.rs] | s.R[inst.rt] ) & MASK
+    s.PC += 4
+
+  # Flipping the sign bit turns a signed comparison into an unsigned one
+
+  def execute_slt( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = ( s.R[inst.rs] ^ SIGN ) < ( s.R[inst.rt] ^ SIGN )
+    s.PC += 4
+
+  def execute_sltu( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = s.R[inst.rs] < s.R[inst.rt]
+    s.PC += 4
+
+  #-----------------------------------------------------------------------
+  # Register-immediate arithmetic, logical, and comparison instructions
+  #-----------------------------------------------------------------------
+
+  def execute_addiu( s, inst ):
+    if inst.rt:
+      s.R[inst.rt] = ( s.R[inst.rs] + inst.imm_sext ) & MASK
+    s.PC += 4
+
+  def execute_andi( s, inst ):
+    if inst.rt:
+      s.R[inst.rt] = s.R[inst.rs] & inst.imm
+    s.PC += 4
+
+  def execute_ori( s, inst ):
+    if inst.rt:
+      s.R[inst.rt] = s.R[inst.rs] | inst.imm
+    s.PC += 4
+
+  def execute_xori( s, inst ):
+    if inst.rt:
+      s.R[inst.rt] = s.R[inst.rs] ^ inst.imm
+    s.PC += 4
+
+  def execute_slti( s, inst ):
+    if inst.rt:
+      s.R[inst.rt] = ( s.R[inst.rs] ^ SIGN ) < ( inst.imm_sext ^ SIGN )
+    s.PC += 4
+
+  def execute_sltiu( s, inst ):
+    if inst.rt:
+      s.R[inst.rt] = s.R[inst.rs] < inst.imm_sext
+    s.PC += 4
+
+  #-----------------------------------------------------------------------
+  # Shift instructions
+  #-----------------------------------------------------------------------
+
+  def execute_sll( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = ( s.R[inst.rt] << inst.shamt ) & MASK
+    s.PC += 4
+
+  def execute_srl( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = s.R[inst.rt] >> inst.shamt
+    s.PC += 4
+
+  def execute_sra( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = ( signed( s.R[inst.rt] ) >> inst.shamt ) & MASK
+    s.PC += 4
+
+  def execute_sllv( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = ( s.R[inst.rt] << ( s.R[inst.rs] & 0x1f ) ) & MASK
+    s.PC += 4
+
+  def execute_srlv( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = s.R[inst.rt] >> ( s.R[inst.rs] & 0x1f )
+    s.PC += 4
+
+  def execute_srav( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = \
+        ( signed( s.R[inst.rt] ) >> ( s.R[inst.rs] & 0x1f ) ) & MASK
+    s.PC += 4
+
+  #-----------------------------------------------------------------------
+  # Other instructions
+  #-----------------------------------------------------------------------
+
+  def execute_lui( s, inst ):
+    if inst.rt:
+      s.R[inst.rt] = inst.imm << 16
+    s.PC += 4
+
+  #-----------------------------------------------------------------------
+  # Multiply/divide instructions
+  #-----------------------------------------------------------------------
+
+  def execute_mul( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = ( s.R[inst.rs] * s.R[inst.rt] ) & MASK
+    s.PC += 4
+
+  def execute_div( s, inst ):
+
+    # Round towards zero, see PisaSemantics.execute_div
+
+    a = signed( s.R[inst.rs] )
+    b = signed( s.R[inst.rt] )
+
+    A = -a if (a < 0) else a
+    B = -b if (b < 0) else b
+    c = -(A // B) if (a < 0) ^ (b < 0) else (A // B)
+
+    if inst.rd:
+      s.R[inst.rd] = c & MASK
+    s.PC += 4
+
+  def execute_divu( s, inst ):
+    c = s.R[inst.rs] // s.R[inst.rt]
+    if inst.rd:
+      s.R[inst.rd] = c
+    s.PC += 4
+
+  def execute_rem( s, inst ):
+
+    a = signed( s.R[inst.rs] )
+    b = signed( s.R[inst.rt] )
+
+    A = -a if (a < 0) else a
+    B = -b if (b < 0) else b
+    c = -(A % B) if (a < 0) else (A % B)
+
+    if inst.rd:
+      s.R[inst.rd] = c & MASK
+    s.PC += 4
+
+  def execute_remu( s, inst ):
+    c = s.R[inst.rs] % s.R[inst.rt]
+    if inst.rd:
+      s.R[inst.rd] = c
+    s.PC += 4
+
+  #-----------------------------------------------------------------------
+  # Load instructions
+  #-----------------------------------------------------------------------
+
+  def execute_lw( s, inst ):
+    addr  = ( s.R[inst.rs] + inst.imm_sext ) & MASK
+    value = s.M.read( addr, 4 )
+    if inst.rt:
+      s.R[inst.rt] = value
+    s.PC += 4
+
+  def execute_lh( s, inst ):
+    addr  = ( s.R[inst.rs] + inst.imm_sext ) & MASK
+    value = s.M.read( addr, 2 )
+    if inst.rt:
+      s.R[inst.rt] = value | 0xffff0000 if value & 0x8000 else value
+    s.PC += 4
+
+  def execute_lhu( s, inst ):
+    addr  = ( s.R[inst.rs] + inst.imm_sext ) & MASK
+    value = s.M.read( addr, 2 )
+    if inst.rt:
+      s.R[inst.rt] = value
+    s.PC += 4
+
+  def execute_lb( s, inst ):
+    addr  = ( s.R[inst.rs] + inst.imm_sext ) & MASK
+    value = s.M.read( addr, 1 )
+    if inst.rt:
+      s.R[inst.rt] = value | 0xffffff00 if value & 0x80 else value
+    s.PC += 4
+
+  def execute_lbu( s, inst ):
+    addr  = ( s.R[inst.rs] + inst.imm_sext ) & MASK
+    value = s.M.read( addr, 1 )
+    if inst.rt:
+      s.R[inst.rt] = value
+    s.PC += 4
+
+  #-----------------------------------------------------------------------
+  # Store instructions
+  #-----------------------------------------------------------------------
+
+  def execute_sw( s, inst ):
+    addr = ( s.R[inst.rs] + inst.imm_sext ) & MASK
+    s.M.write( addr, 4, s.R[inst.rt] )
+    if s.invalidate:
+      s.invalidate( addr, addr+4 )
+    s.PC += 4
+
+  def execute_sh( s, inst ):
+    addr = ( s.R[inst.rs] + inst.imm_sext ) & MASK
+    s.M.write( addr, 2, s.R[inst.rt] & 0xffff )
+    if s.invalidate:
+      s.invalidate( addr, addr+2 )
+    s.PC += 4
+
+  def execute_sb( s, inst ):
+    addr = ( s.R[inst.rs] + inst.imm_sext ) & MASK
+    s.M.write( addr, 1, s.R[inst.rt] & 0xff )
+    if s.invalidate:
+      s.invalidate( addr, addr+1 )
+    s.PC += 4
+
+  #-----------------------------------------------------------------------
+  # Unconditional jump instructions
+  #-----------------------------------------------------------------------
+
+  def execute_j( s, inst ):
+    s.PC = ( ( s.PC + 4 ) & 0xf0000000 ) | ( inst.jtarg << 2 )
+
+  def execute_jal( s, inst ):
+    s.R[31] = ( s.PC + 4 ) & MASK
+    s.PC = ( ( s.PC + 4 ) & 0xf0000000 ) | ( inst.jtarg << 2 )
+
+  def execute_jr( s, inst ):
+    s.PC = s.R[inst.rs]
+
+  def execute_jalr( s, inst ):
+    if inst.rd:
+      s.R[inst.rd] = ( s.PC + 4 ) & MASK
+    s.PC = s.R[inst.rs]
+
+  #-----------------------------------------------------------------------
+  # Conditional branch instructions
+  #-----------------------------------------------------------------------
+
+  def execute_beq( s, inst ):
+    if s.R[inst.rs] == s.R[inst.rt]:
+      s.PC = ( s.PC + 4 + ( inst.imm_sext << 2 ) ) & MASK
+    else:
+      s.PC += 4
+
+  def execute_bne( s, inst ):
+    if s.R[inst.rs] != s.R[inst.rt]:
+      s.PC = ( s.PC + 4 + ( inst.imm_sext << 2 ) ) & MASK
+    else:
+      s.PC += 4
+
+  def execute_blez( s, inst ):
+    if signed( s.R[inst.rs] ) <= 0:
+      s.PC = ( s.PC + 4 + ( inst.imm_sext << 2 ) ) & MASK
+    else:
+      s.PC += 4
+
+  def execute_bgtz( s, inst ):
+    if signed( s.R[inst.rs] ) > 0:
+      s.PC = ( s.PC + 4 + ( inst.imm_sext << 2 ) ) & MASK
+    else:
+      s.PC += 4
+
+  def execute_bltz( s, inst ):
+    if s.R[inst.rs] & SIGN:
+      s.PC = ( s.PC + 4 + ( inst.imm_sext << 2 ) ) & MASK
+    else:
+      s.PC += 4
+
+  def execute_bgez( s, inst ):
+    if not s.R[inst.rs] & SIGN:
+      s.PC = ( s.PC + 4 + ( inst.imm_sext << 2 ) ) & MASK
+    else:
+      s.PC += 4
+
+  #-----------------------------------------------------------------------
+  # Accelerator instructions
+  #-----------------------------------------------------------------------
+
+  def execute_mtx( s, inst ):
+    s.xregs[inst.rs] = s.R[inst.rt]
+    s.PC += 4
+
+  def execute_mfx( s, inst ):
+    if inst.rt:
+      s.R[inst.rt] = s.xregs[inst.rs]
+    s.PC += 4
+
+  #-----------------------------------------------------------------------
+  # exec
+  #-----------------------------------------------------------------------
+
+  execute_dispatch = {
+
+    'mfc0'  : execute_mfc0,
+    'mtc0'  : execute_mtc0,
+    'nop'   : execute_nop,
+    'addu'  : execute_addu,
+    'subu'  : execute_subu,
+    'and'   : execute_and,
+    'or'    : execute_or,
+    'xor'   : execute_xor,
+    'nor'   : execute_nor,
+    'slt'   : execute_slt,
+
+    'sltu'  : execute_sltu,
+    'addiu' : execute_addiu,
+    'andi'  : execute_andi,
+    'ori'   : execute_ori,
+    'xori'  : execute_xori,
+    'slti'  : execute_slti,
+    'sltiu' : execute_sltiu,
+    'sll'   : execute_sll,
+    'srl'   : execute_srl,
+    'sra'   : execute_sra,
+
+    'sllv'  : execute_sllv,
+    'srlv'  : execute_srlv,
+    'srav'  : execute_srav,
+    'lui'   : execute_lui,
+    'mul'   : execute_mul,
+    'div'   : execute_div,
+    'divu'  : execute_divu,
+    'rem'   : execute_rem,
+    'remu'  : execute_remu,
+    'lw'    : execute_lw,
+
+    'lh'    : execute_lh,
+    'lhu'   : execute_lhu,
+    'lb'    : execute_lb,
+    'lbu'   : execute_lbu,
+    'sw'    : execute_sw,
+    'sh'    : execute_sh,
+    'sb'    : execute_sb,
+    'j'     : execute_j,
+    'jal'   : execute_jal,
+    'jr'    : execute_jr,
+
+    'jalr'  : execute_jalr,
+    'beq'   : execute_beq,
+    'bne'   : execute_bne,
+    'blez'  : execute_blez,
+    'bgtz'  : execute_bgtz,
+    'bltz'  : execute_bltz,
+    'bgez'  : execute_bgez,
+
+    'mtx'   : execute_mtx,
+    'mfx'   : execute_mfx,
+
+  }
+
+  def execute( self, inst ):
+    self.execute_dispatch[inst.name]( self, inst )
@@ -9,52 +9,37 @@
 
 import pisa_encoding
 
-from pymtl import Bits
+from pymtl import Bits, frozen_bits
 
 class PisaInst (object):
 
-  #-----------------------------------------------------------------------
-  # Constructor
-  #-----------------------------------------------------------------------
-
-  def __init__( self, inst_bits ):
-    self.bits = Bits( 32, inst_bits )
-
-  #-----------------------------------------------------------------------
-  # Get instruction name
-  #-----------------------------------------------------------------------
+  # The instruction is decoded once when it is constructed. The name and
+  # fields are stored as plain attributes so accessing them (e.g., in the
+  # execute dispatch of the processor models) does not re-decode the
+  # instruction. Fields are read-only, so they are shared values from the
+  # frozen Bits cache rather than new slices of the instruction bits.
 
-  @property
-  def name( self ):
-    return pisa_encoding.decode_inst_name( self.bits )
+  __slots__ = ( 'bits', 'name', 'rs', 'rt', 'rd', 'imm', 'shamt', 'jtarg' )
 
   #-----------------------------------------------------------------------
-  # Get fields
+  # Constructor
   #-----------------------------------------------------------------------
 
-  @property
-  def rs( self ):
-    return self.bits[ pisa_encoding.pisa_field_slice_rs ]
-
-  @property
-  def rt( self ):
-    return self.bits[ pisa_encoding.pisa_field_slice_rt ]
+  def __init__( self, inst_bits ):
 
-  @property
-  def rd( self ):
-    return self.bits[ pisa_encoding.pisa_field_slice_rd ]
+    self.bits = bits = Bits( 32, inst_bits )
+    self.name = pisa_encoding.decode_inst_name( bits )
 
-  @property
-  def imm( self ):
-    return self.bits[ pisa_encoding.pisa_field_slice_imm ]
+    # Get fields
 
-  @property
-  def shamt( self ):
-    return self.bits[ pisa_encoding.pisa_field_slice_shamt ]
+    inst = bits.uint()
 
-  @property
-  def jtarg( self ):
-    return self.bits[ pisa_encoding.pisa_field_slice_jtarg ]
+    self.rs    = _field( inst, pisa_encoding.pisa_field_slice_rs    )
+    self.rt    = _field( inst, pisa_encoding.pisa_field_slice_rt    )
+    self.rd    = _field( inst, pisa_encoding.pisa_field_slice_rd    )
+    self.imm   = _field( inst, pisa_encoding.pisa_field_slice_imm   )
+    self.shamt = _field( inst, pisa_encoding.pisa_field_slice_shamt )
+    self.jtarg = _field( inst, pisa_encoding.pisa_field_slice_jtarg )
 
   #-----------------------------------------------------------------------
   # to string
@@ -63,3 +48,12 @@ class PisaInst (object):
   def __str__( self ):
     return pisa_encoding.disassemble_inst( self.bits )
 
+#-------------------------------------------------------------------------
+# _field
+#-------------------------------------------------------------------------
+# Extract the given field slice of an instruction as a frozen Bits.
+
+def _field( inst, field_slice ):
+  start = field_slice.start
+  nbits = field_slice.stop - start
+  return frozen_bits( nbits, ( inst >> start ) & ( ( 1 << nbits ) - 1 ) )
@@ -55,3 +55,26 @@ def test_fields_jtarg():
   assert inst.name  == "j"
   assert inst.jtarg == 0x00404
 
+
+#-------------------------------------------------------------------------
+# test_fields_shared
+#-------------------------------------------------------------------------
+
+def test_fields_shared():
+
+  inst0 = PisaInst( assemble_inst( {}, 0, "addu r1, r2, r3" ) )
+  inst1 = PisaInst( assemble_inst( {}, 0, "subu r3, r2, r1" ) )
+  assert inst0.rs is inst1.rs
+  assert inst0.rd is inst1.rt
+
+  with pytest.raises( TypeError ):
+    inst0.rd.value = 4
+
+#-------------------------------------------------------------------------
+# test_illegal
+#-------------------------------------------------------------------------
+
+def test_illegal():
+
+  with pytest.raises( AssertionError ):
+    PisaInst( 0xffffffff )
@@ -75,6 +75,13 @@ class PisaSemantics (object):
     s.stats_en = False
     s.status   = 0
 
+  #-----------------------------------------------------------------------
+  # fetch
+  #-----------------------------------------------------------------------
+
+  def fetch( s, pc ):
+    return PisaInst( s.M[ pc : pc+4 ] )
+
   #-----------------------------------------------------------------------
   # Basic Instructions
   #-----------------------------------------------------------------------
@@ -9,12 +9,13 @@
 from __future__ import print_function
 
 import collections
+import functools
 import struct
 
 from pymtl         import Bits
-from pclib.fl      import Bytes
-from PisaInst      import PisaInst
-from PisaSemantics import PisaSemantics
+from pclib.fl      import Bytes, SparseMemory
+from PisaSemantics     import PisaSemantics
+from PisaFastSemantics import PisaFastSemantics
 
 class PisaSim (object):
 
@@ -22,7 +23,8 @@ class PisaSim (object):
   # Constructor
   #-----------------------------------------------------------------------
 
-  def __init__( self, test_en=True, trace_en=False ):
+  def __init__( self, test_en=True, trace_en=False, block_cache=False,
+                fast=False ):
 
     # If test mode is enabled, the the simulator assumes we will load the
     # reference output using a proc2mngr section in the sparse memory
@@ -41,26 +43,53 @@ class PisaSim (object):
 
     self.trace_en = trace_en
 
+    # If block caching is enabled (and tracing is not) then straight-line
+    # runs of instructions are decoded once into basic blocks which are
+    # cached by start PC (see _run_blocks).
+
+    self.block_cache = block_cache
+    self.blocks      = {}   # start pc -> ( handlers, last pc )
+    self.block_words = {}   # word address -> set of start pcs
+
     # Stats
 
     self.num_total_inst = 0
     self.num_inst = 0
 
-    # Create the memory. For now we hard code the memory size to 1MB.
-
-    self.mem = Bytes(2**20)
-
     # Create the proc/mngr queues
 
     self.mngr2proc_queue     = collections.deque()
     self.proc2mngr_queue     = collections.deque()
     self.proc2mngr_ref_queue = collections.deque()
 
-    # Construct the ISA semantics object
+    # Create the memory and the ISA semantics object. The memory covers
+    # the whole 32-bit address space, but pages are only allocated when
+    # they are written (see SparseMemory). In fast mode registers and
+    # memory are accessed as plain integers (see PisaFastSemantics),
+    # otherwise as Bits. With block caching, stores to memory must
+    # invalidate any cached blocks containing the written words.
+
+    if fast:
+
+      self.mem = self.sparse_mem = SparseMemory( 2**32 )
+      self.isa = PisaFastSemantics( self.mem,
+                                    self.mngr2proc_queue,
+                                    self.proc2mngr_queue )
+      if block_cache:
+        self.isa.invalidate = self._invalidate_blocks
+
+    else:
+
+      if block_cache:
+        self.mem = _CodeBytes( 2**32, self._invalidate_blocks )
+      else:
+        self.mem = Bytes( 2**32, sparse=True )
+
+      self.sparse_mem = self.mem.mem
 
-    self.isa = PisaSemantics( self.mem,
-                              self.mngr2proc_queue,
-                              self.proc2mngr_queue )
+      self.isa = PisaSemantics( self.mem,
+                                self.mngr2proc_queue,
+                                self.proc2mngr_queue )
 
   #-----------------------------------------------------------------------
   # reset
@@ -68,8 +97,7 @@ class PisaSim (object):
 
   def reset( self ):
 
-    self.isa.PC         = Bits( 32, 0x0000400 )
-    self.isa.status     = 0
+    self.isa.reset()
 
     self.status         = 0
     self.num_total_inst = 0
@@ -81,6 +109,11 @@ class PisaSim (object):
 
   def load( self, mem_image ):
 
+    # Discard any blocks decoded from the previous program
+
+    self.blocks.clear()
+    self.block_words.clear()
+
     # Iterate over the sections
 
     sections = mem_image.get_sections()
@@ -100,12 +133,11 @@ class PisaSim (object):
           bits = struct.unpack_from("<I",buffer(section.data,i,4))[0]
           self.proc2mngr_ref_queue.append( Bits(32,bits) )
 
-      # For all other sections, simply copy them into the memory
+      # For all other sections, map them into the memory. The section
+      # data is only copied when it is written.
 
       else:
-        start_addr = section.addr
-        stop_addr  = section.addr + len(section.data)
-        self.mem[start_addr:stop_addr] = section.data
+        self.sparse_mem.map( section.addr, section.data )
 
   #-----------------------------------------------------------------------
   # run
@@ -113,6 +145,9 @@ class PisaSim (object):
 
   def run( self ):
 
+    if self.block_cache and not self.trace_en:
+      return self._run_blocks()
+
     try:
 
       # Keep running as long as there are values in the proc2mngr queue
@@ -132,8 +167,8 @@ class PisaSim (object):
 
         # Fetch instruction
 
-        pc = self.isa.PC.uint()
-        inst = PisaInst( self.mem[ pc : pc+4 ] )
+        pc = int( self.isa.PC )
+        inst = self.isa.fetch( pc )
 
         # Save some state for tracing
 
@@ -171,3 +206,155 @@ class PisaSim (object):
       print( "Unexpected error at PC={:0>8x}!".format(pc) )
       raise
 
+
+  #-----------------------------------------------------------------------
+  # _run_blocks
+  #-----------------------------------------------------------------------
+  # Same as run but executing a cached basic block at a time. Blocks end
+  # with any instruction after which run needs to look at the processor
+  # state (control flow, mtc0 which can write status, proc2mngr and
+  # stats_en) or which can modify code (stores). So we only need to check
+  # the proc2mngr queue and status once per block, and a store can never
+  # invalidate an instruction we are about to execute from the current
+  # block.
+
+  def _run_blocks( self ):
+
+    isa    = self.isa
+    blocks = self.blocks
+
+    pc = 0
+    try:
+
+      done = False
+      while not done:
+
+        # Fetch block
+
+        pc = int( isa.PC )
+        try:
+          handlers, last_pc = blocks[ pc ]
+        except KeyError:
+          handlers, last_pc = self._decode_block( pc )
+
+        # Update instruction counts, stats_en can only change at the end
+        # of a block
+
+        self.num_total_inst += len( handlers )
+        if isa.stats_en:
+          self.num_inst += len( handlers )
+
+        # Execute block, if an instruction fails the PC has not been
+        # updated yet so it is the PC of that instruction
+
+        try:
+          for execute in handlers:
+            execute()
+        except:
+          pc = int( isa.PC )
+          raise
+
+        pc = last_pc
+
+        # Check the proc2mngr queue
+
+        if self.test_en:
+          if self.proc2mngr_queue:
+            assert self.proc2mngr_queue[0] == self.proc2mngr_ref_queue[0]
+            self.proc2mngr_queue.popleft()
+            self.proc2mngr_ref_queue.popleft()
+            done = not bool(self.proc2mngr_ref_queue)
+        else:
+          if isa.status != 0:
+            self.status = isa.status
+            done = True
+
+    except:
+      print( "Unexpected error at PC={:0>8x}!".format(pc) )
+      raise
+
+  #-----------------------------------------------------------------------
+  # _decode_block
+  #-----------------------------------------------------------------------
+  # Decode the basic block starting at the given PC and add it to the
+  # block cache. Each instruction becomes a handler with the semantics
+  # object and the decoded instruction already bound.
+
+  def _decode_block( self, start_pc ):
+
+    execute_dispatch = self.isa.execute_dispatch
+
+    handlers = []
+    pc = start_pc
+    while len( handlers ) < MAX_BLOCK_INSTS:
+
+      # Stop before an illegal instruction (e.g., data following the
+      # code) so it is only reported if we actually try to execute it
+
+      try:
+        inst = self.isa.fetch( pc )
+      except AssertionError:
+        if not handlers:
+          raise
+        break
+
+      handlers.append( functools.partial( execute_dispatch[ inst.name ],
+                                          self.isa, inst ) )
+      self.block_words.setdefault( pc >> 2, set() ).add( start_pc )
+      pc += 4
+
+      if inst.name in block_end_insts:
+        break
+
+    block = ( tuple( handlers ), pc - 4 )
+    self.blocks[ start_pc ] = block
+    return block
+
+  #-----------------------------------------------------------------------
+  # _invalidate_blocks
+  #-----------------------------------------------------------------------
+  # Called whenever memory in [start_addr,stop_addr) is written, drops
+  # all cached blocks which include any of those words.
+
+  def _invalidate_blocks( self, start_addr, stop_addr ):
+
+    block_words = self.block_words
+    if not block_words:
+      return
+
+    for word in xrange( start_addr >> 2, ( stop_addr + 3 ) >> 2 ):
+      for start_pc in block_words.pop( word, () ):
+        self.blocks.pop( start_pc, None )
+
+#-------------------------------------------------------------------------
+# Block parameters
+#-------------------------------------------------------------------------
+
+MAX_BLOCK_INSTS = 64
+
+block_end_insts = set([
+  'mtc0', 'sw', 'sh', 'sb',
+  'j', 'jal', 'jr', 'jalr',
+  'beq', 'bne', 'blez', 'bgtz', 'bltz', 'bgez',
+])
+
+#-------------------------------------------------------------------------
+# _CodeBytes
+#-------------------------------------------------------------------------
+# Bytes which notify the simulator of every write so it can invalidate
+# cached blocks.
+
+class _CodeBytes (Bytes):
+
+  def __init__( self, size, invalidate ):
+    Bytes.__init__( self, size, sparse=True )
+    self.invalidate = invalidate
+
+  def __setitem__( self, key, value ):
+
+    Bytes.__setitem__( self, key, value )
+
+    if isinstance( key, slice ):
+      self.invalidate( int(key.start), int(key.stop) )
+    else:
+      self.invalidate( int(key), int(key)+1 )
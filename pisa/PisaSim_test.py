@@ -2,6 +2,12 @@
 # PisaSim_test.py
 #=========================================================================
 
+import glob
+import importlib
+import inspect
+import os
+import pytest
+
 from PisaSim import PisaSim
 import pisa_encoding
 
@@ -37,3 +43,97 @@ def test_fields_reg():
   sim.load( mem_image )
   sim.run()
 
+
+#-------------------------------------------------------------------------
+# test_modes
+#-------------------------------------------------------------------------
+# Run all of the instruction tests with the block cache and/or the fast
+# (integer-based) semantics enabled. Tracing disables the block cache,
+# so we leave it off.
+
+def gen_inst_tests():
+  inst_tests = []
+  test_dir = os.path.dirname( os.path.abspath( __file__ ) )
+  package  = __name__.rpartition('.')[0]
+  for path in sorted( glob.glob( os.path.join( test_dir, "pisa_inst_*_test.py" ) ) ):
+    module_name = os.path.basename( path )[:-3]
+    if package:
+      module_name = package + "." + module_name
+    module = importlib.import_module( module_name )
+    for name, func in sorted( inspect.getmembers( module, inspect.isfunction ) ):
+      if name.startswith("gen_") and name.endswith("_test") \
+         and func.__module__ == module.__name__:
+        inst_tests.append( ( module.__name__.rpartition('.')[2] + "." + name, func ) )
+  return inst_tests
+
+sim_modes = [
+  dict( block_cache=True  ),
+  dict( fast=True ),
+  dict( fast=True, block_cache=True ),
+]
+
+@pytest.mark.parametrize( "name,test", gen_inst_tests() )
+@pytest.mark.parametrize( "mode", sim_modes, ids=[
+  "+".join( sorted( mode ) ) for mode in sim_modes ] )
+def test_modes( name, test, mode ):
+  sim = PisaSim( **mode )
+  sim.load( pisa_encoding.assemble( test() ) )
+  sim.run()
+
+def test_fast_trace():
+  import pisa_inst_lw_test
+  sim = PisaSim( trace_en=True, fast=True )
+  sim.load( pisa_encoding.assemble( pisa_inst_lw_test.gen_basic_test() ) )
+  sim.run()
+
+#-------------------------------------------------------------------------
+# test_block_cache_stats
+#-------------------------------------------------------------------------
+# Instruction counts must match executing one instruction at a time.
+
+def test_block_cache_stats():
+
+  import pisa_inst_bne_test
+
+  mem_image = pisa_encoding.assemble( pisa_inst_bne_test.gen_random_test() )
+
+  sims = [ PisaSim() ] + [ PisaSim( **mode ) for mode in sim_modes ]
+  for sim in sims:
+    sim.load( mem_image )
+    sim.run()
+
+  for sim in sims[1:]:
+    assert sim.num_total_inst == sims[0].num_total_inst
+    assert sim.num_inst       == sims[0].num_inst
+
+#-------------------------------------------------------------------------
+# test_block_cache_self_modifying
+#-------------------------------------------------------------------------
+# The loop overwrites its first instruction, so the cached block for the
+# loop has to be invalidated and decoded again.
+
+def test_block_cache_self_modifying():
+
+  new_inst = pisa_encoding.assemble_inst( {}, 0, "addiu r3, r0, 2" )
+
+  mem_image = pisa_encoding.assemble(
+  """
+    mfc0  r1, mngr2proc < 0x00000410
+    mfc0  r2, mngr2proc < {}
+    addiu r4, r0, 2
+    j     loop
+  loop:
+    addiu r3, r0, 1
+    mtc0  r3, proc2mngr > 1
+    sw    r2, 0(r1)
+    addiu r4, r4, -1
+    bne   r4, r0, loop
+    mtc0  r3, proc2mngr > 2
+    nop
+    nop
+  """.format( new_inst.uint() ) )
+
+  for mode in [ {} ] + sim_modes:
+    sim = PisaSim( **mode )
+    sim.load( mem_image )
+    sim.run()
@@ -12,6 +12,7 @@ import pisa_inst_test_utils
 from IsaImpl            import IsaImpl
 from PisaInst           import PisaInst
 from PisaSemantics      import PisaSemantics
+from PisaFastSemantics  import PisaFastSemantics
 from PisaSim            import PisaSim
 from SparseMemoryImage  import SparseMemoryImage
 
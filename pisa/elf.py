@@ -21,6 +21,7 @@
 # Author : Christopher Batten
 # Date   : May 20, 2014
 
+import mmap
 import struct
 
 from SparseMemoryImage import SparseMemoryImage
@@ -402,9 +403,46 @@ class ElfSymTabEntry (object):
 
 def elf_reader( file_obj ):
 
+  def read( offset, size ):
+    file_obj.seek( offset )
+    return file_obj.read( size )
+
+  return _elf_parse( read, read )
+
+#-------------------------------------------------------------------------
+# elf_mmap_reader
+#-------------------------------------------------------------------------
+# Same as elf_reader, except that the file is memory mapped and the data
+# of each section is a read-only buffer into the mapping instead of a
+# copy. Only the pages of the file which are actually accessed are read,
+# and simulators loading the same ELF file share the same physical
+# memory. The mapping stays alive as long as any section data does, even
+# if file_obj is closed.
+
+def elf_mmap_reader( file_obj ):
+
+  file_map = mmap.mmap( file_obj.fileno(), 0, access=mmap.ACCESS_READ )
+
+  def read( offset, size ):
+    return file_map[ offset : offset + size ]
+
+  def read_data( offset, size ):
+    return buffer( file_map, offset, size )
+
+  return _elf_parse( read, read_data )
+
+#-------------------------------------------------------------------------
+# _elf_parse
+#-------------------------------------------------------------------------
+# Parse an ELF file into a sparse memory image object. The read function
+# returns a string with size bytes of the file starting at offset, and
+# the read_data function does the same for the data of each section.
+
+def _elf_parse( read, read_data ):
+
   # Read the data for the ELF header
 
-  ehdr_data = file_obj.read( ElfHeader.NBYTES )
+  ehdr_data = read( 0, ElfHeader.NBYTES )
 
   # Construct an ELF header object
 
@@ -420,8 +458,8 @@ def elf_reader( file_obj ):
   # string table is entry shstrndx, so we first get the data for this
   # section header.
 
-  file_obj.seek( ehdr.shoff + ehdr.shstrndx * ehdr.shentsize )
-  shdr_data = file_obj.read(ehdr.shentsize)
+  shdr_data = read( ehdr.shoff + ehdr.shstrndx * ehdr.shentsize,
+                    ehdr.shentsize )
 
   # Construct a section header object for the section string table
 
@@ -429,8 +467,7 @@ def elf_reader( file_obj ):
 
   # Read the data for the section header table
 
-  file_obj.seek( shdr.offset )
-  shstrtab_data = file_obj.read( shdr.size )
+  shstrtab_data = read( shdr.offset, shdr.size )
 
   # Load sections
 
@@ -443,8 +480,8 @@ def elf_reader( file_obj ):
 
     # Read the data for the section header
 
-    file_obj.seek( ehdr.shoff + section_idx * ehdr.shentsize )
-    shdr_data = file_obj.read(ehdr.shentsize)
+    shdr_data = read( ehdr.shoff + section_idx * ehdr.shentsize,
+                      ehdr.shentsize )
 
     # Pad the returned string in case the section header is not long
     # enough (otherwise the unpack function would not work)
@@ -488,8 +525,7 @@ def elf_reader( file_obj ):
 
     # Read the section data
 
-    file_obj.seek( shdr.offset )
-    data = file_obj.read( shdr.size )
+    data = read_data( shdr.offset, shdr.size )
 
     # Save the data holding the symbol string table
 
@@ -51,3 +51,43 @@ def test_basic( tmpdir ):
 
   assert mem_image == mem_image_test
 
+
+#-------------------------------------------------------------------------
+# test_mmap
+#-------------------------------------------------------------------------
+
+def test_mmap( tmpdir ):
+
+  # Create a sparse memory image with a section spanning several pages
+
+  mem_image = SparseMemoryImage()
+
+  data_bytes = bytearray( random.randint(0,255) for r in xrange(0x2345) )
+  mem_image.add_section( ".text", 0x00001000, data_bytes )
+  mem_image.add_section( ".data", 0x00010000, bytearray("\x01\x02\x03\x04") )
+
+  with tmpdir.join("elf-test").open('wb') as file_obj:
+    elf.elf_writer( mem_image, file_obj )
+
+  # Read the ELF file back using both readers
+
+  with tmpdir.join("elf-test").open('rb') as file_obj:
+    mem_image_read = elf.elf_reader( file_obj )
+
+  with tmpdir.join("elf-test").open('rb') as file_obj:
+    mem_image_mmap = elf.elf_mmap_reader( file_obj )
+
+  # Section data refers directly to the file and outlives file_obj
+
+  assert isinstance( mem_image_mmap.get_section(".text").data, buffer )
+
+  # Buffers only compare equal to buffers or bytearrays, not to the
+  # strings returned by elf_reader
+
+  assert mem_image_mmap == mem_image
+
+  for section_read, section_mmap in zip( mem_image_read.get_sections(),
+                                         mem_image_mmap.get_sections() ):
+    assert section_read.name == section_mmap.name
+    assert section_read.addr == section_mmap.addr
+    assert section_read.data == str( section_mmap.data )
@@ -524,88 +524,14 @@ def assemble( asm_code ):
 def disassemble_inst( inst_bits ):
   return pisa_isa_impl.disassemble_inst( inst_bits )
 
-def decode_inst_name( inst ):
-
-  # Originally I was just using this:
-  #
-  #  return pisa_isa_impl.decode_inst_name( inst_bits )
-  #
-  # which basically just does a linear search in the encoding table to
-  # find a match. Eventually, I think we should figure out a way to
-  # automatically turn the encoding table into some kind of fast
-  # tree-bsaed search, but for now we just explicitly create a big case
-  # statement to do the instruction name decode.
-
-  # Short names
-
-  op   = pisa_field_slice_opcode
-  func = pisa_field_slice_func
-  rt   = pisa_field_slice_rt
-  rs   = pisa_field_slice_rs
-  rd   = pisa_field_slice_rd
-
-  inst_name = ""
-
-  if     inst       == 0:        inst_name = "nop"    #  2,
-  elif   inst[op]   == 0b001001: inst_name = "addiu"  # 11,
-  elif   inst[op]   == 0b001101: inst_name = "ori"    # 13,
-  elif   inst[op]   == 0b001111: inst_name = "lui"    # 23,
-  elif   inst[op]   == 0b100011: inst_name = "lw"     # 29,
-  elif   inst[op]   == 0b101011: inst_name = "sw"     # 34,
-  elif   inst[op]   == 0b000011: inst_name = "jal"    # 38,
-  elif   inst[op]   == 0b000101: inst_name = "bne"    # 42,
-  elif   inst[op]   == 0b010000:                      #
-    if   inst[rs]   == 0b00100:  inst_name = "mtc0"   #  1,
-    elif inst[rs]   == 0b00000:  inst_name = "mfc0"   #  0,
-  elif   inst[op]   == 0b010010:                      #
-    if   inst[rd]   == 0b00000:  inst_name = "mtx"    # 47,
-    if   inst[rd]   == 0b00001:  inst_name = "mfx"    # 48,
-  elif   inst[op]   == 0b000000:                      #
-    if   inst[func] == 0b100001: inst_name = "addu"   #  3,
-    elif inst[func] == 0b001000: inst_name = "jr"     # 39,
-    elif inst[func] == 0b000000: inst_name = "sll"    # 17,
-    elif inst[func] == 0b000010: inst_name = "srl"    # 18,
-    elif inst[func] == 0b000011: inst_name = "sra"    # 19,
-    elif inst[func] == 0b000100: inst_name = "sllv"   # 20,
-    elif inst[func] == 0b000110: inst_name = "srlv"   # 21,
-    elif inst[func] == 0b000111: inst_name = "srav"   # 22,
-    elif inst[func] == 0b100011: inst_name = "subu"   #  4,
-    elif inst[func] == 0b100100: inst_name = "and"    #  5,
-    elif inst[func] == 0b100101: inst_name = "or"     #  6,
-    elif inst[func] == 0b100110: inst_name = "xor"    #  7,
-    elif inst[func] == 0b100111: inst_name = "nor"    #  8,
-    elif inst[func] == 0b101010: inst_name = "slt"    #  9,
-    elif inst[func] == 0b101011: inst_name = "sltu"   # 10,
-    elif inst[func] == 0b001001: inst_name = "jalr"   # 40,
-  elif   inst[op]   == 0b001100: inst_name = "andi"   # 12,
-  elif   inst[op]   == 0b001110: inst_name = "xori"   # 14,
-  elif   inst[op]   == 0b001010: inst_name = "slti"   # 15,
-  elif   inst[op]   == 0b001011: inst_name = "sltiu"  # 16,
-  elif   inst[op]   == 0b011100: inst_name = "mul"    # 24,
-  elif   inst[op]   == 0b100111:                      #
-    if   inst[func] == 0b000101: inst_name = "div"    # 25,
-    elif inst[func] == 0b000111: inst_name = "divu"   # 26,
-    elif inst[func] == 0b000110: inst_name = "rem"    # 27,
-    elif inst[func] == 0b001000: inst_name = "remu"   # 28,
-  elif   inst[op]   == 0b100001: inst_name = "lh"     # 30,
-  elif   inst[op]   == 0b100101: inst_name = "lhu"    # 31,
-  elif   inst[op]   == 0b100000: inst_name = "lb"     # 32,
-  elif   inst[op]   == 0b100100: inst_name = "lbu"    # 33,
-  elif   inst[op]   == 0b101001: inst_name = "sh"     # 35,
-  elif   inst[op]   == 0b101000: inst_name = "sb"     # 36,
-  elif   inst[op]   == 0b000010: inst_name = "j"      # 37,
-  elif   inst[op]   == 0b000011: inst_name = "jal"    # 38,
-  elif   inst[op]   == 0b000100: inst_name = "beq"    # 41,
-  elif   inst[op]   == 0b000110: inst_name = "blez"   # 43,
-  elif   inst[op]   == 0b000111: inst_name = "bgtz"   # 44,
-  elif   inst[op]   == 0b000001:                      #
-    if   inst[rt]   == 0b00000:  inst_name = "bltz"   # 45,
-    elif inst[rt]   == 0b00001:  inst_name = "bgez"   # 46,
-
-  if inst_name == "":
-    raise AssertionError( "Illegal instruction {}!".format(inst) )
-
-  return inst_name
+def decode_inst_name( inst_bits ):
+
+  # This used to be an explicit case statement on the opcode and function
+  # fields since the encoding table was searched linearly. IsaImpl now
+  # turns the encoding table into a two-level lookup table, so we can
+  # just use that.
+
+  return pisa_isa_impl.decode_inst_name( inst_bits )
 
 def disassemble( mem_image ):
 
@@ -6,6 +6,7 @@
 
 import pisa_encoding
 import pytest
+import random
 import struct
 
 from SparseMemoryImage import SparseMemoryImage
@@ -502,6 +503,40 @@ def test_invalid_field_shamt():
   with pytest.raises( AssertionError ):
     pisa_encoding.assemble_inst( {}, 0, "sll r1, r2, -1" )
 
+#-------------------------------------------------------------------------
+# Test decode table
+#-------------------------------------------------------------------------
+# The decode table must give the same result as a linear search over the
+# encoding table, including for bits outside of the opcode masks.
+
+def decode_linear( inst_bits ):
+  for row in pisa_encoding.pisa_encoding_table:
+    if (inst_bits & row[1]) == row[2]:
+      return row[0]
+  return None
+
+def test_decode_table():
+
+  rng = random.Random( 0xdec0de )
+
+  words = [ rng.getrandbits(32) for i in xrange(10000) ]
+  for row in pisa_encoding.pisa_encoding_table:
+    for i in xrange(100):
+      words.append( row[2] | ( rng.getrandbits(32) & ~row[1] ) )
+
+  for inst_bits in words:
+    inst_tmpl = decode_linear( inst_bits )
+    if inst_tmpl is None:
+      with pytest.raises( AssertionError ):
+        pisa_encoding.decode_inst_name( inst_bits )
+    else:
+      assert pisa_encoding.decode_inst_name( inst_bits ) \
+          == inst_tmpl.partition(' ')[0]
+
+def test_decode_nop():
+  assert pisa_encoding.decode_inst_name( 0x00000000 ) == "nop"
+  assert pisa_encoding.decode_inst_name( 0x00000040 ) == "sll"
+
 #-------------------------------------------------------------------------
 # mk_section
 #-------------------------------------------------------------------------
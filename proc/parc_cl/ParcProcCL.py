@@ -823,7 +823,6 @@ class ParcProcCL (Model):
 
         s.trace_X = "~w{}".format(s.ifetch_wait).ljust(29)
         if not s.imemresp_q.empty():
-          inst = PisaInst(s.imemresp_q.first())
           s.ifetch_wait -= 1
           s.trace_X = "~w{}".format(s.ifetch_wait).ljust(29)
           s.imemresp_q.deq()
@@ -16,7 +16,7 @@ from model.PortBundle import PortBundle, create_PortBundles
 # data types
 #-----------------------------------------------------------------------
 
-from datatypes.Bits        import Bits
+from datatypes.Bits        import Bits, frozen_bits
 from datatypes.BitStruct   import BitStruct, BitStructDefinition, BitField
 from datatypes.helpers     import (
     get_nbits, clog2, zext, sext, concat,
@@ -28,10 +28,12 @@ from datatypes.SignalValue import CreateWrappedClass
 # tools
 #-----------------------------------------------------------------------
 
-from tools.simulation.SimulationTool import SimulationTool
-from tools.translation.verilator_sim import TranslationTool
-from tools.translation.cpp_sim       import get_cpp
-from tools.integration.verilog       import VerilogModel
+from tools.simulation.SimulationTool   import SimulationTool
+from tools.translation.verilator_sim   import TranslationTool
+from tools.translation.verilator_batch import VerilatorBatchSim
+from tools.translation.cpp_sim         import get_cpp
+from tools.integration.verilog         import VerilogModel
+from model.ElaborationProfiler         import ElaborationProfiler
 
 #-----------------------------------------------------------------------
 # py.test decorators
@@ -77,6 +79,8 @@ __all__ = [ # Model Construction
             # Tools
             'SimulationTool',
             'TranslationTool',
+            'VerilatorBatchSim',
+            'ElaborationProfiler',
             # TEMPORARY
             'get_cpp',
             'CreateWrappedClass',
@@ -6,6 +6,7 @@
 from SignalValue import SignalValue
 
 import copy
+import binascii
 
 #-----------------------------------------------------------------------
 # _get_nbits
@@ -15,12 +16,63 @@ def _get_nbits( N ):
   if N > 0: return N.bit_length()
   else:     return N.bit_length() + 1
 
+#-----------------------------------------------------------------------
+# _get_width
+#-----------------------------------------------------------------------
+# Table of per-width constants shared by all Bits objects. Computing
+# _max, _min and _mask requires several large integer operations, so
+# we compute them once per bitwidth and look them up afterwards.
+_widths = {}
+
+def _get_width( nbits ):
+  'Return the (_max, _min, _mask) constants for a bitwidth.'
+  try:
+    return _widths[ nbits ]
+  except KeyError:
+    width = ( (2**nbits) - 1,
+              -2**(nbits - 1) if nbits > 1 else 0,
+              (1 << nbits) - 1 )
+    _widths[ nbits ] = width
+    return width
+
+#-----------------------------------------------------------------------
+# _new_bits
+#-----------------------------------------------------------------------
+# Trusted constructor used for operator results. Skips the argument
+# conversion and range validation performed by Bits.__init__, the value
+# is simply truncated to nbits. Callers must guarantee nbits is a
+# positive int and value is an int or long.
+_new = object.__new__
+
+def _new_bits( nbits, value ):
+  bits = _new( Bits )
+  try:
+    bits._max, bits._min, mask = _widths[ nbits ]
+  except KeyError:
+    bits._max, bits._min, mask = _get_width( nbits )
+  bits._mask = mask
+  bits.nbits = nbits
+  bits._uint = value & mask
+  return bits
+
 #-----------------------------------------------------------------------
 # Bits
 #-----------------------------------------------------------------------
 class Bits( SignalValue ):
   'Class emulating limited precision values of a fixed bitwidth.'
 
+  # Bits use slots so temporaries created by operators do not allocate
+  # an instance dictionary. A __dict__ slot is still provided for the
+  # attributes tools attach to some instances (e.g. SimulationTool
+  # callbacks), it is only allocated when such an attribute is set.
+  __slots__ = ( 'nbits', '_uint', '_max', '_min', '_mask', '__dict__' )
+
+  # The full range of bits, BitSlices override this per instance
+  slice = slice( None )
+
+  # Shared instances returned by frozen_bits() set this to True
+  frozen = False
+
   #---------------------------------------------------------------------
   # __init__
   #---------------------------------------------------------------------
@@ -35,10 +87,7 @@ class Bits( SignalValue ):
 
     # Set the nbits and bitmask (_mask) attributes
     self.nbits = nbits
-    self._max  = (2**nbits)- 1
-    self._min  = -2**(nbits- 1) if nbits > 1 else 0
-    self._mask = ( 1 << self.nbits ) - 1
-    self.slice = slice( None )
+    self._max, self._min, self._mask = _get_width( nbits )
 
     if not trunc and not (self._min <= value <= self._max):
       raise ValueError(
@@ -47,11 +96,18 @@ class Bits( SignalValue ):
         .format( self.nbits, _get_nbits(value), value )
       )
 
-    # Convert negative values into unsigned ints and store them
-    value_uint = value if ( value >= 0 ) else ( ~(-value) + 1 )
-    self._uint = value_uint & self._mask
+    # Store the value as an unsigned int, masking converts negative
+    # values into their two's complement representation
+    self._uint = value & self._mask
 
-    self._target_bits = self
+  #---------------------------------------------------------------------
+  # _target_bits
+  #---------------------------------------------------------------------
+  # The Bits object writes should be applied to, BitSlices override
+  # this to point to the Bits object they slice.
+  @property
+  def _target_bits( self ):
+    return self
 
   #---------------------------------------------------------------------
   # __call__
@@ -60,6 +116,25 @@ class Bits( SignalValue ):
   def __call__( self ):
     return Bits( self.nbits )
 
+  #---------------------------------------------------------------------
+  # __getstate__ / __setstate__
+  #---------------------------------------------------------------------
+  # Objects with __slots__ can only be pickled if they provide their own
+  # state, collect the slots of every class in the hierarchy along with
+  # the instance dictionary (if one was allocated).
+  def __getstate__( self ):
+    state = {}
+    for cls in type( self ).__mro__:
+      for name in cls.__dict__.get( '__slots__', () ):
+        if name != '__dict__' and hasattr( self, name ):
+          state[ name ] = getattr( self, name )
+    state.update( getattr( self, '__dict__', {} ) )
+    return state
+
+  def __setstate__( self, state ):
+    for name, value in state.items():
+      setattr( self, name, value )
+
   #---------------------------------------------------------------------
   # __int__
   #---------------------------------------------------------------------
@@ -93,12 +168,37 @@ class Bits( SignalValue ):
   #---------------------------------------------------------------------
   # Return the integer representation of the bits.
   def int( self ):
-    if self[ self.nbits - 1]:
-      twos_complement = ~self + 1
-      return -twos_complement._uint
+    if self._uint >> ( self.nbits - 1 ):
+      return self._uint - ( 1 << self.nbits )
     else:
       return self._uint
 
+  #---------------------------------------------------------------------
+  # to_bytes
+  #---------------------------------------------------------------------
+  # Return the unsigned value as a little-endian byte string, zero padded
+  # to nbytes (by default, the number of bytes needed to store nbits).
+  # Allows copying wide values to and from C buffers in one operation.
+  def to_bytes( self, nbytes = None ):
+    if nbytes is None:
+      nbytes = ( self.nbits - 1 ) / 8 + 1
+    elif self._uint >> 8*nbytes:
+      raise ValueError( 'Value {} does not fit in {} bytes!'
+                        .format( self.hex(), nbytes ) )
+    elif not nbytes:
+      return ''
+    return binascii.unhexlify( '{:0{}x}'.format( self._uint, 2*nbytes ) )[::-1]
+
+  #---------------------------------------------------------------------
+  # from_bytes
+  #---------------------------------------------------------------------
+  # Create a Bits object from a little-endian byte string, the value is
+  # truncated to nbits. An empty string is zero.
+  @staticmethod
+  def from_bytes( nbits, data ):
+    value = int( binascii.hexlify( data[::-1] ), 16 ) if data else 0
+    return _new_bits( int( nbits ), value )
+
   #---------------------------------------------------------------------
   # write_value
   #---------------------------------------------------------------------
@@ -191,6 +291,8 @@ class Bits( SignalValue ):
 
       # Open-ended range ( [:] ), return a copy of self
       if start is None and stop is None:
+        if type( self ) is Bits or self.frozen:
+          return _new_bits( self.nbits, self._uint )
         return copy.copy( self )
 
       # Open-ended range on left ( [:N] )
@@ -216,7 +318,7 @@ class Bits( SignalValue ):
       nbits = stop - start
       mask  = (1 << nbits) - 1
       value = (self._uint & (mask << start)) >> start
-      return BitSlice( nbits, value, target_bits = self, offset = start )
+      return _new_slice( nbits, value, self, start )
 
     # Handle integers
     else:
@@ -230,7 +332,7 @@ class Bits( SignalValue ):
 
       # Create a new Bits object containing the bit value and return it
       value = (self._uint & (1 << addr)) >> addr
-      return BitSlice( 1 , value, target_bits = self, offset = addr )
+      return _new_slice( 1, value, self, addr )
 
   #----------------------------------------------------------------------
   # __setitem__
@@ -330,22 +432,22 @@ class Bits( SignalValue ):
   # http://www1.pldworld.com/@xilinx/html/technote/TOOL/MANUAL/21i_doc/data/fndtn/ver/ver4_4.htm
 
   def __invert__( self ):
-    return Bits( self.nbits, ~self._uint, trunc=True )
+    return _new_bits( self.nbits, ~self._uint )
 
   def __add__( self, other ):
-    try:    return Bits( max( self.nbits, other.nbits), self._uint + other._uint, trunc=True )
-    except: return Bits( self.nbits,                    self._uint + other,       trunc=True )
+    try:    return _new_bits( max( self.nbits, other.nbits ), self._uint + other._uint )
+    except: return _new_bits( self.nbits, int( self._uint + other ) )
 
   def __sub__( self, other ):
-    try:    return Bits( max( self.nbits, other.nbits), self._uint - other._uint, trunc=True )
-    except: return Bits( self.nbits,                    self._uint - other,       trunc=True )
+    try:    return _new_bits( max( self.nbits, other.nbits ), self._uint - other._uint )
+    except: return _new_bits( self.nbits, int( self._uint - other ) )
 
   # TODO: what about multiplying Bits object with an object of other type
   # where the bitwidth of the other type is larger than the bitwidth of the
   # Bits object? ( applies to every other operator as well.... )
   def __mul__( self, other ):
-    try:    return Bits( 2*max( self.nbits, other.nbits), self._uint * other._uint, trunc=True )
-    except: return Bits( 2*self.nbits,                    self._uint * other,       trunc=True )
+    try:    return _new_bits( 2*max( self.nbits, other.nbits ), self._uint * other._uint )
+    except: return _new_bits( 2*self.nbits, int( self._uint * other ) )
 
   def __radd__( self, other ):
     return self.__add__( other )
@@ -357,16 +459,16 @@ class Bits( SignalValue ):
     return self.__mul__( other )
 
   def __div__(self, other):
-    try:    return Bits( 2*max( self.nbits, other.nbits), self._uint / other._uint, trunc=True )
-    except: return Bits( 2*self.nbits,                    self._uint / other,       trunc=True )
+    try:    return _new_bits( 2*max( self.nbits, other.nbits ), self._uint / other._uint )
+    except: return _new_bits( 2*self.nbits, int( self._uint / other ) )
 
   def __floordiv__(self, other):
-    try:    return Bits( 2*max( self.nbits, other.nbits), self._uint / other._uint, trunc=True )
-    except: return Bits( 2*self.nbits,                    self._uint / other,       trunc=True )
+    try:    return _new_bits( 2*max( self.nbits, other.nbits ), self._uint / other._uint )
+    except: return _new_bits( 2*self.nbits, int( self._uint / other ) )
 
   def __mod__(self, other):
-    try:    return Bits( 2*max( self.nbits, other.nbits), self._uint % other._uint, trunc=True )
-    except: return Bits( 2*self.nbits,                    self._uint % other,       trunc=True )
+    try:    return _new_bits( 2*max( self.nbits, other.nbits ), self._uint % other._uint )
+    except: return _new_bits( 2*self.nbits, int( self._uint % other ) )
 
   # TODO: implement these?
   # def __divmod__(self, other)
@@ -378,11 +480,11 @@ class Bits( SignalValue ):
 
   def __lshift__( self, other ):
     # Optimization to return 0 if shift amount is greater than self.nbits
-    if int( other ) >= self.nbits: return Bits( self.nbits, 0 )
-    return Bits( self.nbits, self._uint << int( other ), trunc=True )
+    if int( other ) >= self.nbits: return _new_bits( self.nbits, 0 )
+    return _new_bits( self.nbits, self._uint << int( other ) )
 
   def __rshift__( self, other ):
-    return Bits( self.nbits, self._uint >> int( other ) )
+    return _new_bits( self.nbits, self._uint >> int( other ) )
 
   # TODO: Not implementing reflective operators because its not clear
   #       how to determine width of other object in case of lshift
@@ -397,18 +499,18 @@ class Bits( SignalValue ):
 
   def __and__( self, other ):
     assert other >= 0
-    try:    return Bits( max( self.nbits, other.nbits), self._uint & other._uint, trunc=True )
-    except: return Bits( self.nbits,                    self._uint & other,       trunc=True )
+    try:    return _new_bits( max( self.nbits, other.nbits ), self._uint & other._uint )
+    except: return _new_bits( self.nbits, int( self._uint & other ) )
 
   def __xor__( self, other ):
     assert other >= 0
-    try:    return Bits( max( self.nbits, other.nbits), self._uint ^ other._uint, trunc=True )
-    except: return Bits( self.nbits,                    self._uint ^ other,       trunc=True )
+    try:    return _new_bits( max( self.nbits, other.nbits ), self._uint ^ other._uint )
+    except: return _new_bits( self.nbits, int( self._uint ^ other ) )
 
   def __or__( self, other ):
     assert other >= 0
-    try:    return Bits( max( self.nbits, other.nbits), self._uint | other._uint, trunc=True )
-    except: return Bits( self.nbits,                    self._uint | other,       trunc=True )
+    try:    return _new_bits( max( self.nbits, other.nbits ), self._uint | other._uint )
+    except: return _new_bits( self.nbits, int( self._uint | other ) )
 
   def __rand__( self, other ):
     return self.__and__( other )
@@ -458,11 +560,18 @@ class Bits( SignalValue ):
   #----------------------------------------------------------------------
   # TODO: make abstract method in SignalValue, or implement differently?
 
+  # Extending to a width at least as large as our own always fits, only
+  # use the validating constructor when narrowing.
+
   def _zext( self, new_width ):
-    return Bits( new_width, self._uint )
+    new_width = int( new_width )
+    if new_width < self.nbits: return Bits( new_width, self._uint )
+    return _new_bits( new_width, self._uint )
 
   def _sext( self, new_width ):
-    return Bits( new_width, self.int() )
+    new_width = int( new_width )
+    if new_width < self.nbits: return Bits( new_width, self.int() )
+    return _new_bits( new_width, self.int() )
 
 
 #-----------------------------------------------------------------------
@@ -475,6 +584,8 @@ class Bits( SignalValue ):
 # update the value of BitSlices that point to it!
 class BitSlice( Bits ):
 
+  __slots__ = ( '_target_bits', '_offset' )
+
   #---------------------------------------------------------------------
   # __init__
   #---------------------------------------------------------------------
@@ -488,19 +599,25 @@ class BitSlice( Bits ):
     # specific bits we are slicing.
     self._target_bits = target_bits
     self._offset      = offset
-    self.slice        = slice( offset, offset + nbits )
 
-    # Take the notify_sim_* methods and the _slices function pointer list
-    # from the original Bits instance. This ensures writes to the BitSlice
-    # object made in a simulator will trigger the appropriate callbacks
-    # attached to the Bits instance.
-    self.notify_sim_comb_update = self._target_bits.notify_sim_comb_update
-    self.notify_sim_seq_update  = self._target_bits.notify_sim_seq_update
+  @property
+  def slice( self ):
+    return slice( self._offset, self._offset + self.nbits )
 
   @property
   def _slices( self ):
     return self._target_bits._slices
 
+  # Forward the notify_sim_* methods to the original Bits instance. This
+  # ensures writes to the BitSlice object made in a simulator will
+  # trigger the appropriate callbacks attached to the Bits instance.
+
+  def notify_sim_comb_update( self ):
+    self._target_bits.notify_sim_comb_update()
+
+  def notify_sim_seq_update( self ):
+    self._target_bits.notify_sim_seq_update()
+
   #---------------------------------------------------------------------
   # write_value
   #---------------------------------------------------------------------
@@ -551,3 +668,103 @@ class BitSlice( Bits ):
     # Set the bits, write to the target's shadow state.
     new_val      = cleared_val | ( value << self._offset )
     self._target_bits.write_next( new_val )
+
+#-----------------------------------------------------------------------
+# _new_slice
+#-----------------------------------------------------------------------
+# Trusted constructor for BitSlices created by Bits.__getitem__, where
+# the value has already been extracted from target_bits and always fits.
+def _new_slice( nbits, value, target_bits, offset ):
+  bits = _new( BitSlice )
+  bits._max, bits._min, bits._mask = _get_width( nbits )
+  bits.nbits        = nbits
+  bits._uint        = value
+  bits._target_bits = target_bits
+  bits._offset      = offset
+  return bits
+
+#-----------------------------------------------------------------------
+# FrozenBits
+#-----------------------------------------------------------------------
+# Immutable Bits returned by frozen_bits(). Instances are shared between
+# all users, so any attempt to modify them raises a TypeError. Operators
+# and [:] copies still return ordinary (mutable) Bits.
+class FrozenBits( Bits ):
+
+  __slots__ = ()
+
+  frozen = True
+
+  def _raise_frozen( self, *args ):
+    raise TypeError( 'Cannot modify frozen {!r}!'.format( self ) )
+
+  write_value = _raise_frozen
+  write_next  = _raise_frozen
+  __setitem__ = _raise_frozen
+
+  # Immutable, so copies can simply share the instance, and unpickling
+  # returns the shared instance for the value
+
+  def __copy__( self ):
+    return self
+
+  def __reduce__( self ):
+    return ( frozen_bits, ( self.nbits, self._uint ) )
+
+  def __deepcopy__( self, memo ):
+    return self
+
+#-----------------------------------------------------------------------
+# frozen_bits
+#-----------------------------------------------------------------------
+# Return a shared, immutable Bits object holding value. Intended for hot
+# paths which create many short-lived read-only values (e.g. register
+# specifiers decoded from instructions). Widths up to FROZEN_NBITS are
+# interned completely (at most 2**FROZEN_NBITS entries per width). Wider
+# values go in a bounded cache of FROZEN_CACHE_SIZE entries with an
+# approximate LRU policy: entries live in a young and an old generation,
+# hits in the old generation are promoted, and when the young
+# generation fills up the old generation is discarded.
+FROZEN_NBITS      = 8
+FROZEN_CACHE_SIZE = 4096
+
+_frozen_narrow = {}    # nbits -> { value : FrozenBits }
+_frozen_young  = {}    # (nbits, value) -> FrozenBits
+_frozen_old    = {}
+
+def frozen_bits( nbits, value ):
+  'Return a shared, immutable Bits( nbits, value ).'
+  global _frozen_young, _frozen_old
+
+  # Narrow widths: one table per width
+
+  try:
+    return _frozen_narrow[ nbits ][ value ]
+  except KeyError:
+    pass
+
+  # Validate and normalize the value exactly like the Bits constructor,
+  # entries are stored under the normalized value so equal values (e.g.,
+  # -1 and 255, or a Bits) share the same instance
+
+  nbits = int( nbits )
+  bits  = FrozenBits( nbits, value )
+
+  if nbits <= FROZEN_NBITS:
+    return _frozen_narrow.setdefault( nbits, {} ) \
+                         .setdefault( bits._uint, bits )
+
+  # Wide widths: two-generation cache
+
+  key = ( nbits, bits._uint )
+  try:
+    return _frozen_young[ key ]
+  except KeyError:
+    pass
+
+  bits = _frozen_old.pop( key, bits )
+  if len( _frozen_young ) >= FROZEN_CACHE_SIZE // 2:
+    _frozen_old   = _frozen_young
+    _frozen_young = {}
+  _frozen_young[ key ] = bits
+  return bits
@@ -3,9 +3,14 @@
 #=======================================================================
 # Tests for the Bits class.
 
+import gc
+import copy
+import pickle
 import pytest
 
-from   Bits import Bits
+from   Bits import Bits, FrozenBits, frozen_bits
+import Bits as bits_module
+from   helpers import zext, sext
 
 def test_return_type():
 
@@ -543,3 +548,160 @@ def test_slice_bits():
   assert data[ :x]   == 0b01
   with pytest.raises( IndexError ):
     assert data[x:x] == 0b1
+
+def test_slots():
+
+  # Temporaries created by operators have no instance dictionary
+  a = Bits( 8, 3 )
+  b = Bits( 8, 5 )
+  for x in [ a, a + b, a & 1, ~a, a << 2, a[0:4], a[1], a[:] ]:
+    assert not any( type( r ) is dict for r in gc.get_referents( x ) )
+
+  # Other tools can still attach attributes
+  a.tag = 'foo'
+  assert a.tag == 'foo'
+
+def test_trusted_results():
+
+  # Operator results are truncated and share per-width constants
+  a = Bits( 8, 0xff )
+  c = a + 1
+  assert c == 0 and c.nbits == 8
+  assert c._max  == 0xff
+  assert c._min  == -0x80
+  assert c._mask == 0xff
+  assert ( Bits( 4, 2 ) - 3 ) == 0xf
+  assert ( Bits( 4, 2 ) - Bits( 8, 3 ) ) == 0xff
+
+  # Slices remain writable views of their target
+  d = Bits( 8, 0 )
+  d[4:8].value = 0xa
+  assert d == 0xa0
+  assert d[4:8].slice == slice( 4, 8 )
+
+  # Copies made with [:] are detached
+  e = d[:]
+  e.value = 1
+  assert d == 0xa0
+
+def test_extension():
+
+  a = Bits( 4, 0b1010 )
+  assert zext( a, 8 ) == 0b00001010
+  assert sext( a, 8 ) == 0b11111010
+  assert zext( a, 8 ).nbits == 8
+
+  # Narrowing still validates the value
+  assert zext( Bits( 8, 3 ), 4 ) == 3
+  with pytest.raises( ValueError ):
+    zext( Bits( 8, 0x13 ), 4 )
+  with pytest.raises( ValueError ):
+    sext( Bits( 8, 0x13 ), 4 )
+
+def test_bytes():
+
+  a = Bits( 70, 0x3f0123456789abcdef )
+  assert a.to_bytes() == '\xef\xcd\xab\x89\x67\x45\x23\x01\x3f'
+  assert a.to_bytes( 12 ) == a.to_bytes() + '\x00' * 3
+  assert a[64:70].to_bytes() == '\x3f'
+  assert Bits( 1 ).to_bytes() == '\x00'
+
+  b = Bits.from_bytes( 70, a.to_bytes( 12 ) )
+  assert b == a and b.nbits == 70
+
+  # Values are truncated to nbits, empty strings are zero
+  assert Bits.from_bytes( 4, '\xff\xff' ) == 0xf
+  assert Bits.from_bytes( 8, '' ) == 0
+
+  # Values which do not fit in nbytes are rejected
+  assert Bits( 16, 0xff ).to_bytes( 1 ) == '\xff'
+  assert Bits( 16, 0 ).to_bytes( 0 ) == ''
+  with pytest.raises( ValueError ):
+    Bits( 16, 0x1ff ).to_bytes( 1 )
+  with pytest.raises( ValueError ):
+    Bits( 24, 0x10000 ).to_bytes( 2 )
+
+  for nbits in [ 8, 9, 64, 512 ]:
+    a = Bits( nbits, ( 1 << nbits ) - 3 )
+    assert Bits.from_bytes( nbits, a.to_bytes() ) == a
+
+@pytest.mark.parametrize( 'protocol', [ 0, 2 ] )
+def test_pickle( protocol ):
+
+  roundtrip = lambda x: pickle.loads( pickle.dumps( x, protocol ) )
+
+  for a in [ Bits( 8, 5 ), Bits( 1 ), Bits( 70, 1 << 69 ) ]:
+    b = roundtrip( a )
+    assert type( b ) is Bits and b.nbits == a.nbits and b == a
+    b.value = 1
+    assert a != 1
+
+  # Slices keep writing through to their (copied) target
+
+  c = roundtrip( Bits( 16, 0x1234 )[4:12] )
+  assert c == 0x23 and c.nbits == 8
+  c.value = 0xff
+  assert c._target_bits == 0x1ff4
+
+  # Frozen values unpickle to the shared instance
+
+  assert roundtrip( frozen_bits( 8, 3 ) ) is frozen_bits( 8, 3 )
+  assert roundtrip( frozen_bits( 32, 7 ) ) == 7
+
+def test_frozen_bits():
+
+  # Narrow values are interned
+  a = frozen_bits( 5, 17 )
+  assert a == 17 and a.nbits == 5
+  assert a is frozen_bits( 5, 17 )
+  assert a is not frozen_bits( 6, 17 )
+  assert a.frozen and not Bits( 5, 17 ).frozen
+
+  # Values are validated like the Bits constructor
+  assert frozen_bits( 4, -1 ) == 0xf
+
+  # Equal values share the same instance, whatever their form
+  assert frozen_bits( 8, -1 ) is frozen_bits( 8, 255 )
+  assert frozen_bits( 8, Bits( 8, 7 ) ) is frozen_bits( 8, 7 )
+  assert frozen_bits( 32, -1 ) is frozen_bits( 32, 0xffffffff )
+  with pytest.raises( ValueError ):
+    frozen_bits( 4, 16 )
+
+  # Frozen values cannot be modified
+  with pytest.raises( TypeError ):
+    a.value = 3
+  with pytest.raises( TypeError ):
+    a[0] = 0
+  with pytest.raises( TypeError ):
+    a[0:2].value = 0
+  with pytest.raises( TypeError ):
+    a.next = 3
+  assert a == 17
+
+  # Operators, copies and instantiation produce mutable Bits
+  for x in [ a + 1, a[:], a() ]:
+    assert not x.frozen
+    x.value = 1
+  assert copy.copy( a ) is a
+  assert copy.deepcopy( a ) is a
+
+def test_frozen_bits_wide( monkeypatch ):
+
+  monkeypatch.setattr( bits_module, '_frozen_young', {} )
+  monkeypatch.setattr( bits_module, '_frozen_old',   {} )
+  monkeypatch.setattr( bits_module, 'FROZEN_CACHE_SIZE', 8 )
+
+  a = frozen_bits( 32, 0xdeadbeef )
+  assert a == 0xdeadbeef
+  assert a is frozen_bits( 32, 0xdeadbeef )
+
+  # Recently used values survive eviction, the cache stays bounded
+  for i in range( 100 ):
+    frozen_bits( 32, i )
+    assert frozen_bits( 32, 0xdeadbeef ) is a
+    assert len( bits_module._frozen_young ) <= 4
+    assert len( bits_module._frozen_old   ) <= 4
+
+  # Old values are eventually evicted
+  b = frozen_bits( 32, 0 )
+  assert b == 0 and b is frozen_bits( 32, 0 )
@@ -13,6 +13,9 @@ import copy
 # (InPort, OutPort, Wire), needs to subclass SignalValue.
 class SignalValue( object ):
 
+  # No instance dictionary here, subclasses decide how to store state
+  __slots__   = ()
+
   constant    = False
   _callbacks  = []
   _slices     = []
@@ -4,7 +4,6 @@
 'Collection of built-in helpers functions for the PyMTL framework.'
 
 import math
-import operator
 
 # NOTE: circular imports between Bits and helpers, using 'import'
 #       instead of 'from Bits import' ensures pydoc still works
@@ -50,36 +49,31 @@ def concat( *args ):
 
   assert isinstance( args[0], Bits.Bits )
 
-  # Calculate total new bitwidth
-  nbits = sum( [ x.nbits for x in args ] )
+  # Shift each value into place from MSB to LSB, the result fits by
+  # construction so we can use the trusted constructor.
+  nbits = 0
+  value = 0
+  for bits in args:
+    value  = ( value << bits.nbits ) | int( bits )
+    nbits += bits.nbits
 
-  # Create new Bits and add each bits from bits_list to it
-  concat_bits = Bits.Bits( nbits )
-
-  begin = 0
-  for bits in reversed( args ):
-    concat_bits[ begin : begin+bits.nbits ] = bits
-    begin += bits.nbits
-
-  return concat_bits
+  return Bits._new_bits( nbits, value )
 
 #-----------------------------------------------------------------------
 # reduce_and
 #-----------------------------------------------------------------------
 def reduce_and( signal ):
-  return reduce( operator.and_, (signal[x] for x in xrange( signal.nbits )) )
+  return Bits._new_bits( 1, int( signal ) == ( 1 << signal.nbits ) - 1 )
 
 #-----------------------------------------------------------------------
 # reduce_or
 #-----------------------------------------------------------------------
 def reduce_or( signal ):
-  return reduce( operator.or_,  (signal[x] for x in xrange( signal.nbits )) )
+  return Bits._new_bits( 1, int( signal ) != 0 )
 
 #-----------------------------------------------------------------------
 # reduce_xor
 #-----------------------------------------------------------------------
-# Verilog iterates through MSB to LSB, so we must reverse iteration.
+# Parity of the set bits, equivalent to xor-ing every bit.
 def reduce_xor( signal ):
-  return reduce( operator.xor,
-                 (signal[x] for x in reversed( xrange( signal.nbits ) ))
-               )
+  return Bits._new_bits( 1, bin( int( signal ) ).count( '1' ) & 1 )
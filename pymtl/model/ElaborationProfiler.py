@@ -0,0 +1,106 @@
+#=======================================================================
+# ElaborationProfiler.py
+#=======================================================================
+"""Collects timing information while PyMTL models are constructed and
+elaborated."""
+
+from __future__ import print_function
+
+import collections
+import timeit
+
+#-----------------------------------------------------------------------
+# ElaborationProfiler
+#-----------------------------------------------------------------------
+class ElaborationProfiler( object ):
+  """Profiler breaking down the time spent building a design into
+  phases and model classes.
+
+  Models constructed and elaborated while the profiler is active are
+  timed in the following phases:
+
+  - construct: the constructor of each model (MetaCollectArgs.__call__)
+  - elaborate_logic: the deprecated elaborate_logic() of each model
+  - check_type: naming and classifying the attributes of each model
+  - connections: setting the direction of all connections
+
+  Times are exclusive, time spent constructing or elaborating a child
+  model is only counted for the child, so the times of all phases add
+  up to the total time spent in the profiled code.
+
+  >>> profiler = ElaborationProfiler()
+  >>> with profiler:
+  >>>   model = MyModel()
+  >>>   model.elaborate()
+  >>> profiler.print_profile()
+  """
+
+  # The profiler currently collecting data, checked by the hooks in
+  # MetaCollectArgs and Model
+
+  active = None
+
+  #---------------------------------------------------------------------
+  # __init__
+  #---------------------------------------------------------------------
+  def __init__( self ):
+    self.phase_time  = collections.defaultdict( float )
+    self.class_time  = collections.defaultdict( float )
+    self.class_count = collections.defaultdict( int   )
+    self.total_time  = 0.0
+    self._stack      = []
+    self._start_time = None
+
+  #---------------------------------------------------------------------
+  # __enter__ / __exit__
+  #---------------------------------------------------------------------
+  def __enter__( self ):
+    if ElaborationProfiler.active is not None:
+      raise Exception( "Another ElaborationProfiler is already active!" )
+    ElaborationProfiler.active = self
+    self._start_time = timeit.default_timer()
+    return self
+
+  def __exit__( self, exc_type, exc_value, traceback ):
+    self.total_time += timeit.default_timer() - self._start_time
+    ElaborationProfiler.active = None
+    del self._stack[:]
+
+  #---------------------------------------------------------------------
+  # start / stop
+  #---------------------------------------------------------------------
+  # Time a phase of constructing or elaborating a model of class cls.
+  # Calls may nest, time spent in a nested phase is subtracted from the
+  # enclosing one.
+  def start( self, phase, cls ):
+    self._stack.append( [ phase, cls.__name__, timeit.default_timer(), 0.0 ] )
+
+  def stop( self ):
+    phase, class_name, start_time, nested = self._stack.pop()
+    elapsed = timeit.default_timer() - start_time
+    self.phase_time [ phase ]               += elapsed - nested
+    self.class_time [ (phase, class_name) ] += elapsed - nested
+    self.class_count[ (phase, class_name) ] += 1
+    if self._stack:
+      self._stack[-1][3] += elapsed
+
+  #---------------------------------------------------------------------
+  # print_profile
+  #---------------------------------------------------------------------
+  def print_profile( self, nclasses = 20 ):
+    print("-"*72)
+    print("Elaboration Profile")
+    print("-"*72)
+    print()
+    print("total:            {:9.3f}s".format( self.total_time ))
+    for phase in ('construct', 'elaborate_logic', 'check_type', 'connections'):
+      print("{:17} {:9.3f}s".format( phase+':', self.phase_time[ phase ] ))
+    print()
+    print("phase            class                          count       time")
+    print("---------------  -----------------------------  ------  ---------")
+    keys = sorted( self.class_time, key=self.class_time.get, reverse=True )
+    for phase, class_name in keys[:nclasses]:
+      print("{:15}  {:29}  {:6}  {:8.3f}s".format( phase, class_name[:29],
+            self.class_count[ (phase, class_name) ],
+            self.class_time [ (phase, class_name) ] ))
+    print("-"*72)
@@ -10,6 +10,7 @@ translation into HDLs, etc).
 """
 
 from metaclasses    import MetaCollectArgs
+from ElaborationProfiler import ElaborationProfiler
 from ConnectionEdge import ConnectionEdge, PyMTLConnectError
 from signals        import Signal, InPort, OutPort, Wire, Constant
 from signal_lists   import PortList, WireList
@@ -19,6 +20,7 @@ from ..datatypes    import Bits
 #from physical      import PhysicalDimensions
 
 import collections
+import gc
 import inspect
 import warnings
 import math
@@ -367,14 +369,26 @@ class Model( object ):
     top-level model before it is passed to any PyMTL tools.
     """
 
-    # Initialize data structure to hold all model classes in the design
-    self._model_classes = set()
+    # Elaboration allocates many long-lived objects (signals, connection
+    # edges) but creates no garbage, so pause the cyclic garbage
+    # collector which would otherwise repeatedly traverse all of them.
+    gc_enabled = gc.isenabled()
+    gc.disable()
 
-    # Recursively elaborate each model in the design, starting with top
-    self._recurse_elaborate( self, 'top' )
+    try:
+
+      # Initialize data structure to hold all model classes in the design
+      self._model_classes = set()
+
+      # Recursively elaborate each model in the design, starting with top
+      self._recurse_elaborate( self, 'top' )
 
-    # Visit all connections in the design, set directionality
-    self._recurse_connections()
+      # Visit all connections in the design, set directionality
+      self._recurse_connections()
+
+    finally:
+      if gc_enabled:
+        gc.enable()
 
   #-----------------------------------------------------------------------
   # is_elaborated
@@ -458,8 +472,17 @@ class Model( object ):
     current_model.parent     = None
     current_model.name       = instance_name
 
+    profiler = ElaborationProfiler.active
+
     # DEPRECATED: Call user implemented elaborate_logic() function
-    current_model.elaborate_logic()
+    if profiler is None:
+      current_model.elaborate_logic()
+    else:
+      profiler.start( 'elaborate_logic', current_model.__class__ )
+      try:
+        current_model.elaborate_logic()
+      finally:
+        profiler.stop()
 
     # Initialize lists for signals, submodules and connections
     current_model._wires          = []
@@ -478,11 +501,17 @@ class Model( object ):
     # submodels, etc). Set their names, parents, and add them to the
     # appropriate private attribute lists.
     # TODO: do all ports first?
-    for name, obj in current_model.__dict__.items():
-      if not name.startswith( '_' ):
-        self._check_type( current_model, name, obj )
-    if hasattr( current_model, '_auto_connects' ):
-      current_model._auto_connect()
+    if profiler is not None:
+      profiler.start( 'check_type', current_model.__class__ )
+    try:
+      for name, obj in current_model.__dict__.items():
+        if not name.startswith( '_' ):
+          self._check_type( current_model, name, obj )
+      if hasattr( current_model, '_auto_connects' ):
+        current_model._auto_connect()
+    finally:
+      if profiler is not None:
+        profiler.stop()
 
 
   #---------------------------------------------------------------------
@@ -491,27 +520,37 @@ class Model( object ):
   def _check_type( self, current_model, name, obj, nested=False ):
     """Specialize elaboration actions based on object type."""
 
-    if   isinstance( obj, Wire ):
+    # Most attributes are not signals, models or lists, classifying the
+    # type of each attribute once avoids a chain of isinstance() checks
+    try:
+      kind = _attr_kinds[ obj.__class__ ]
+    except KeyError:
+      kind = _attr_kinds[ obj.__class__ ] = _classify_attr( obj )
+
+    if   kind is None:
+      return
+
+    elif kind is Wire:
       obj.name              = name
       obj.parent            = current_model
-      current_model._wires += [ obj ]
+      current_model._wires.append( obj )
 
-    elif isinstance( obj, InPort ):
+    elif kind is InPort:
       obj.name                = name
       obj.parent              = current_model
-      current_model._inports += [ obj ]
+      current_model._inports.append( obj )
       if not nested:
-        current_model._hports  += [ obj ]
+        current_model._hports.append( obj )
 
-    elif isinstance( obj, OutPort ):
+    elif kind is OutPort:
       obj.name                 = name
       obj.parent               = current_model
-      current_model._outports += [ obj ]
+      current_model._outports.append( obj )
       if not nested:
-        current_model._hports  += [ obj ]
+        current_model._hports.append( obj )
 
     # TODO: clean this up...
-    elif isinstance( obj, PortBundle ):
+    elif kind is PortBundle:
       obj.name = name
       for port in obj.get_ports():
         self._check_type(current_model, name+'.'+port.name, port, nested=True)
@@ -519,7 +558,7 @@ class Model( object ):
         current_model._hports += [ obj ]
 
     # Submodules
-    elif isinstance( obj, Model ):
+    elif kind is Model:
       # TODO: remove, throw an exception in _recurse_elaborate
       if obj.is_elaborated():
         warnings.warn( "Model '{}::{}' has two parents!!!"
@@ -536,7 +575,7 @@ class Model( object ):
       obj.parent.connect( obj.reset, obj.parent.reset )
 
     # Lists of Signals
-    elif isinstance( obj, list ):
+    elif kind is list:
       if obj and isinstance( obj[0], Wire):
         obj = WireList( obj )
         obj.name = name
@@ -591,8 +630,13 @@ class Model( object ):
     """Set the directionality on all connections in the model."""
 
     # Set direction of all connections
+    profiler = ElaborationProfiler.active
+    if profiler is not None:
+      profiler.start( 'connections', self.__class__ )
     for c in self._connections:
       c.set_edge_direction()
+    if profiler is not None:
+      profiler.stop()
 
     # Recursively enter submodules
     for submodule in self._submodules:
@@ -660,3 +704,15 @@ class Model( object ):
         if key in dict2:
           self.connect(dict2[key], dict3[key])
 
+#-----------------------------------------------------------------------
+# _classify_attr
+#-----------------------------------------------------------------------
+# Returns the kind of model attribute handled by Model._check_type, or
+# None for attributes which are ignored during elaboration. Results are
+# cached per attribute type in _attr_kinds.
+_attr_kinds = {}
+def _classify_attr( obj ):
+  for kind in ( Wire, InPort, OutPort, PortBundle, Model, list ):
+    if isinstance( obj, kind ):
+      return kind
+  return None
@@ -10,6 +10,9 @@ from signals          import InPort, OutPort, Wire
 from ConnectionEdge   import ConnectionEdge, PyMTLConnectError
 from ..datatypes.Bits import Bits
 
+from ElaborationProfiler import ElaborationProfiler
+
+import gc
 import pytest
 
 #-----------------------------------------------------------------------
@@ -336,4 +339,50 @@ def test_PortConstAssertSize():
   with pytest.raises( PyMTLConnectError ):
     m = inst_elab_model( PortConstAssertSize2 )
 
+#-----------------------------------------------------------------------
+# Args
+#-----------------------------------------------------------------------
+
+class Args( Model ):
+  def __init__( s, nbits, nports=2, msg='x' ):
+    s.in_ = InPort[ nports ]( nbits )
+
+def test_Args():
+
+  # Constructor arguments are collected the same way for every instance
+  # of the class (the argspec is cached after the first one)
+
+  for i in range( 2 ):
+    assert list( Args( 8 )._args.items() ) == \
+           [ ('nbits', 8), ('nports', 2), ('msg', 'x') ]
+    assert list( Args( 8, msg='y', nports=3 )._args.items() ) == \
+           [ ('nbits', 8), ('nports', 3), ('msg', 'y') ]
+    assert list( Args( 8, 4, 'z' )._args.items() ) == \
+           [ ('nbits', 8), ('nports', 4), ('msg', 'z') ]
+
+#-----------------------------------------------------------------------
+# ElaborationProfiler
+#-----------------------------------------------------------------------
+
+def test_ElaborationProfiler():
+
+  profiler = ElaborationProfiler()
+  with profiler:
+    m = SubMod_SL()
+    m.elaborate()
+
+  assert ElaborationProfiler.active is None
+  assert gc.isenabled()
+
+  count = profiler.class_count
+  assert count[ ('construct',       'SubMod_SL') ] == 1
+  assert count[ ('construct',       'Port_Port') ] == 2
+  assert count[ ('elaborate_logic', 'Port_Port') ] == 2
+  assert count[ ('check_type',      'Port_Port') ] == 2
+  assert count[ ('connections',     'SubMod_SL') ] == 1
+
+  # Phase times are exclusive so they add up to at most the total time
+
+  assert 0 < sum( profiler.phase_time.values() ) <= profiler.total_time
 
+  profiler.print_profile()
@@ -6,6 +6,8 @@
 import inspect
 import collections
 
+from ElaborationProfiler import ElaborationProfiler
+
 #-----------------------------------------------------------------------
 # MetaListConstructor
 #-----------------------------------------------------------------------
@@ -67,6 +69,12 @@ class MetaCollectArgs( MetaListConstructor ):
   Metaclass functionality.
   """
 
+  # Constructor prototypes (argument names excluding self, and default
+  # values) of each class, inspect.getargspec is too slow to call every
+  # time a model is constructed.
+
+  _argspecs = {}
+
   #---------------------------------------------------------------------
   # __call__
   #---------------------------------------------------------------------
@@ -78,31 +86,44 @@ class MetaCollectArgs( MetaListConstructor ):
     """
 
     # Get the constructor prototype
-    argspec = inspect.getargspec( self.__init__ )
+    try:
+      arg_names, defaults = MetaCollectArgs._argspecs[ self ]
+    except KeyError:
+      argspec   = inspect.getargspec( self.__init__ )
+      arg_names = argspec.args[1:]
+      defaults  = argspec.defaults
+      MetaCollectArgs._argspecs[ self ] = arg_names, defaults
 
     # Create an argument dictionary
     argdict = collections.OrderedDict()
 
     # Collect all positional arguments (except first, which is self)
     for i, arg_value in enumerate( args ):
-      key, value = argspec.args[i+1], arg_value
+      key, value = arg_names[i], arg_value
       argdict[ key ] = value
 
     # Collect all keyword arguments
-    num_kwargs = len( argspec.args ) - len( args ) - 1
-    if argspec.defaults and num_kwargs:
-      for i, arg_name in enumerate( argspec.args[-num_kwargs:] ):
-        key, value = arg_name, argspec.defaults[ i ]
+    num_kwargs = len( arg_names ) - len( args )
+    if defaults and num_kwargs:
+      for i, arg_name in enumerate( arg_names[-num_kwargs:] ):
+        key, value = arg_name, defaults[ i ]
         if arg_name in kwargs:
           value = kwargs[ arg_name ]
         argdict[ key ] = value
 
     # Create the instance
-    inst = super( MetaCollectArgs, self ).__call__( *args, **kwargs )
+    profiler = ElaborationProfiler.active
+    if profiler is None:
+      inst = super( MetaCollectArgs, self ).__call__( *args, **kwargs )
+    else:
+      profiler.start( 'construct', self )
+      try:
+        inst = super( MetaCollectArgs, self ).__call__( *args, **kwargs )
+      finally:
+        profiler.stop()
 
     # Add the argdict to inst
     inst._args = argdict
 
     # Return the instance
     return inst
-
@@ -6,6 +6,12 @@ from __future__ import print_function
 
 import inspect
 import ast, _ast
+import atexit
+import fcntl
+import hashlib
+import linecache
+import os
+import pickle
 
 #-----------------------------------------------------------------------
 # print_ast
@@ -96,15 +102,224 @@ def print_simple_ast(node, indent=' ', show_lineno=False ):
 # In order to parse class methods and inner functions, we need to fix the
 # indentation whitespace or else the ast parser throws an "unexpected
 # ident" error.
+# The source is looked up in the AST cache (see below) so only the parse
+# is repeated, every call returns a new tree which the caller is free to
+# transform.
 import re
 p = re.compile('( *(@|def))')
 def get_method_ast( func ):
 
-  src = inspect.getsource( func )
-  new_src = p.sub( r'\2', src )
+  new_src = get_method_src( func )
   tree = ast.parse( new_src )
   return tree, new_src
 
+#-----------------------------------------------------------------------
+# AST cache
+#-----------------------------------------------------------------------
+# Every instance of a model shares the code objects of its concurrent
+# blocks, so the source, AST and any analyses derived from the AST only
+# need to be computed once per block definition rather than once per
+# instance. Entries are keyed by the code object (and file name, since
+# code objects compare equal across files) of the block.
+#
+# Cached analyses must only depend on the source of the block. Anything
+# depending on the closure of the block (i.e., the model instance it
+# belongs to) must be computed per instance from the cached results.
+#
+# The source and the analyses marked persistent can also be kept in an
+# on-disk cache, which is enabled by setting the PYMTL_AST_CACHE_DIR
+# environment variable or calling set_ast_cache_dir(). The cache keeps a
+# pickle per Python source file which is discarded whenever the contents
+# of the file change. New entries are only written by flush_ast_cache(),
+# which is called once the simulator has been constructed and at exit,
+# so each file is rewritten once per burst of new blocks rather than
+# once per block.
+
+_ast_cache       = {}     # (code, filename) -> { 'src' : src, name : analysis }
+_ast_trees       = {}     # (code, filename) -> shared AST
+_ast_local       = {}     # ((code, filename), name) -> non-persistent analysis
+_ast_disk_files  = {}     # filename -> on-disk cache for that file
+_ast_dirty_files = set()  # filenames with entries not written to disk yet
+
+_ast_cache_dir   = os.environ.get( 'PYMTL_AST_CACHE_DIR' )
+
+def set_ast_cache_dir( path ):
+  global _ast_cache_dir
+  flush_ast_cache()
+  _ast_cache_dir = path
+  _ast_disk_files.clear()
+
+def clear_ast_cache():
+  flush_ast_cache()
+  _ast_cache.clear()
+  _ast_trees.clear()
+  _ast_local.clear()
+  _ast_disk_files.clear()
+
+#-----------------------------------------------------------------------
+# get_method_src
+#-----------------------------------------------------------------------
+# Returns the source of func with the indentation fixed up for parsing.
+def get_method_src( func ):
+  return _get_cache_entry( func )['src']
+
+#-----------------------------------------------------------------------
+# get_cached_ast
+#-----------------------------------------------------------------------
+# Returns the AST of func shared by all functions with the same code.
+# The tree must NOT be modified, use get_method_ast to get a private
+# copy for transformations.
+def get_cached_ast( func ):
+  key = _get_cache_key( func )
+  try:
+    return _ast_trees[ key ]
+  except KeyError:
+    tree = _ast_trees[ key ] = ast.parse( get_method_src( func ) )
+    return tree
+
+#-----------------------------------------------------------------------
+# get_cached_analysis
+#-----------------------------------------------------------------------
+# Returns analyze( tree ) for the shared AST of func, computing it the
+# first time it is requested for the code of func. Results are saved in
+# the on-disk cache if persist is True, so they must be picklable.
+def get_cached_analysis( func, name, analyze, persist=True ):
+
+  if persist:
+    entry = _get_cache_entry( func )
+    try:
+      return entry[ name ]
+    except KeyError:
+      result = entry[ name ] = analyze( get_cached_ast( func ) )
+      _save_disk_entry( func.__code__, entry )
+      return result
+
+  key = ( _get_cache_key( func ), name )
+  try:
+    return _ast_local[ key ]
+  except KeyError:
+    result = _ast_local[ key ] = analyze( get_cached_ast( func ) )
+    return result
+
+def _get_cache_key( func ):
+  code = func.__code__
+  return ( code, code.co_filename )
+
+def _get_cache_entry( func ):
+
+  key = _get_cache_key( func )
+  try:
+    return _ast_cache[ key ]
+  except KeyError:
+    pass
+
+  entry = _load_disk_entry( func.__code__ )
+  if entry is None:
+    entry = { 'src' : p.sub( r'\2', inspect.getsource( func ) ) }
+    _save_disk_entry( func.__code__, entry )
+
+  _ast_cache[ key ] = entry
+  return entry
+
+#-----------------------------------------------------------------------
+# On-disk AST cache
+#-----------------------------------------------------------------------
+
+def _get_disk_file( filename ):
+
+  try:
+    return _ast_disk_files[ filename ]
+  except KeyError:
+    pass
+
+  # Hash the source file as currently seen by inspect.getsource
+
+  src_hash = hashlib.sha1( ''.join( linecache.getlines( filename ) ) ) \
+                    .hexdigest()
+  path     = os.path.join( _ast_cache_dir,
+                           hashlib.sha1( filename ).hexdigest() + '.pkl' )
+
+  disk_file = { 'path' : path, 'hash' : src_hash, 'blocks' : {} }
+  try:
+    with open( path, 'rb' ) as fd:
+      data = pickle.load( fd )
+    if data['hash'] == src_hash:
+      disk_file['blocks'] = data['blocks']
+  except Exception:
+    pass
+
+  _ast_disk_files[ filename ] = disk_file
+  return disk_file
+
+def _load_disk_entry( code ):
+  if not _ast_cache_dir:
+    return None
+  disk_file = _get_disk_file( code.co_filename )
+  return disk_file['blocks'].get( ( code.co_firstlineno, code.co_name ) )
+
+def _save_disk_entry( code, entry ):
+
+  if not _ast_cache_dir:
+    return
+
+  disk_file = _get_disk_file( code.co_filename )
+  disk_file['blocks'][ ( code.co_firstlineno, code.co_name ) ] = entry
+  _ast_dirty_files.add( code.co_filename )
+
+#-----------------------------------------------------------------------
+# flush_ast_cache
+#-----------------------------------------------------------------------
+# Write the entries added to the in-memory cache to the on-disk cache.
+def flush_ast_cache():
+  while _ast_dirty_files:
+    disk_file = _ast_disk_files.get( _ast_dirty_files.pop() )
+    if disk_file is not None:
+      _write_disk_file( disk_file )
+
+atexit.register( flush_ast_cache )
+
+def _write_disk_file( disk_file ):
+
+  path   = disk_file['path']
+  blocks = disk_file['blocks']
+
+  try:
+    if not os.path.isdir( os.path.dirname( path ) ):
+      os.makedirs( os.path.dirname( path ) )
+
+    # Hold a lock while merging with the entries other processes wrote
+    # since we loaded the file, so that concurrent processes adding
+    # blocks of the same file do not drop each other's entries
+
+    with open( path + '.lock', 'a' ) as lock:
+      fcntl.flock( lock, fcntl.LOCK_EX )
+
+      try:
+        with open( path, 'rb' ) as fd:
+          data = pickle.load( fd )
+      except Exception:
+        data = None
+
+      if data and data['hash'] == disk_file['hash']:
+        for key, entry in data['blocks'].items():
+          if key not in blocks:
+            blocks[ key ] = entry
+            continue
+          for name, analysis in entry.items():
+            blocks[ key ].setdefault( name, analysis )
+
+      # Write to a temporary file and rename it so that processes which
+      # do not take the lock never see a partially written cache file
+
+      data = { 'hash' : disk_file['hash'], 'blocks' : blocks }
+      tmp  = '{}.{}.tmp'.format( path, os.getpid() )
+      with open( tmp, 'wb' ) as fd:
+        pickle.dump( data, fd, pickle.HIGHEST_PROTOCOL )
+      os.rename( tmp, path )
+
+  except (IOError, OSError):
+    pass
+
 #-----------------------------------------------------------------------
 # get_closure_dict
 #-----------------------------------------------------------------------
@@ -0,0 +1,180 @@
+#=========================================================================
+# ast_helpers_test.py
+#=========================================================================
+
+import imp
+import inspect
+import linecache
+
+import ast_helpers
+
+from ast_helpers import get_method_ast, get_method_src, get_cached_ast
+from ast_helpers import get_cached_analysis, clear_ast_cache
+from ast_helpers import set_ast_cache_dir, flush_ast_cache
+
+#-------------------------------------------------------------------------
+# Helpers
+#-------------------------------------------------------------------------
+
+def make_blocks( n ):
+  blocks = []
+  for i in range( n ):
+    def logic():
+      return i
+    blocks.append( logic )
+  return blocks
+
+def count_getsource( monkeypatch ):
+  calls = []
+  getsource = inspect.getsource
+  def counted_getsource( obj ):
+    calls.append( obj )
+    return getsource( obj )
+  monkeypatch.setattr( inspect, 'getsource', counted_getsource )
+  return calls
+
+#-------------------------------------------------------------------------
+# test_shared_code
+#-------------------------------------------------------------------------
+
+def test_shared_code( monkeypatch ):
+
+  clear_ast_cache()
+  calls  = count_getsource( monkeypatch )
+  blocks = make_blocks( 4 )
+
+  # The source is only looked up once for all closures of the same code
+
+  srcs = [ get_method_src( func ) for func in blocks ]
+  assert len( calls ) == 1
+  assert srcs[0].startswith( 'def logic():' )
+
+  # Shared trees are the same object, method ASTs are always new
+
+  assert get_cached_ast( blocks[0] ) is get_cached_ast( blocks[3] )
+  assert get_method_ast( blocks[0] )[0] is not get_method_ast( blocks[0] )[0]
+
+  # Analyses are only computed once
+
+  analyzed = []
+  def analyze( tree ):
+    analyzed.append( tree )
+    return tree.body[0].name
+
+  for func in blocks:
+    assert get_cached_analysis( func, 'name', analyze ) == 'logic'
+    assert get_cached_analysis( func, 'local', analyze, False ) == 'logic'
+
+  assert len( analyzed ) == 2
+
+#-------------------------------------------------------------------------
+# test_disk_cache
+#-------------------------------------------------------------------------
+
+def test_disk_cache( tmpdir, monkeypatch ):
+
+  src_file = tmpdir.join( 'blocks.py' )
+  src_file.write( 'def logic():\n  return 1\n' )
+
+  def load():
+    linecache.checkcache( str( src_file ) )
+    return imp.load_source( 'ast_helpers_test_blocks', str( src_file ) )
+
+  monkeypatch.setattr( ast_helpers, '_ast_cache_dir', None )
+  set_ast_cache_dir( str( tmpdir.join( 'cache' ) ) )
+
+  try:
+
+    clear_ast_cache()
+    calls = count_getsource( monkeypatch )
+    func  = load().logic
+    assert get_method_src( func ) == 'def logic():\n  return 1\n'
+    assert get_cached_analysis( func, 'nstmts', lambda t: len( t.body ) ) == 1
+    assert len( calls ) == 1
+
+    # A new process (simulated by clearing the in-memory cache) finds
+    # the source and analyses on disk
+
+    clear_ast_cache()
+    func = load().logic
+    assert get_method_src( func ) == 'def logic():\n  return 1\n'
+    assert get_cached_analysis( func, 'nstmts', None ) == 1
+    assert len( calls ) == 1
+
+    # Changing the source file invalidates the cache
+
+    src_file.write( 'def logic():\n  x = 1\n  return x\n' )
+
+    clear_ast_cache()
+    func = load().logic
+    assert get_method_src( func ) == 'def logic():\n  x = 1\n  return x\n'
+    assert get_cached_analysis( func, 'nstmts', lambda t: len( t.body ) ) == 1
+    assert len( calls ) == 2
+
+  finally:
+    set_ast_cache_dir( None )
+    clear_ast_cache()
+
+#-------------------------------------------------------------------------
+# test_disk_cache_writes
+#-------------------------------------------------------------------------
+
+def test_disk_cache_writes( tmpdir, monkeypatch ):
+
+  src_file = tmpdir.join( 'blocks.py' )
+  src_file.write( ''.join( 'def logic{}():\n  return {}\n'.format( i, i )
+                           for i in range( 8 ) ) )
+
+  def load():
+    linecache.checkcache( str( src_file ) )
+    return imp.load_source( 'ast_helpers_test_blocks', str( src_file ) )
+
+  writes = []
+  write_disk_file = ast_helpers._write_disk_file
+  def counted_write_disk_file( disk_file ):
+    writes.append( disk_file['path'] )
+    write_disk_file( disk_file )
+
+  monkeypatch.setattr( ast_helpers, '_ast_cache_dir', None )
+  monkeypatch.setattr( ast_helpers, '_write_disk_file', counted_write_disk_file )
+  set_ast_cache_dir( str( tmpdir.join( 'cache' ) ) )
+
+  try:
+
+    # Entries are only written when flushed, once per source file
+
+    clear_ast_cache()
+    module = load()
+    for i in range( 8 ):
+      func = getattr( module, 'logic{}'.format( i ) )
+      get_cached_analysis( func, 'nstmts', lambda t: len( t.body ) )
+    assert writes == []
+
+    flush_ast_cache()
+    flush_ast_cache()
+    assert len( writes ) == 1
+    path = writes[0]
+    data = open( path, 'rb' ).read()
+
+    # Entries written by another process since the file was loaded are
+    # merged rather than dropped
+
+    tmpdir.join( 'cache' ).remove()
+    clear_ast_cache()
+    module = load()
+    get_method_src( module.logic0 )
+    tmpdir.join( 'cache' ).ensure( dir=True )
+    open( path, 'wb' ).write( data )
+    flush_ast_cache()
+
+    clear_ast_cache()
+    calls  = count_getsource( monkeypatch )
+    module = load()
+    for i in range( 8 ):
+      func = getattr( module, 'logic{}'.format( i ) )
+      assert get_cached_analysis( func, 'nstmts', None ) == 1
+    assert calls == []
+
+  finally:
+    set_ast_cache_dir( None )
+    clear_ast_cache()
@@ -0,0 +1,222 @@
+#=======================================================================
+# SignalStorage.py
+#=======================================================================
+# Compact array-backed storage for SimulationTool nets.
+#
+# By default insert_signal_values() creates a separate Bits object for
+# every net, plus a second Bits object for its _next shadow state, each
+# carrying its own nbits, _max, _min, _mask, slice and _target_bits
+# attributes in an instance dictionary. SignalStorage instead keeps the
+# current and next values of all nets in two flat lists indexed by net
+# id, and hands model code lightweight views of them: slotted subclasses
+# of the net's dtype whose per-width constants live on the class and
+# whose _uint attribute reads and writes the shared list.
+#
+# Values are stored in Python lists rather than array.array since nets
+# may be wider than a machine word.
+
+from pymtl.datatypes.Bits        import Bits, BitSlice
+from pymtl.datatypes.SignalValue import SignalValue
+
+#-----------------------------------------------------------------------
+# SignalStorage
+#-----------------------------------------------------------------------
+class SignalStorage( object ):
+
+  #---------------------------------------------------------------------
+  # __init__
+  #---------------------------------------------------------------------
+  # The add_event function is called with the view of a net every time
+  # a combinational update is made to it (see SimulationTool.add_event).
+  def __init__( self, add_event ):
+    self.add_event = add_event
+    self.values    = []   # current value of each net
+    self.nexts     = []   # next (shadow) value of each net
+    self.views     = []   # view object handed out for each net
+    self.dirty     = []   # ids of nets whose .next has been written
+    self._classes  = {}
+
+  #---------------------------------------------------------------------
+  # __len__
+  #---------------------------------------------------------------------
+  def __len__( self ):
+    return len( self.values )
+
+  #---------------------------------------------------------------------
+  # supports
+  #---------------------------------------------------------------------
+  # Returns True if nets of the provided dtype can be placed in storage.
+  # Other SignalValue types (e.g. wrapped Python objects) must fall back
+  # to the default per-object representation.
+  def supports( self, dtype ):
+    return isinstance( dtype, Bits ) and not isinstance( dtype, BitSlice )
+
+  #---------------------------------------------------------------------
+  # create_value
+  #---------------------------------------------------------------------
+  # Allocate a new net for the provided dtype and return its view.
+  def create_value( self, dtype ):
+
+    value_cls, next_cls = self._get_view_classes( dtype )
+
+    idx = len( self.values )
+    self.values.append( 0 )
+    self.nexts .append( 0 )
+
+    svalue = object.__new__( value_cls )
+    svalue._idx                   = idx
+    svalue._callbacks             = SignalValue._callbacks
+    svalue._slices                = SignalValue._slices
+    svalue.constant               = False
+    svalue.notify_sim_comb_update = _no_update
+
+    svalue._next = object.__new__( next_cls )
+    svalue._next._idx = idx
+
+    self.views.append( svalue )
+    return svalue
+
+  #---------------------------------------------------------------------
+  # flop
+  #---------------------------------------------------------------------
+  # Copy the next value of every dirty net into its current value, then
+  # notify the simulator of the nets which actually changed. Nets written
+  # more than once per cycle appear multiple times in the dirty list but
+  # only compare unequal (and are notified) the first time.
+  def flop( self ):
+
+    values  = self.values
+    nexts   = self.nexts
+    changed = []
+
+    for idx in self.dirty:
+      next_value = nexts[ idx ]
+      if values[ idx ] != next_value:
+        values[ idx ] = next_value
+        changed.append( idx )
+
+    del self.dirty[:]
+
+    views = self.views
+    for idx in changed:
+      svalue = views[ idx ]
+      svalue.notify_sim_comb_update()
+      for func in svalue._slices: func()
+
+  #---------------------------------------------------------------------
+  # _get_view_classes
+  #---------------------------------------------------------------------
+  # Return the (value, next) view classes for a dtype, creating them the
+  # first time a given dtype class and bitwidth is seen.
+  def _get_view_classes( self, dtype ):
+
+    base  = type( dtype )
+    nbits = dtype.nbits
+    key   = ( base, nbits )
+
+    if key not in self._classes:
+
+      consts = {
+        'nbits'    : nbits,
+        '_max'     : (2**nbits) - 1,
+        '_min'     : -2**(nbits - 1) if nbits > 1 else 0,
+        '_mask'    : (1 << nbits) - 1,
+        '_base'    : base,
+        '_storage' : self,
+        '__module__' : base.__module__,
+      }
+
+      value_dict = dict( consts, _values = self.values, _nexts = self.nexts,
+                         __slots__ = ( '_idx', '_next',
+                                       '_callbacks', '_slices', 'constant',
+                                       'notify_sim_comb_update' ) )
+      next_dict  = dict( consts, _values = self.nexts,
+                         __slots__ = ( '_idx', ) )
+
+      # Keep the name of the dtype class, BitStruct hashes depend on it
+
+      value_cls = type( base.__name__, ( _ValueView, base ), value_dict )
+      next_cls  = type( base.__name__, ( _NextView,  base ), next_dict  )
+
+      self._classes[ key ] = ( value_cls, next_cls )
+
+    return self._classes[ key ]
+
+#-----------------------------------------------------------------------
+# _no_update
+#-----------------------------------------------------------------------
+# Default notify_sim_comb_update for nets no @combinational block is
+# sensitive to (mirrors the no-op SignalValue.notify_sim_comb_update).
+def _no_update():
+  pass
+
+#-----------------------------------------------------------------------
+# _View
+#-----------------------------------------------------------------------
+# Behavior shared by value and next views. Subclasses created by
+# SignalStorage provide the _values list and per-width constants.
+class _View( object ):
+
+  __slots__ = ()
+
+  @property
+  def _uint( self ):
+    return self._values[ self._idx ]
+  @_uint.setter
+  def _uint( self, value ):
+    self._values[ self._idx ] = value
+
+  # Calling, copying or slicing ([:]) a view must produce a detached
+  # value of the underlying dtype rather than another view.
+
+  def __call__( self ):
+    return self._base( self.nbits )
+
+  def __copy__( self ):
+    return self._base( self.nbits, self._values[ self._idx ] )
+
+  def __deepcopy__( self, memo ):
+    return self.__copy__()
+
+#-----------------------------------------------------------------------
+# _NextView
+#-----------------------------------------------------------------------
+# View of the next (shadow) value of a net.
+class _NextView( _View ):
+
+  __slots__ = ()
+
+#-----------------------------------------------------------------------
+# _ValueView
+#-----------------------------------------------------------------------
+# View of the current value of a net, this is the object placed in the
+# model in place of each Signal.
+class _ValueView( _View ):
+
+  __slots__ = ()
+
+  def write_value( self, value ):
+    value = int( value )
+    if not (self._min <= value <= self._max):
+      Bits.write_value( self, value )   # raises ValueError
+    self._values[ self._idx ] = value & self._mask
+
+  def write_next( self, value ):
+    value = int( value )
+    if not (self._min <= value <= self._max):
+      Bits.write_next( self, value )    # raises ValueError
+    self._nexts[ self._idx ] = value & self._mask
+
+  def flop( self ):
+    idx        = self._idx
+    next_value = self._nexts[ idx ]
+    if self._values[ idx ] != next_value:
+      self._values[ idx ] = next_value
+      self.notify_sim_comb_update()
+      for func in self._slices: func()
+
+  def notify_sim_seq_update( self ):
+    self._storage.dirty.append( self._idx )
+
+  def _ucb( self ):
+    self._storage.add_event( self )
@@ -4,7 +4,59 @@
 
 from __future__ import print_function
 
+import array
+import bisect
+import collections
 import pickle
+import struct
+
+#-------------------------------------------------------------------------
+# Per-cycle metrics
+#-------------------------------------------------------------------------
+# Counters collected for every simulation cycle. Input counters are
+# collected before the clock edge (events caused by changes to the
+# inputs of the design), clock counters after it.
+
+INPUT_ADD_EVENTS = 0  # calls to add_event()
+INPUT_ADD_CALLBK = 1  # callbacks placed on the event queue
+INPUT_COMB_EVALS = 2  # evals executed
+CLOCK_ADD_EVENTS = 3
+CLOCK_ADD_CALLBK = 4
+CLOCK_COMB_EVALS = 5
+SLICE_COMB_EVALS = 6  # evals of slice connections
+REDUN_COMB_EVALS = 7  # evals of blocks which already ran this cycle
+SPLIT_EVALS      = 8  # evals of split blocks (see split_blocks.py)
+SPLIT_SAVED      = 9  # estimated evals saved by splitting blocks
+
+FIELDS = ( 'input_add_events', 'input_add_callbk', 'input_comb_evals',
+           'clock_add_events', 'clock_add_callbk', 'clock_comb_evals',
+           'slice_comb_evals', 'redun_comb_evals', 'split_evals',
+           'split_saved' )
+
+# Histograms have fixed power of two buckets: bucket 0 counts cycles
+# with a value <= 0, bucket k cycles with 2**(k-1) <= value < 2**k and
+# the last bucket all larger values.
+
+HISTOGRAM_BUCKETS = 18
+
+_BUCKET_BOUNDS = [ 2**k for k in range( HISTOGRAM_BUCKETS-1 ) ]
+
+# Counters of ended cycles are folded into the aggregates in batches of
+# up to this many cycles.
+
+_FOLD_EVERY = 1024
+
+# Binary records written by SimulationMetrics: the cycle number followed
+# by the counters, after a single header line naming the counters.
+
+_RECORD_HEADER = 'pymtl-metrics'
+_RECORD        = struct.Struct( '<Q' + 'i' * len( FIELDS ) )
+
+#-------------------------------------------------------------------------
+# _per_cycle
+#-------------------------------------------------------------------------
+def _per_cycle( field ):
+  return property( lambda self: self.get_history( field ) )
 
 #-------------------------------------------------------------------------
 # SimulationMetrics
@@ -12,12 +64,38 @@ import pickle
 # Utility class for storing various SimulationTool metrics. Useful for
 # gaining insight into simulator performace and determining the simulation
 # efficiency of hardware model implementations.
+#
+# Metrics are streamed: the counters of each cycle are folded into
+# running totals, maxima and histograms when the cycle ends, so the
+# summary printed by print_metrics() does not depend on how many cycles
+# were kept. The counters of individual cycles are kept according to
+# history:
+#
+# - None: keep all cycles (the default)
+# - N:    keep the last N cycles in a ring buffer (0 keeps none)
+#
+# If flush_file is given, the counters of every cycle are also written
+# to that file, flush_every cycles at a time, as CSV if the file name
+# ends with '.csv' and as compact binary records otherwise (see
+# read_metrics_records). Long simulations can bound memory use with:
+#
+#   metrics = SimulationMetrics( history=1000, flush_file='metrics.bin' )
+#   sim     = SimulationTool( model, collect_metrics=metrics )
+#   ...
+#   metrics.close()
+#
 class SimulationMetrics( object ):
 
   #-----------------------------------------------------------------------
   # __init__
   #-----------------------------------------------------------------------
-  def __init__( self ):
+  def __init__( self, history = None, flush_file = None, flush_every = 4096 ):
+
+    if history is not None and history < 0:
+      raise ValueError( "history must be None or a non-negative integer!" )
+    if flush_every < 1:
+      raise ValueError( "flush_every must be a positive integer!" )
+
     self._ncycles                                = 0
     self._pre_tick                               = True
     self.num_modules                             = 0
@@ -25,16 +103,74 @@ class SimulationMetrics( object ):
     self.num_posedge_clk_blocks                  = 0
     self.num_combinational_blocks                = 0
     self.num_slice_blocks                        = 0
-    self.input_add_events_per_cycle              = [ 0 ]
-    self.clock_add_events_per_cycle              = [ 0 ]
-    self.input_add_callbk_per_cycle              = [ 0 ]
-    self.clock_add_callbk_per_cycle              = [ 0 ]
-    self.input_comb_evals_per_cycle              = [ 0 ]
-    self.clock_comb_evals_per_cycle              = [ 0 ]
-    self.slice_comb_evals_per_cycle              = [ 0 ]
-    self.redun_comb_evals_per_cycle              = [ 0 ]
     self.is_slice                                = dict()
-    self.has_run                                 = dict()
+    self.has_run                                 = set()
+    self.eval_names                              = dict()
+    self.split_blocks                            = dict()
+    self.block_evals                             = collections.Counter()
+    self.block_active                            = collections.Counter()
+    self._cur_eval                               = None
+    self._cur_active                             = False
+    self._split_run                              = set()
+
+    # Counters of the current cycle and aggregates of all ended cycles
+
+    nfields = len( FIELDS )
+    self._counts     = [ 0 ] * nfields
+    self._totals     = [ 0 ] * nfields
+    self._maxima     = [ 0 ] * nfields
+    self._histograms = [ [ 0 ] * HISTOGRAM_BUCKETS for _ in FIELDS ]
+    self._add_events = INPUT_ADD_EVENTS
+    self._add_callbk = INPUT_ADD_CALLBK
+    self._comb_evals = INPUT_COMB_EVALS
+
+    # Counters of ended cycles which have not been folded yet
+
+    self._pending    = []
+    self._fold_every = _FOLD_EVERY
+
+    # Counters of individual cycles: all cycles are kept in one column
+    # per counter, the last cycles in a ring buffer of counter lists
+
+    self.history     = history
+    self._columns    = None
+    self._ring       = None
+    if history is None:
+      self._columns  = [ array.array( 'l' ) for _ in FIELDS ]
+    else:
+      self._ring     = collections.deque( maxlen=history )
+
+    # Records waiting to be written to the flush file
+
+    self.flush_file  = flush_file
+    self.flush_every = flush_every
+    self._records    = []
+    self._fd         = None
+    if flush_file is not None:
+      self._csv = flush_file.endswith( '.csv' )
+      self._fd  = open( flush_file, 'w' if self._csv else 'wb' )
+      if self._csv:
+        self._fd.write( ','.join( ( 'cycle', ) + FIELDS ) + '\n' )
+      else:
+        self._fd.write( ' '.join( ( _RECORD_HEADER, ) + FIELDS ) + '\n' )
+      self._fold_every = min( flush_every, _FOLD_EVERY )
+
+  #-----------------------------------------------------------------------
+  # Per-cycle counters
+  #-----------------------------------------------------------------------
+  # Lists with the value of a counter for each cycle kept in the history
+  # followed by its value for the current cycle.
+
+  input_add_events_per_cycle = _per_cycle( INPUT_ADD_EVENTS )
+  input_add_callbk_per_cycle = _per_cycle( INPUT_ADD_CALLBK )
+  input_comb_evals_per_cycle = _per_cycle( INPUT_COMB_EVALS )
+  clock_add_events_per_cycle = _per_cycle( CLOCK_ADD_EVENTS )
+  clock_add_callbk_per_cycle = _per_cycle( CLOCK_ADD_CALLBK )
+  clock_comb_evals_per_cycle = _per_cycle( CLOCK_COMB_EVALS )
+  slice_comb_evals_per_cycle = _per_cycle( SLICE_COMB_EVALS )
+  redun_comb_evals_per_cycle = _per_cycle( REDUN_COMB_EVALS )
+  split_evals_per_cycle      = _per_cycle( SPLIT_EVALS      )
+  split_saved_per_cycle      = _per_cycle( SPLIT_SAVED      )
 
   #-----------------------------------------------------------------------
   # comb_evals_per_cycle
@@ -52,6 +188,50 @@ class SimulationMetrics( object ):
     return [ x+y for x,y in zip( self.input_add_events_per_cycle,
                                  self.clock_add_events_per_cycle ) ]
 
+  #-----------------------------------------------------------------------
+  # get_history
+  #-----------------------------------------------------------------------
+  # Returns the values of a counter (an index into FIELDS) for the cycles
+  # kept in the history, oldest first, followed by its value for the
+  # current cycle. The first value is for cycle first_history_cycle.
+  def get_history( self, field ):
+    self._fold()
+    if self._columns is not None:
+      values = self._columns[ field ].tolist()
+    else:
+      values = [ counts[ field ] for counts in self._ring ]
+    return values + [ self._counts[ field ] ]
+
+  @property
+  def first_history_cycle( self ):
+    if self.history is None:
+      return 0
+    return max( 0, self._ncycles - self.history )
+
+  #-----------------------------------------------------------------------
+  # get_total / get_max / get_histogram
+  #-----------------------------------------------------------------------
+  # Aggregates of a counter over all cycles. Totals include the current
+  # cycle, maxima and histograms only cycles which have ended. Histograms
+  # are returned as a list of ( min, max, cycles ) tuples, where max is
+  # None for the last bucket.
+
+  def get_total( self, field ):
+    self._fold()
+    return self._totals[ field ] + self._counts[ field ]
+
+  def get_max( self, field ):
+    self._fold()
+    return self._maxima[ field ]
+
+  def get_histogram( self, field ):
+    self._fold()
+    bounds = [ ( None, 0 ) ] + [ ( 2**(k-1), 2**k - 1 )
+                                 for k in range( 1, HISTOGRAM_BUCKETS ) ]
+    bounds[-1] = ( bounds[-1][0], None )
+    return [ ( lo, hi, n ) for ( lo, hi ), n
+                           in zip( bounds, self._histograms[ field ] ) ]
+
   #-----------------------------------------------------------------------
   # reg_model
   #-----------------------------------------------------------------------
@@ -62,15 +242,26 @@ class SimulationMetrics( object ):
     self.num_posedge_clk_blocks   += len( model.get_posedge_clk_blocks() )
     self.num_combinational_blocks += len( model.get_combinational_blocks() )
 
+  #-----------------------------------------------------------------------
+  # num_split_blocks
+  #-----------------------------------------------------------------------
+  @property
+  def num_split_blocks( self ):
+    return len( set( block for block, _ in self.split_blocks.values() ) )
+
   #-----------------------------------------------------------------------
   # reg_eval
   #-----------------------------------------------------------------------
-  # Register an eval block in the design.
-  def reg_eval( self, eval, is_slice = False ):
-    self.has_run [ eval ] = False
-    self.is_slice[ eval ] = is_slice
+  # Register an eval block in the design. Evals created by splitting a
+  # @combinational block (see split_blocks.py) provide split as a tuple
+  # of the name of that block and the number of evals it was split into.
+  def reg_eval( self, eval, is_slice = False, name = None, split = None ):
+    self.is_slice  [ eval ] = is_slice
+    self.eval_names[ eval ] = name or eval.__name__
     if is_slice:
       self.num_slice_blocks += 1
+    if split is not None:
+      self.split_blocks[ eval ] = split
 
   #-----------------------------------------------------------------------
   # incr_metrics_cycle
@@ -78,18 +269,56 @@ class SimulationMetrics( object ):
   # Should be called at the end of each simulation cycle. Initializes data
   # structure storage to collect data for the next simulation cycle.
   def incr_metrics_cycle( self ):
-    self._pre_tick                   = True
-    self._ncycles                   += 1
-    self.input_add_events_per_cycle += [ 0 ]
-    self.clock_add_events_per_cycle += [ 0 ]
-    self.input_add_callbk_per_cycle += [ 0 ]
-    self.clock_add_callbk_per_cycle += [ 0 ]
-    self.input_comb_evals_per_cycle += [ 0 ]
-    self.clock_comb_evals_per_cycle += [ 0 ]
-    self.slice_comb_evals_per_cycle += [ 0 ]
-    self.redun_comb_evals_per_cycle += [ 0 ]
-    for key in self.has_run:
-      self.has_run[ key ] = False
+
+    self._pending.append( self._counts )
+    self._pre_tick   = True
+    self._add_events = INPUT_ADD_EVENTS
+    self._add_callbk = INPUT_ADD_CALLBK
+    self._comb_evals = INPUT_COMB_EVALS
+    self._ncycles   += 1
+    self._counts     = [ 0 ] * len( FIELDS )
+    self._split_run.clear()
+    self.has_run.clear()
+
+    if len( self._pending ) >= self._fold_every:
+      self._fold()
+
+  #-----------------------------------------------------------------------
+  # _fold
+  #-----------------------------------------------------------------------
+  # Fold the counters of the pending cycles into the aggregates, history
+  # and flush file records. Works on whole columns at a time, which is
+  # much faster than updating the aggregates at the end of every cycle.
+  def _fold( self ):
+
+    pending = self._pending
+    if not pending:
+      return
+
+    for field, column in enumerate( zip( *pending ) ):
+      self._totals[ field ] += sum( column )
+      self._maxima[ field ]  = max( self._maxima[ field ], max( column ) )
+      values = sorted( column )
+      prev   = 0
+      for bucket, bound in enumerate( _BUCKET_BOUNDS ):
+        pos = bisect.bisect_left( values, bound, prev )
+        self._histograms[ field ][ bucket ] += pos - prev
+        prev = pos
+      self._histograms[ field ][ -1 ] += len( values ) - prev
+      if self._columns is not None:
+        self._columns[ field ].extend( column )
+
+    if self._ring is not None:
+      self._ring.extend( pending )
+
+    if self._fd is not None:
+      first = self._ncycles - len( pending )
+      self._records.extend( [ cycle ] + counts for cycle, counts
+                            in enumerate( pending, first ) )
+      if len( self._records ) >= self.flush_every:
+        self._write_records()
+
+    self._pending = []
 
   #-----------------------------------------------------------------------
   # start_tick
@@ -97,17 +326,24 @@ class SimulationMetrics( object ):
   # Should be called before sequential logic blocks are executed.  Allows
   # collection of unique metrics for each phase of eval execution.
   def start_tick( self ):
-    self._pre_tick                   = False
+    self._pre_tick   = False
+    self._add_events = CLOCK_ADD_EVENTS
+    self._add_callbk = CLOCK_ADD_CALLBK
+    self._comb_evals = CLOCK_COMB_EVALS
+    self._split_run.clear()
 
   #-----------------------------------------------------------------------
   # incr_add_events
   #-----------------------------------------------------------------------
-  # Increment the number of times add_event() was called.
-  def incr_add_events( self ):
-    if self._pre_tick:
-      self.input_add_events_per_cycle[ self._ncycles ] += 1
-    else:
-      self.clock_add_events_per_cycle[ self._ncycles ] += 1
+  # Increment the number of times add_event() was called. If the event
+  # was caused by an eval, the eval is counted as active (it changed a
+  # signal read by other blocks) in this evaluation.
+  def incr_add_events( self, eval = None ):
+    self._counts[ self._add_events ] += 1
+
+    if eval is not None and eval is self._cur_eval and not self._cur_active:
+      self._cur_active = True
+      self.block_active[ eval ] += 1
 
   #-----------------------------------------------------------------------
   # incr_add_events
@@ -115,33 +351,87 @@ class SimulationMetrics( object ):
   # Increment the number of callbacks we attempted to place on the event
   # queue.
   def incr_add_callbk( self ):
-    if self._pre_tick:
-      self.input_add_callbk_per_cycle[ self._ncycles ] += 1
-    else:
-      self.clock_add_callbk_per_cycle[ self._ncycles ] += 1
+    self._counts[ self._add_callbk ] += 1
 
   #-----------------------------------------------------------------------
   # incr_comb_evals
   #-----------------------------------------------------------------------
   # Increment the number of evals we actually executed.
   def incr_comb_evals( self, eval ):
-    if self._pre_tick:
-      self.input_comb_evals_per_cycle[ self._ncycles ] += 1
-    else:
-      self.clock_comb_evals_per_cycle[ self._ncycles ] += 1
+    counts = self._counts
+    counts[ self._comb_evals ] += 1
 
-    if   self.has_run[ eval ]:
-      self.redun_comb_evals_per_cycle[ self._ncycles ] += 1
+    if   eval in self.has_run:
+      counts[ REDUN_COMB_EVALS ] += 1
     else:
-      self.has_run[ eval ] = True
+      self.has_run.add( eval )
 
     if   self.is_slice[ eval ]:
-      self.slice_comb_evals_per_cycle[ self._ncycles ] += 1
+      counts[ SLICE_COMB_EVALS ] += 1
+
+    self.block_evals[ eval ] += 1
+    self._cur_eval   = eval
+    self._cur_active = False
+
+    # Without splitting, the whole block would have been evaluated (at
+    # least) once in each phase of the cycle in which any of its inputs
+    # changed, so the savings are estimated as the number of evals the
+    # block was split into for each such phase minus the evals executed.
+
+    if eval in self.split_blocks:
+      block, nsplit = self.split_blocks[ eval ]
+      counts[ SPLIT_EVALS ] += 1
+      counts[ SPLIT_SAVED ] -= 1
+      if block not in self._split_run:
+        self._split_run.add( block )
+        counts[ SPLIT_SAVED ] += nsplit
+
+  #-----------------------------------------------------------------------
+  # get_block_activity
+  #-----------------------------------------------------------------------
+  # Returns a list of ( name, evals, active evals ) tuples for every eval
+  # which has been executed, sorted by decreasing number of evals. An
+  # eval is active if it changed a signal read by another block, so
+  # evals which are rarely active are good candidates for optimization.
+  def get_block_activity( self ):
+    activity = [ ( self.eval_names[ eval ], n, self.block_active[ eval ] )
+                 for eval, n in self.block_evals.items() ]
+    return sorted( activity, key=lambda x: ( -x[1], x[0] ) )
+
+  #-----------------------------------------------------------------------
+  # flush / close
+  #-----------------------------------------------------------------------
+  # Write the records of ended cycles to the flush file. Records are
+  # written automatically about every flush_every cycles, close() writes
+  # the remaining records and closes the file.
+
+  def flush( self ):
+    self._fold()
+    self._write_records()
+
+  def close( self ):
+    if self._fd is not None:
+      self.flush()
+      self._fd.close()
+      self._fd = None
+
+  def _write_records( self ):
+    if self._fd is None:
+      return
+    if self._csv:
+      self._fd.write( ''.join( ','.join( map( str, record ) ) + '\n'
+                               for record in self._records ) )
+    else:
+      self._fd.write( ''.join( _RECORD.pack( *record )
+                               for record in self._records ) )
+    self._fd.flush()
+    del self._records[:]
 
   #-----------------------------------------------------------------------
   # print_metrics
   #-----------------------------------------------------------------------
-  # Print metrics to the commandline.
+  # Print metrics to the commandline. The summary is computed from the
+  # aggregates, the detailed view also prints the cycles in the history.
   def print_metrics( self, detailed = True ):
     print("-"*72)
     print("Simulation Metrics")
@@ -153,6 +443,19 @@ class SimulationMetrics( object ):
     print("@posedge_clk blocks:   {:4}".format(self.num_posedge_clk_blocks  ))
     print("@combinational blocks: {:4}".format(self.num_combinational_blocks))
     print("slice blocks:          {:4}".format(self.num_slice_blocks        ))
+    print("split blocks:          {:4}".format(self.num_split_blocks        ))
+    if self.split_blocks:
+      print("split evals:           {:4}".format(self.get_total( SPLIT_EVALS )))
+      print("split evals saved:     {:4}".format(self.get_total( SPLIT_SAVED )))
+    print()
+    print("counter                   total        mean      max")
+    print("----------------  ------------  ----------  -------")
+    for field, name in enumerate( FIELDS ):
+      if field in ( SPLIT_EVALS, SPLIT_SAVED ) and not self.split_blocks:
+        continue
+      total = self.get_total( field )
+      print("{:16}  {:12}  {:10.2f}  {:7}".format( name, total,
+            float( total ) / max( self._ncycles, 1 ), self.get_max( field ) ))
     print("-"*72)
     if not detailed:
       return
@@ -160,29 +463,71 @@ class SimulationMetrics( object ):
     print("          pre-tick          post-tick         other       ")
     print("cycle     adde  clbk  eval  adde  clbk  eval  slice  redun")
     print("--------  ----  ----  ----  ----  ----  ----  -----  -----")
-    for i in range( self._ncycles ):
+    columns = [ self.get_history( field )[:-1] for field in range( 8 ) ]
+    for i, row in enumerate( zip( *columns ), self.first_history_cycle ):
       print("{:8}  {:4}  {:4}  {:4}  {:4}  {:4}  {:4}  {:5}  {:5}".format(
-                   i, self.input_add_events_per_cycle[ i ],
-                      self.input_add_callbk_per_cycle[ i ],
-                      self.input_comb_evals_per_cycle[ i ],
-                      self.clock_add_events_per_cycle[ i ],
-                      self.clock_add_callbk_per_cycle[ i ],
-                      self.clock_comb_evals_per_cycle[ i ],
-                      self.slice_comb_evals_per_cycle[ i ],
-                      self.redun_comb_evals_per_cycle[ i ],
-                   ))
+                   i, *row ))
+    print("-"*72)
+    print()
+    print("block                                              evals  active")
+    print("-------------------------------------------------  -----  ------")
+    for name, evals, active in self.get_block_activity()[:20]:
+      print("{:49}  {:5}  {:6}".format( name[-49:], evals, active ))
     print("-"*72)
 
+  #-----------------------------------------------------------------------
+  # write_histograms
+  #-----------------------------------------------------------------------
+  # Write the histograms of all counters to a CSV file with one row per
+  # counter and bucket.
+  def write_histograms( self, filename ):
+    with open( filename, 'w' ) as fd:
+      fd.write( 'counter,min,max,cycles\n' )
+      for field, name in enumerate( FIELDS ):
+        for lo, hi, n in self.get_histogram( field ):
+          fd.write( '{},{},{},{}\n'.format( name, '' if lo is None else lo,
+                                            '' if hi is None else hi, n ) )
+
   #-----------------------------------------------------------------------
   # pickle_metrics
   #-----------------------------------------------------------------------
   # Pickle metrics to a file.  Useful for loading in Python later for
   # for creating matplotlib plots.
   def pickle_metrics( self, filename ):
+    self.close()
+    self.block_activity = self.get_block_activity()
     del self.is_slice
     del self.has_run
+    del self.eval_names
+    del self.split_blocks
+    del self.block_evals
+    del self.block_active
+    del self._cur_eval
     pickle.dump( self, open( filename, 'wb' ) )
 
+#-------------------------------------------------------------------------
+# read_metrics_records
+#-------------------------------------------------------------------------
+# Generator reading the records written by SimulationMetrics to a flush
+# file, yielding a ( cycle, counters... ) tuple for each cycle, with the
+# counters in the order of FIELDS.
+def read_metrics_records( filename ):
+  with open( filename, 'rb' ) as fd:
+    header = fd.readline().split()
+    if header[0] == _RECORD_HEADER:
+      if tuple( header[1:] ) != FIELDS:
+        raise ValueError( "Unknown metrics record format in {}!"
+                          .format( filename ) )
+      while True:
+        data = fd.read( _RECORD.size * 4096 )
+        if not data:
+          break
+        for i in range( 0, len( data ), _RECORD.size ):
+          yield _RECORD.unpack_from( data, i )
+    else:
+      for line in fd:
+        yield tuple( int( x ) for x in line.split( ',' ) )
+
 #-------------------------------------------------------------------------
 # DummyMetrics
 #-------------------------------------------------------------------------
@@ -194,9 +539,11 @@ class SimulationMetrics( object ):
 class DummyMetrics( object ):
 
   def reg_model( self, model ): pass
-  def reg_eval( self, eval, is_slice = False ): pass
+  def reg_eval( self, eval, is_slice = False, name = None, split = None ): pass
   def incr_metrics_cycle( self ): pass
   def start_tick( self ): pass
-  def incr_add_events( self ): pass
+  def incr_add_events( self, eval = None ): pass
   def incr_add_callbk( self ): pass
   def incr_comb_evals( self, eval ): pass
+  def flush( self ): pass
+  def close( self ): pass
@@ -0,0 +1,145 @@
+#=========================================================================
+# SimulationMetrics_test.py
+#=========================================================================
+
+import pytest
+
+from pymtl import *
+
+from SimulationMetrics import SimulationMetrics, read_metrics_records
+from SimulationMetrics import FIELDS, INPUT_COMB_EVALS, CLOCK_COMB_EVALS
+
+#-------------------------------------------------------------------------
+# Counter
+#-------------------------------------------------------------------------
+class Counter( Model ):
+  def __init__( s ):
+    s.en    = InPort ( 1 )
+    s.count = OutPort( 8 )
+    s.plus1 = Wire   ( 8 )
+
+    @s.combinational
+    def comb_logic():
+      s.plus1.value = s.count + 1
+
+    @s.tick
+    def seq_logic():
+      if s.en:
+        s.count.next = s.plus1
+
+def run_counter( metrics, ncycles ):
+  model = Counter()
+  model.elaborate()
+  sim   = SimulationTool( model, collect_metrics=metrics )
+  sim.reset()
+  model.en.value = 1
+  for i in range( ncycles ):
+    sim.cycle()
+  return model, sim
+
+#-------------------------------------------------------------------------
+# test_aggregates
+#-------------------------------------------------------------------------
+def test_aggregates():
+  metrics    = SimulationMetrics()
+  model, sim = run_counter( metrics, 10 )
+
+  assert sim.metrics is metrics
+  assert metrics._ncycles == 12
+  assert model.count == 10
+
+  # Unbounded history keeps every cycle, plus the current one
+
+  evals = metrics.clock_comb_evals_per_cycle
+  assert len( evals ) == 13
+  assert sum( evals ) == metrics.get_total( CLOCK_COMB_EVALS )
+  assert max( evals ) == metrics.get_max  ( CLOCK_COMB_EVALS )
+
+  # Every cycle lands in exactly one histogram bucket
+
+  for field in range( len( FIELDS ) ):
+    assert sum( n for _, _, n in metrics.get_histogram( field ) ) == 12
+
+  buckets = metrics.get_histogram( CLOCK_COMB_EVALS )
+  assert buckets[0][:2] == ( None, 0 )
+  assert buckets[1][:2] == ( 1, 1 )
+  assert buckets[2][:2] == ( 2, 3 )
+  assert buckets[-1][1] is None
+  for lo, hi, n in buckets:
+    expected = sum( 1 for x in evals[:-1] if ( lo is None or x >= lo )
+                                         and ( hi is None or x <= hi ) )
+    assert n == expected
+
+#-------------------------------------------------------------------------
+# test_ring_buffer
+#-------------------------------------------------------------------------
+def test_ring_buffer():
+  full       = SimulationMetrics()
+  model, sim = run_counter( full, 20 )
+  ring       = SimulationMetrics( history=5 )
+  model, sim = run_counter( ring, 20 )
+
+  assert ring.first_history_cycle == 22 - 5
+  for field in range( len( FIELDS ) ):
+    assert ring.get_history( field ) == full.get_history( field )[-6:]
+    assert ring.get_total  ( field ) == full.get_total  ( field )
+    assert ring.get_max    ( field ) == full.get_max    ( field )
+
+  none       = SimulationMetrics( history=0 )
+  model, sim = run_counter( none, 20 )
+  assert none.input_comb_evals_per_cycle == [ 0 ]
+  assert none.get_total( INPUT_COMB_EVALS ) == full.get_total( INPUT_COMB_EVALS )
+
+  with pytest.raises( ValueError ):
+    SimulationMetrics( history=-1 )
+
+#-------------------------------------------------------------------------
+# test_flush_file
+#-------------------------------------------------------------------------
+@pytest.mark.parametrize( 'ext', [ 'bin', 'csv' ] )
+def test_flush_file( tmpdir, ext ):
+  filename   = str( tmpdir.join( 'metrics.' + ext ) )
+  metrics    = SimulationMetrics( history=0, flush_file=filename,
+                                  flush_every=4 )
+  model, sim = run_counter( metrics, 10 )
+
+  # Only complete batches have been written before closing
+
+  assert len( list( read_metrics_records( filename ) ) ) == 12
+  model.en.value = 0
+  sim.cycle()
+  assert len( list( read_metrics_records( filename ) ) ) == 12
+  metrics.close()
+
+  records = list( read_metrics_records( filename ) )
+  assert [ r[0] for r in records ] == range( 13 )
+
+  full       = SimulationMetrics()
+  model, sim = run_counter( full, 10 )
+  model.en.value = 0
+  sim.cycle()
+  for field in range( len( FIELDS ) ):
+    assert [ r[ field+1 ] for r in records ] \
+           == full.get_history( field )[:-1]
+
+#-------------------------------------------------------------------------
+# test_write_histograms
+#-------------------------------------------------------------------------
+def test_write_histograms( tmpdir, capsys ):
+  metrics    = SimulationMetrics( history=3 )
+  model, sim = run_counter( metrics, 10 )
+
+  filename = str( tmpdir.join( 'hist.csv' ) )
+  metrics.write_histograms( filename )
+  lines = open( filename ).read().splitlines()
+  assert lines[0] == 'counter,min,max,cycles'
+  assert 'clock_comb_evals,1,1,' in ''.join( lines )
+  assert len( lines ) == 1 + len( FIELDS ) * len( metrics.get_histogram( 0 ) )
+
+  # The detailed view only prints the cycles kept in the history
+
+  metrics.print_metrics()
+  out = capsys.readouterr()[0]
+  rows = [ line.split()[0] for line in out.splitlines()
+           if line.split() and line.split()[0].isdigit() ]
+  assert rows == [ '9', '10', '11' ]
@@ -0,0 +1,169 @@
+#=========================================================================
+# SimulationProfiler.py
+#=========================================================================
+
+from __future__ import print_function
+
+import collections
+
+#-------------------------------------------------------------------------
+# SimulationProfiler
+#-------------------------------------------------------------------------
+# Attributes simulation time to the @tick, @posedge_clk and
+# @combinational blocks of a design and the model instances they belong
+# to. Enabled by creating the SimulationTool with profile=True, in which
+# case the simulator times every block it executes and accumulates the
+# time and number of calls of each block (see SimulationTool._prof_cycle).
+#
+# Only per-block totals are kept, so memory does not grow with the
+# length of the simulation. If sample_every is larger than one, only
+# one in every sample_every cycles is timed and the others run at full
+# speed, reported times and calls are those of the sampled cycles.
+#
+# Time spent in the simulator itself (event queue, register flops, etc.)
+# is reported as the '[simulator]' entry of the top-level model. The
+# profile can be written as collapsed stacks for flame graph tools:
+#
+#   sim = SimulationTool( model, profile=True )
+#   ...
+#   sim.profiler.print_profile()
+#   sim.profiler.write_flamegraph( 'sim.folded' )
+#
+#   $ flamegraph.pl sim.folded > sim.svg
+#
+class SimulationProfiler( object ):
+
+  #-----------------------------------------------------------------------
+  # __init__
+  #-----------------------------------------------------------------------
+  def __init__( self, sample_every = 1 ):
+
+    if sample_every < 1:
+      raise ValueError( "sample_every must be a positive integer!" )
+
+    self.sample_every = sample_every
+    self.ncycles      = 0     # number of sampled cycles
+    self.total_time   = 0.0   # time spent in sampled cycles/evals
+
+    self.paths        = []    # block id -> ( model path..., block name )
+    self.ncalls       = []    # block id -> number of calls
+    self.times        = []    # block id -> time spent in the block
+    self.ids          = {}    # block -> block id
+
+    self.sampling     = True  # is the current cycle being timed?
+    self._countdown   = 0
+
+  #-----------------------------------------------------------------------
+  # register
+  #-----------------------------------------------------------------------
+  # Register a block with the profiler. The path is a tuple of the names
+  # of the models containing the block, from the top-level model down.
+  def register( self, block, path, name ):
+    self.ids[ block ] = len( self.paths )
+    self.paths .append( tuple( path ) + ( name, ) )
+    self.ncalls.append( 0 )
+    self.times .append( 0.0 )
+
+  #-----------------------------------------------------------------------
+  # start_cycle
+  #-----------------------------------------------------------------------
+  # Called at the start of every cycle, returns True if the cycle should
+  # be timed.
+  def start_cycle( self ):
+    if self._countdown:
+      self._countdown -= 1
+      self.sampling    = False
+    else:
+      self._countdown  = self.sample_every - 1
+      self.sampling    = True
+      self.ncycles    += 1
+    return self.sampling
+
+  #-----------------------------------------------------------------------
+  # get_block_profile
+  #-----------------------------------------------------------------------
+  # Returns a list of ( path, calls, time ) tuples for every block which
+  # has been called, sorted by decreasing time. Blocks with the same path
+  # (e.g., all slice connections, registered as '[slices]') are merged.
+  # The simulator overhead is included as a block named '[simulator]' of
+  # the top-level model.
+  def get_block_profile( self ):
+
+    calls = collections.defaultdict( int   )
+    times = collections.defaultdict( float )
+    for path, ncalls, time in zip( self.paths, self.ncalls, self.times ):
+      if ncalls:
+        calls[ path ] += ncalls
+        times[ path ] += time
+
+    overhead = self.total_time - sum( self.times )
+    if self.paths and overhead > 0:
+      path = self.paths[0][:1] + ( '[simulator]', )
+      calls[ path ] = self.ncycles
+      times[ path ] = overhead
+
+    return sorted( [ ( path, calls[ path ], times[ path ] ) for path in calls ],
+                   key=lambda x: ( -x[2], x[0] ) )
+
+  #-----------------------------------------------------------------------
+  # get_model_profile
+  #-----------------------------------------------------------------------
+  # Returns a list of ( path, self time, total time ) tuples for every
+  # model instance, where total time includes all submodels, sorted by
+  # decreasing total time.
+  def get_model_profile( self ):
+
+    self_time  = collections.defaultdict( float )
+    total_time = collections.defaultdict( float )
+
+    for path, calls, time in self.get_block_profile():
+      model_path = path[:-1]
+      self_time[ model_path ] += time
+      for i in range( 1, len( model_path ) + 1 ):
+        total_time[ model_path[:i] ] += time
+
+    return sorted( [ ( path, self_time[ path ], time )
+                     for path, time in total_time.items() ],
+                   key=lambda x: ( -x[2], x[0] ) )
+
+  #-----------------------------------------------------------------------
+  # print_profile
+  #-----------------------------------------------------------------------
+  # Print the most expensive blocks and model instances.
+  def print_profile( self, nentries = 20 ):
+
+    def fmt( path ):
+      name = '.'.join( path )
+      return name if len( name ) <= 44 else '...' + name[-41:]
+
+    print("-"*72)
+    print("Simulation Profile")
+    print("-"*72)
+    print()
+    print("sampled cycles: {:9}".format( self.ncycles ))
+    print("sampled time:   {:9.3f}s".format( self.total_time ))
+    print()
+    print("block                                         calls        time")
+    print("--------------------------------------------  --------  ---------")
+    for path, calls, time in self.get_block_profile()[:nentries]:
+      print("{:44}  {:8}  {:8.3f}s".format( fmt( path ), calls, time ))
+    print()
+    print("model                                          self       total")
+    print("--------------------------------------------  ---------  ---------")
+    for path, self_time, time in self.get_model_profile()[:nentries]:
+      print("{:44}  {:8.3f}s  {:8.3f}s".format( fmt( path ), self_time, time ))
+    print("-"*72)
+
+  #-----------------------------------------------------------------------
+  # write_flamegraph
+  #-----------------------------------------------------------------------
+  # Write the profile in the collapsed stack format read by flame graph
+  # tools (e.g., flamegraph.pl, speedscope): one line per block with
+  # the semicolon separated path of the block and its time in
+  # microseconds.
+  def write_flamegraph( self, filename ):
+    with open( filename, 'w' ) as fd:
+      for path, calls, time in sorted( self.get_block_profile() ):
+        usecs = int( round( time * 1e6 ) )
+        if usecs:
+          fd.write( '{} {}\n'.format( ';'.join( path ), usecs ) )
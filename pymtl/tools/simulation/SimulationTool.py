@@ -12,10 +12,15 @@ import pprint
 import collections
 import inspect
 import warnings
+import heapq
+import timeit
 import sim_utils as sim
 
-from sys               import flags
-from SimulationMetrics import SimulationMetrics, DummyMetrics
+from sys                import flags
+from SimulationMetrics  import SimulationMetrics, DummyMetrics
+from SimulationProfiler import SimulationProfiler
+from SignalStorage      import SignalStorage
+from ..ast_helpers      import flush_ast_cache
 
 #-----------------------------------------------------------------------
 # SimulationTool
@@ -29,8 +34,24 @@ class SimulationTool( object ):
   #---------------------------------------------------------------------
   # __init__
   #---------------------------------------------------------------------
-  # Construct a simulator based on the provided model.
-  def __init__( self, model, collect_metrics = False ):
+  # Construct a simulator based on the provided model. If
+  # static_schedule is True, @combinational blocks are levelized at
+  # construction time and pending blocks are always evaluated in
+  # topological order, so each block in an acyclic design executes at
+  # most once per call to eval_combinational(). If codegen is True,
+  # specialized cycle() and eval_combinational() functions are generated
+  # and compiled for this design (see codegen.py). If array_storage is
+  # True, the values of all nets are kept in flat lists and model code
+  # is given lightweight views of them (see SignalStorage.py). If
+  # split_sensitivity is True, @combinational blocks consisting of a loop
+  # over a list of ports are evaluated one index at a time, only for the
+  # indices whose inputs changed (see split_blocks.py). If profile is
+  # True, the time spent in each block is collected in self.profiler,
+  # timing one in every profile_every cycles (see SimulationProfiler.py).
+  def __init__( self, model, collect_metrics = False, static_schedule = False,
+                codegen = False, array_storage = False,
+                split_sensitivity = False, profile = False,
+                profile_every = 1 ):
 
     # Check that the model has been elaborated
     if not model.is_elaborated():
@@ -38,13 +59,22 @@ class SimulationTool( object ):
                        "Provided model has not been elaborated yet!!!"
                        "".format( self.__class__.__name__ ) )
 
+    if profile and codegen:
+      raise ValueError( "Profiling is not supported with generated cycle "
+                        "functions (codegen=True)!" )
+
     self.model                = model
     self.ncycles              = 0
 
-    self._event_queue         = EventQueue()
+    if   not static_schedule: self._event_queue = EventQueue()
+    elif not codegen:         self._event_queue = LevelizedEventQueue()
+    else:                     self._event_queue = StaticEventQueue()
     self._sequential_blocks   = []
-    self._register_queue      = []
+    self._register_queue      = []   # ids of registers written this cycle
+    self._register_dirty      = bytearray()
+    self._registers           = []   # register id -> SignalValue
     self._current_func        = None
+    self._storage             = None
 
     self._nets                = None # TODO: remove me
 
@@ -52,13 +82,18 @@ class SimulationTool( object ):
 
 
     # Only collect metrics if they are enabled, otherwise replace
-    # with a dummy collection class.
+    # with a dummy collection class. A SimulationMetrics instance can be
+    # passed to configure how metrics are kept (see SimulationMetrics).
 
-    if collect_metrics:
+    if isinstance( collect_metrics, SimulationMetrics ):
+      self.metrics            = collect_metrics
+    elif collect_metrics:
       self.metrics            = SimulationMetrics()
     else:
       self.metrics            = DummyMetrics()
 
+    self.profiler             = None
+
     # If the -O flag was passed to Python, use the perf implementation
     # of cycle, otherwise use the dev version.
 
@@ -76,14 +111,48 @@ class SimulationTool( object ):
     nets, slice_connections = sim.signals_to_nets( signals )
     sequential_blocks       = sim.register_seq_blocks( model )
 
-    sim.insert_signal_values( self, nets )
+    if array_storage:
+      self._storage = SignalStorage( self.add_event )
+
+    sim.insert_signal_values( self, nets, self._storage )
 
-    sim.register_comb_blocks  ( model, self._event_queue )
+    sim.register_comb_blocks  ( model, self._event_queue, split_sensitivity )
+    slice_callbacks = \
     sim.create_slice_callbacks( slice_connections, self._event_queue )
     sim.register_cffi_updates ( model )
 
+    if collect_metrics:
+      sim.register_metrics( self.metrics, model, slice_callbacks )
+
     self._nets              = nets
     self._sequential_blocks = sequential_blocks
+    self._comb_schedule     = None
+
+    # Levelize the combinational logic if static scheduling is enabled
+
+    if static_schedule:
+      self._comb_schedule = sim.create_comb_schedule( model, slice_callbacks )
+      self._event_queue.set_levels( self._comb_schedule )
+
+    # Time blocks with the profiling versions of cycle() and
+    # eval_combinational(), which fall back to the versions selected
+    # above for cycles which are not sampled
+
+    if profile:
+      self.profiler = SimulationProfiler( profile_every )
+      sim.register_profiler( self.profiler, model, sequential_blocks,
+                             slice_callbacks )
+      self._unprofiled_cycle  = self.cycle
+      self._unprofiled_eval   = self.eval_combinational
+      self.cycle              = self._prof_cycle
+      self.eval_combinational = self._prof_eval
+
+    # Replace cycle() and eval_combinational() with generated versions
+
+    if codegen:
+      from codegen import create_cycle_funcs
+      self.cycle, self.eval_combinational = \
+        create_cycle_funcs( self, collect_metrics )
 
     # Setup vcd dumping if it's configured
 
@@ -91,6 +160,10 @@ class SimulationTool( object ):
       from vcd import VCDUtil
       VCDUtil( self, model.vcd_file )
 
+    # Save the analyses of any new blocks to the on-disk AST cache
+
+    flush_ast_cache()
+
   #---------------------------------------------------------------------
   # reset
   #---------------------------------------------------------------------
@@ -108,6 +181,76 @@ class SimulationTool( object ):
   def print_line_trace( self ):
     print( "{:>3}:".format( self.ncycles ), self.model.line_trace() )
 
+  #---------------------------------------------------------------------
+  # run
+  #---------------------------------------------------------------------
+  # Advances the simulator by up to ncycles clock cycles (or forever if
+  # ncycles is None) inside a single loop. If stop_when is provided it
+  # is called before every check_every-th cycle and the simulation stops
+  # as soon as it returns True. If trace_every is provided the line
+  # trace is printed before every trace_every-th cycle, otherwise line
+  # traces are never generated. Returns the number of cycles executed.
+  # A negative ncycles raises a ValueError.
+  #
+  # For example, the common test loop:
+  #
+  #   while not model.done() and sim.ncycles < max_cycles:
+  #     sim.print_line_trace()
+  #     sim.cycle()
+  #
+  # is equivalent to:
+  #
+  #   sim.run( max_cycles - sim.ncycles, model.done, trace_every=1 )
+  #
+  def run( self, ncycles, stop_when = None, trace_every = None,
+           check_every = 1 ):
+
+    if check_every < 1:
+      raise ValueError( "check_every must be a positive integer!" )
+    if ncycles is not None and ncycles < 0:
+      raise ValueError( "ncycles must not be negative!" )
+
+    cycle = self.cycle
+    start = self.ncycles
+
+    # Fast path: nothing to check or print, just call cycle()
+
+    if stop_when is None and not trace_every:
+      if ncycles is None:
+        raise ValueError( "run() needs ncycles or stop_when!" )
+      for _ in xrange( ncycles ):
+        cycle()
+      return self.ncycles - start
+
+    # General path: the counters are only compared against zero so the
+    # loop body stays cheap when the predicate/trace is rarely needed
+
+    print_line_trace = self.print_line_trace
+    check_every      = check_every if stop_when is not None else 0
+    trace_every      = trace_every or 0
+    check_count      = 0
+    trace_count      = 0
+    remaining        = -1 if ncycles is None else ncycles
+
+    while remaining:
+
+      if check_every:
+        if check_count == 0:
+          if stop_when(): break
+          check_count = check_every
+        check_count -= 1
+
+      if trace_every:
+        if trace_count == 0:
+          print_line_trace()
+          trace_count = trace_every
+        trace_count -= 1
+
+      cycle()
+      remaining -= 1
+
+    return self.ncycles - start
+
   #---------------------------------------------------------------------
   # cycle
   #---------------------------------------------------------------------
@@ -142,9 +285,7 @@ class SimulationTool( object ):
       func()
 
     # Then flop the shadow state on all registers
-    while self._register_queue:
-      reg = self._register_queue.pop()
-      reg.flop()
+    self._flop_registers()
 
     # Call all events generated by synchronous logic
     self.eval_combinational()
@@ -169,9 +310,7 @@ class SimulationTool( object ):
       func()
 
     # Then flop the shadow state on all registers
-    while self._register_queue:
-      reg = self._register_queue.pop()
-      reg.flop()
+    self._flop_registers()
 
     # Call all events generated by synchronous logic
     self.eval_combinational()
@@ -179,6 +318,107 @@ class SimulationTool( object ):
     # Increment the simulator cycle count
     self.ncycles += 1
 
+  #---------------------------------------------------------------------
+  # _prof_cycle
+  #---------------------------------------------------------------------
+  # Implementation of cycle() when profiling, times every sequential and
+  # combinational block in sampled cycles.
+  def _prof_cycle( self ):
+
+    profiler = self.profiler
+    if not profiler.start_cycle():
+      return self._unprofiled_cycle()
+
+    start = timeit.default_timer()
+
+    # Call all events generated by input changes
+    self._prof_eval_blocks()
+
+    # Clock generation needed by VCD tracing
+    if not flags.optimize:
+      self.model.clk.value = 0
+      self.model.clk.value = 1
+
+    self.metrics.start_tick()
+
+    # Call all rising edge triggered functions
+    ids    = profiler.ids
+    ncalls = profiler.ncalls
+    times  = profiler.times
+    for func in self._sequential_blocks:
+      i = ids[ func ]
+      t = timeit.default_timer()
+      func()
+      times [ i ] += timeit.default_timer() - t
+      ncalls[ i ] += 1
+
+    # Then flop the shadow state on all registers
+    self._flop_registers()
+
+    # Call all events generated by synchronous logic
+    self._prof_eval_blocks()
+
+    self.ncycles += 1
+    self.metrics.incr_metrics_cycle()
+
+    profiler.total_time += timeit.default_timer() - start
+
+  #---------------------------------------------------------------------
+  # _prof_eval
+  #---------------------------------------------------------------------
+  # Implementation of eval_combinational() when profiling.
+  def _prof_eval( self ):
+    if not self.profiler.sampling:
+      return self._unprofiled_eval()
+    start = timeit.default_timer()
+    self._prof_eval_blocks()
+    self.profiler.total_time += timeit.default_timer() - start
+
+  def _prof_eval_blocks( self ):
+    ids    = self.profiler.ids
+    ncalls = self.profiler.ncalls
+    times  = self.profiler.times
+    eq     = self._event_queue
+    while eq.len():
+      self._current_func = func = eq.deq()
+      self.metrics.incr_comb_evals( func )
+      i = ids[ func ]
+      t = timeit.default_timer()
+      func()
+      times [ i ] += timeit.default_timer() - t
+      ncalls[ i ] += 1
+      self._current_func = None
+
+  #---------------------------------------------------------------------
+  # _flop_registers
+  #---------------------------------------------------------------------
+  # Commit the next value of every register written during this cycle.
+  # Each register is queued once however many times its .next was
+  # written (see insert_signal_values), only registers whose value
+  # actually changes are written, and comb update notifications are
+  # issued after all registers have been committed.
+  def _flop_registers( self ):
+
+    queue = self._register_queue
+    if queue:
+      dirty   = self._register_dirty
+      regs    = self._registers
+      changed = []
+      for idx in queue:
+        dirty[ idx ] = 0
+        reg        = regs[ idx ]
+        next_value = reg._next
+        if next_value != reg:
+          reg.write_value( next_value )
+          changed.append( reg )
+      del queue[:]
+      for reg in changed:
+        reg.notify_sim_comb_update()
+        for func in reg._slices: func()
+
+    if self._storage is not None:
+      self._storage.flop()
+
   #---------------------------------------------------------------------
   # eval_combinational
   #---------------------------------------------------------------------
@@ -224,7 +464,7 @@ class SimulationTool( object ):
     #print([x.fullname for x in signal_value._DEBUG_signal_names], end='')
     #print(self._DEBUG_signal_cbs[signal_value])
 
-    self.metrics.incr_add_events()
+    self.metrics.incr_add_events( self._current_func )
 
     # Place all other callbacks in the event queue for execution later
 
@@ -265,3 +505,96 @@ class EventQueue( object ):
     if self.func_ids > len( self.func_bv ):
       self.func_bv.extend( [ False ] * 1000 )
     return id
+
+#-----------------------------------------------------------------------
+# LevelizedEventQueue
+#-----------------------------------------------------------------------
+# Event queue used when static scheduling is enabled. Rather than
+# executing events in FIFO order, pending events are kept in a heap
+# ordered by their position in the static schedule created by
+# sim_utils.create_comb_schedule(). Blocks in a combinational loop may
+# enqueue blocks earlier in the schedule, these are simply executed
+# next, as they would be with the FIFO event queue.
+class LevelizedEventQueue( EventQueue ):
+
+  def __init__( self, initsize = 1000 ):
+    super( LevelizedEventQueue, self ).__init__( initsize )
+    self.heap   = []
+    self.levels = [ 0 ] * initsize
+
+  def enq( self, event, id ):
+    if not self.func_bv[ id ]:
+      self.func_bv[ id ] = True
+      heapq.heappush( self.heap, ( self.levels[ id ], id, event ) )
+
+  def deq( self ):
+    level, id, event = heapq.heappop( self.heap )
+    self.func_bv[ id ] = False
+    return event
+
+  def len( self ):
+    return len( self.heap )
+
+  def __len__( self ):
+    return len( self.heap )
+
+  def get_id( self ):
+    id = super( LevelizedEventQueue, self ).get_id()
+    if len( self.levels ) < len( self.func_bv ):
+      self.levels.extend( [ 0 ] * ( len( self.func_bv ) - len( self.levels ) ) )
+    return id
+
+  def set_levels( self, schedule ):
+    # Blocks inside a combinational loop are given increasing priorities
+    # in the order they appear in the schedule, this avoids re-evaluating
+    # blocks whose producers have not executed yet.
+    level = 0
+    for funcs in schedule:
+      for func in funcs:
+        self.levels[ func.id ] = level
+        level += 1
+    # Reorder any events that were enqueued before levels were known
+    self.heap = [ ( self.levels[ id ], id, event )
+                  for _, id, event in self.heap ]
+    heapq.heapify( self.heap )
+
+#-----------------------------------------------------------------------
+# StaticEventQueue
+#-----------------------------------------------------------------------
+# Event queue used when both static scheduling and code generation are
+# enabled. The generated eval_combinational() walks the schedule in
+# order and checks func_bv directly, so enq only needs to set the bit.
+# If an event is enqueued at or before the level currently being
+# evaluated (only possible in combinational loops) the queue is marked
+# dirty so the generated code makes another pass over the schedule.
+class StaticEventQueue( LevelizedEventQueue ):
+
+  def __init__( self, initsize = 1000 ):
+    super( StaticEventQueue, self ).__init__( initsize )
+    self.order  = []
+    self.dirty  = False
+    self.cursor = 0
+
+  def enq( self, event, id ):
+    if not self.func_bv[ id ]:
+      self.func_bv[ id ] = True
+      if self.levels[ id ] <= self.cursor:
+        self.dirty = True
+
+  def deq( self ):
+    for id, event in self.order:
+      if self.func_bv[ id ]:
+        self.func_bv[ id ] = False
+        return event
+    raise IndexError( "deq from an empty StaticEventQueue" )
+
+  def len( self ):
+    return sum( self.func_bv[ id ] for id, event in self.order )
+
+  def __len__( self ):
+    return self.len()
+
+  def set_levels( self, schedule ):
+    super( StaticEventQueue, self ).set_levels( schedule )
+    self.order  = [ ( func.id, func ) for funcs in schedule for func in funcs ]
+    self.cursor = len( self.order )
@@ -0,0 +1,93 @@
+#=======================================================================
+# SimulationTool_codegen_test.py
+#=======================================================================
+# Tests for the generated cycle() and eval_combinational() functions.
+
+import pytest
+
+from pymtl import *
+
+#=======================================================================
+# Tests
+#=======================================================================
+
+# This imports all the SimulationTool tests. Below we will hack the
+# setup_sim() function call in each module to use a simulator with a
+# static schedule and generated cycle functions.
+
+from SimulationTool_seq_test    import *
+from SimulationTool_comb_test   import *
+from SimulationTool_mix_test    import *
+from SimulationTool_struct_test import *
+from SimulationTool_wire_test   import *
+
+from SimulationTool_sched_test  import CombChain, CombLoop
+
+#=======================================================================
+# Test Config
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# local_setup_sim
+#-----------------------------------------------------------------------
+# - elaborate the module
+# - create a simulator with the SimulationTool using a static schedule
+#   and code generation
+#
+def local_setup_sim( model ):
+  model.elaborate()
+  sim = SimulationTool( model, static_schedule=True, codegen=True )
+  return model, sim
+
+#-----------------------------------------------------------------------
+# dynamic_setup_sim
+#-----------------------------------------------------------------------
+# - elaborate the module
+# - create a simulator with the SimulationTool using the event queue
+#   and code generation
+#
+def dynamic_setup_sim( model ):
+  model.elaborate()
+  sim = SimulationTool( model, codegen=True )
+  return model, sim
+
+#=======================================================================
+# Codegen Tests
+#=======================================================================
+
+def test_DynamicRegister():
+  test_Register( dynamic_setup_sim )
+
+def test_DynamicRegisterReset():
+  test_RegisterReset( dynamic_setup_sim )
+
+def test_DynamicRippleCarryAdder():
+  test_RippleCarryAdder( dynamic_setup_sim )
+
+def test_DynamicCombChain():
+  model, sim = dynamic_setup_sim( CombChain() )
+  model.in_.value = 4
+  sim.eval_combinational()
+  assert model.out == 8
+
+def test_CombChainEvalOnce():
+  model, sim = local_setup_sim( CombChain() )
+  for i in range( 1, 8 ):
+    model.count = [ 0 ] * 4
+    model.in_.value = i
+    sim.eval_combinational()
+    assert model.out   == i + 4
+    assert model.count == [ 1 ] * 4
+
+def test_CombLoop():
+  model, sim = local_setup_sim( CombLoop() )
+  model.in_.value = 5
+  sim.eval_combinational()
+  assert model.out == 5
+
+def test_GeneratedSource():
+  model, sim = local_setup_sim( Register( 8 ) )
+  src = sim.cycle.src
+  assert 'def cycle():'              in src
+  assert 'def eval_combinational():' in src
+  assert 'seq_0()'                   in src
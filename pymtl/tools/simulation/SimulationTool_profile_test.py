@@ -0,0 +1,137 @@
+#=======================================================================
+# SimulationTool_profile_test.py
+#=======================================================================
+# Tests for the simulation profiler.
+
+import pytest
+
+from pymtl import *
+
+from SimulationProfiler import SimulationProfiler
+
+#=======================================================================
+# Tests
+#=======================================================================
+
+# This imports all the SimulationTool tests. Below we will hack the
+# setup_sim() function call in each module to use a simulator with
+# profiling enabled.
+
+from SimulationTool_seq_test    import *
+from SimulationTool_comb_test   import *
+from SimulationTool_mix_test    import *
+from SimulationTool_struct_test import *
+from SimulationTool_wire_test   import *
+
+#=======================================================================
+# Test Config
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# local_setup_sim
+#-----------------------------------------------------------------------
+# - elaborate the module
+# - create a simulator with the SimulationTool with profiling enabled,
+#   sampling every other cycle
+#
+def local_setup_sim( model ):
+  model.elaborate()
+  sim = SimulationTool( model, profile=True, profile_every=2 )
+  return model, sim
+
+#=======================================================================
+# Profiler Tests
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# Pipeline
+#-----------------------------------------------------------------------
+class Incr( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 8 )
+    s.out = OutPort( 8 )
+    s.tmp = Wire   ( 8 )
+
+    @s.combinational
+    def comb_logic():
+      s.tmp.value = s.in_ + 1
+
+    @s.tick
+    def seq_logic():
+      s.out.next = s.tmp
+
+class Pipeline( Model ):
+  def __init__( s, nstages ):
+    s.in_   = InPort ( 8 )
+    s.out   = OutPort( 8 )
+    s.stage = [ Incr() for _ in range( nstages ) ]
+
+    s.connect( s.in_, s.stage[0].in_ )
+    for i in range( 1, nstages ):
+      s.connect( s.stage[i-1].out, s.stage[i].in_ )
+    s.connect( s.stage[-1].out, s.out )
+
+def profile_pipeline( ncycles, **kwargs ):
+  model = Pipeline( 3 )
+  model.elaborate()
+  sim   = SimulationTool( model, profile=True, **kwargs )
+  sim.reset()
+  for i in range( ncycles ):
+    model.in_.value = i
+    sim.cycle()
+  return model, sim
+
+def test_block_profile():
+  model, sim = profile_pipeline( 10 )
+  profiler   = sim.profiler
+
+  assert model.out == 9 + 3 - 2
+  assert profiler.ncycles == 12
+
+  blocks = dict( ( path, calls ) for path, calls, _
+                 in profiler.get_block_profile() )
+
+  for i in range( 3 ):
+    assert blocks[ ( 'top', 'stage[{}]'.format(i), 'seq_logic' ) ] == 12
+    assert ( 'top', 'stage[{}]'.format(i), 'comb_logic' ) in blocks
+  assert blocks[ ( 'top', '[simulator]' ) ] == 12
+
+  # The total time of the top-level model includes everything
+
+  models = profiler.get_model_profile()
+  path, self_time, total_time = models[0]
+  assert path == ( 'top', )
+  assert total_time == pytest.approx( profiler.total_time )
+
+def test_sampling():
+  model, sim = profile_pipeline( 28, profile_every=10 )
+  assert model.out == 27 + 3 - 2
+  assert sim.ncycles == 30
+  assert sim.profiler.ncycles == 3
+
+  blocks = dict( ( path, calls ) for path, calls, _
+                 in sim.profiler.get_block_profile() )
+  assert blocks[ ( 'top', 'stage[0]', 'seq_logic' ) ] == 3
+
+  with pytest.raises( ValueError ):
+    SimulationProfiler( 0 )
+
+def test_flamegraph( tmpdir ):
+  model, sim = profile_pipeline( 10 )
+  filename   = str( tmpdir.join( 'sim.folded' ) )
+  sim.profiler.write_flamegraph( filename )
+
+  stacks = {}
+  for line in open( filename ):
+    stack, usecs = line.split()
+    stacks[ stack ] = int( usecs )
+
+  assert 'top;stage[1];seq_logic' in stacks
+  assert 'top;[simulator]'        in stacks
+  assert all( usecs > 0 for usecs in stacks.values() )
+
+def test_codegen():
+  model = Pipeline( 3 )
+  model.elaborate()
+  with pytest.raises( ValueError ):
+    SimulationTool( model, profile=True, codegen=True )
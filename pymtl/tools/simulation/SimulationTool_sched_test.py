@@ -0,0 +1,173 @@
+#=======================================================================
+# SimulationTool_sched_test.py
+#=======================================================================
+# Tests for the static (levelized) combinational schedule.
+
+import pytest
+
+from pymtl import *
+
+#=======================================================================
+# Tests
+#=======================================================================
+
+# This imports all the SimulationTool tests. Below we will hack the
+# setup_sim() function call in each module to use a statically scheduled
+# version of the simulator.
+
+from SimulationTool_seq_test    import *
+from SimulationTool_comb_test   import *
+from SimulationTool_mix_test    import *
+from SimulationTool_struct_test import *
+from SimulationTool_wire_test   import *
+
+#=======================================================================
+# Test Config
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# local_setup_sim
+#-----------------------------------------------------------------------
+# - elaborate the module
+# - create a simulator with the SimulationTool using a static schedule
+#
+def local_setup_sim( model ):
+  model.elaborate()
+  sim = SimulationTool( model, static_schedule=True )
+  return model, sim
+
+#=======================================================================
+# Schedule Tests
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# CombChain
+#-----------------------------------------------------------------------
+# Chain of @combinational blocks declared in reverse dependency order.
+# With the default FIFO event queue the later blocks are evaluated
+# several times per eval_combinational(), a static schedule evaluates
+# each block exactly once.
+
+class CombChain( Model ):
+  def __init__( s ):
+    s.in_   = InPort ( 8 )
+    s.out   = OutPort( 8 )
+    s.w0    = Wire( 8 )
+    s.w1    = Wire( 8 )
+    s.w2    = Wire( 8 )
+    s.count = [ 0 ] * 4
+
+    @s.combinational
+    def stage3():
+      s.out.value = s.w2 + 1
+      s.count[3] += 1
+
+    @s.combinational
+    def stage2():
+      s.w2.value = s.w1 + 1
+      s.count[2] += 1
+
+    @s.combinational
+    def stage1():
+      s.w1.value = s.w0 + 1
+      s.count[1] += 1
+
+    @s.combinational
+    def stage0():
+      s.w0.value = s.in_ + 1
+      s.count[0] += 1
+
+def test_CombChainEvalOnce():
+  model      = CombChain()
+  model, sim = local_setup_sim( model )
+
+  for i in range( 1, 8 ):
+    model.count = [ 0 ] * 4
+    model.in_.value = i
+    sim.eval_combinational()
+    assert model.out   == i + 4
+    assert model.count == [ 1 ] * 4
+
+def test_CombChainSchedule():
+  model      = CombChain()
+  model, sim = local_setup_sim( model )
+
+  # Every block is in its own level, in dependency order
+  schedule = sim._comb_schedule
+  assert all( len( level ) == 1 for level in schedule )
+  names = [ level[0].func_name for level in schedule ]
+  assert names == [ 'stage0', 'stage1', 'stage2', 'stage3' ]
+
+#-----------------------------------------------------------------------
+# CombLoop
+#-----------------------------------------------------------------------
+# Two blocks which read each others outputs form a strongly connected
+# component and must share a level in the schedule.
+
+class CombLoop( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 4 )
+    s.out = OutPort( 4 )
+    s.a   = Wire( 4 )
+    s.b   = Wire( 4 )
+
+    @s.combinational
+    def block_a():
+      if s.b == 0: s.a.value = s.in_
+      else:        s.a.value = s.b
+
+    @s.combinational
+    def block_b():
+      s.b.value = s.a
+
+    @s.combinational
+    def block_out():
+      s.out.value = s.b
+
+def test_CombLoopSchedule():
+  model      = CombLoop()
+  model, sim = local_setup_sim( model )
+
+  schedule = sim._comb_schedule
+  assert len( schedule ) == 2
+  assert sorted( x.func_name for x in schedule[0] ) == [ 'block_a', 'block_b' ]
+  assert [ x.func_name for x in schedule[1] ] == [ 'block_out' ]
+
+  model.in_.value = 5
+  sim.eval_combinational()
+  assert model.out == 5
+
+#-----------------------------------------------------------------------
+# SliceSchedule
+#-----------------------------------------------------------------------
+# Slice connections must be scheduled between the block writing the
+# source net and the block reading the destination net.
+
+class SliceSchedule( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 8 )
+    s.out = OutPort( 4 )
+    s.src = Wire( 8 )
+    s.dst = Wire( 4 )
+
+    s.connect_wire( dest = s.dst, src = s.src[0:4] )
+
+    @s.combinational
+    def read_dst():
+      s.out.value = s.dst
+
+    @s.combinational
+    def write_src():
+      s.src.value = s.in_
+
+def test_SliceSchedule():
+  model      = SliceSchedule()
+  model, sim = local_setup_sim( model )
+
+  names = [ getattr( x, 'func_name' ) for level in sim._comb_schedule
+                                      for x in level ]
+  assert names == [ 'write_src', 'slice_cb', 'read_dst' ]
+
+  model.in_.value = 0xab
+  sim.eval_combinational()
+  assert model.out == 0xb
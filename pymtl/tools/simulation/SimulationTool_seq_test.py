@@ -475,3 +475,142 @@ def test_GetMSB( setup_sim ):
   model.in_.value = 0b10000; sim.cycle(); assert model.out == 1
   model.in_.value = 0b00001; sim.cycle(); assert model.out == 0
 
+
+#-----------------------------------------------------------------------
+# Counter
+#-----------------------------------------------------------------------
+# Verify multi-cycle simulation with sim.run().
+class Counter( Model ):
+  def __init__( s, nbits ):
+    s.out  = OutPort( nbits )
+    s.done = OutPort( 1 )
+
+  def elaborate_logic( s ):
+    @s.posedge_clk
+    def seq_logic():
+      if s.reset: s.out.next = 0
+      else:       s.out.next = s.out + 1
+
+    @s.combinational
+    def comb_logic():
+      s.done.value = s.out == 10
+
+  def line_trace( s ):
+    return "{}".format( s.out )
+
+def test_RunCycles( setup_sim ):
+  model      = Counter( 8 )
+  model, sim = setup_sim( model )
+  sim.reset()
+
+  assert sim.run( 5 ) == 5
+  assert model.out    == 5
+  assert sim.ncycles  == 7
+  assert sim.run( 0 ) == 0
+  assert model.out    == 5
+
+def test_RunStopWhen( setup_sim ):
+  model      = Counter( 8 )
+  model, sim = setup_sim( model )
+  sim.reset()
+
+  assert sim.run( 100, lambda: model.done ) == 10
+  assert model.out == 10
+
+  # Predicate is already true, no cycles are executed
+  assert sim.run( 100, lambda: model.done ) == 0
+
+  # Hitting the cycle limit before the predicate is true
+  sim.reset()
+  assert sim.run( 4, lambda: model.done ) == 4
+  assert model.out == 4
+
+  # ncycles of None runs until the predicate is true
+  assert sim.run( None, lambda: model.done ) == 6
+  assert model.out == 10
+
+def test_RunCheckEvery( setup_sim ):
+  model      = Counter( 8 )
+  model, sim = setup_sim( model )
+  sim.reset()
+
+  # The predicate is only checked every 4 cycles (at 0, 4, 8, 12)
+  assert sim.run( 100, lambda: model.out >= 10, check_every=4 ) == 12
+  assert model.out == 12
+
+  with pytest.raises( ValueError ):
+    sim.run( 100, lambda: model.done, check_every=0 )
+  with pytest.raises( ValueError ):
+    sim.run( None )
+  with pytest.raises( ValueError ):
+    sim.run( -1 )
+  with pytest.raises( ValueError ):
+    sim.run( -1, lambda: model.done )
+
+def test_RunTraceEvery( setup_sim, capsys ):
+  model      = Counter( 8 )
+  model, sim = setup_sim( model )
+  sim.reset()
+  capsys.readouterr()
+
+  sim.run( 6 )
+  out, err = capsys.readouterr()
+  assert out == ''
+
+  sim.run( 6, trace_every=2 )
+  out, err = capsys.readouterr()
+  assert out.split() == [ '8:', '06', '10:', '08', '12:', '0a' ]
+
+#-----------------------------------------------------------------------
+# RegisterCommit
+#-----------------------------------------------------------------------
+# Registers written several times per cycle are only queued once, and
+# only registers whose value changes notify their readers.
+class DefaultThenOverride( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 8 )
+    s.out = OutPort( 8 )
+    s.inc = OutPort( 8 )
+
+    @s.tick
+    def seq_logic():
+      s.out.next = 0
+      if s.in_ != 0:
+        s.out.next = s.in_
+
+    @s.combinational
+    def comb_logic():
+      s.inc.value = s.out + 1
+
+@pytest.mark.parametrize( 'codegen', [ False, True ] )
+def test_RegisterCommit( codegen ):
+  model = DefaultThenOverride()
+  model.elaborate()
+  sim   = SimulationTool( model, codegen=codegen )
+  sim.reset()
+
+  for value in [ 3, 3, 0, 7 ]:
+    model.in_.value = value
+    sim.cycle()
+    assert model.out == value
+    assert model.inc == value + 1
+    assert sim._register_queue == []
+    assert not any( sim._register_dirty )
+
+  # Repeated writes queue the register once
+
+  model.out.next = 5
+  model.out.next = 5
+  assert len( sim._register_queue ) == 1
+
+  sim._flop_registers()
+  assert model.out == 5
+  assert len( sim._event_queue ) == 1
+  sim.eval_combinational()
+  assert model.inc == 6
+
+  # Committing an unchanged value does not trigger readers
+
+  model.out.next = 5
+  sim._flop_registers()
+  assert len( sim._event_queue ) == 0
@@ -0,0 +1,178 @@
+#=======================================================================
+# SimulationTool_split_test.py
+#=======================================================================
+# Tests for split sensitivity of @combinational blocks.
+
+import pytest
+
+from pymtl import *
+
+from split_blocks import split_comb_block
+
+#=======================================================================
+# Tests
+#=======================================================================
+
+# This imports all the SimulationTool tests. Below we will hack the
+# setup_sim() function call in each module to use a simulator with
+# split sensitivity (and metrics collection) enabled.
+
+from SimulationTool_seq_test    import *
+from SimulationTool_comb_test   import *
+from SimulationTool_mix_test    import *
+from SimulationTool_struct_test import *
+from SimulationTool_wire_test   import *
+
+#=======================================================================
+# Test Config
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# local_setup_sim
+#-----------------------------------------------------------------------
+# - elaborate the module
+# - create a simulator with the SimulationTool using split sensitivity
+#
+def local_setup_sim( model ):
+  model.elaborate()
+  sim = SimulationTool( model, split_sensitivity=True, collect_metrics=True )
+  return model, sim
+
+#=======================================================================
+# Split Tests
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# Lanes
+#-----------------------------------------------------------------------
+class Lanes( Model ):
+  def __init__( s, nlanes ):
+    s.in_ = [ InPort ( 8 ) for _ in range( nlanes ) ]
+    s.en  = InPort ( 1 )
+    s.out = [ OutPort( 8 ) for _ in range( nlanes ) ]
+
+    @s.combinational
+    def comb_logic():
+      for i in range( nlanes ):
+        tmp = s.in_[i] + 1
+        if s.en: s.out[i].value = tmp
+        else:    s.out[i].value = 0
+
+def lanes_evals( sim ):
+  activity = sim.metrics.get_block_activity()
+  return dict( ( name, evals ) for name, evals, _ in activity )
+
+@pytest.mark.parametrize( 'kwargs', [
+  {},
+  { 'static_schedule' : True },
+  { 'static_schedule' : True, 'codegen' : True },
+])
+def test_Lanes( kwargs ):
+  model = Lanes( 4 )
+  model.elaborate()
+  sim   = SimulationTool( model, split_sensitivity=True, collect_metrics=True,
+                          **kwargs )
+  sim.reset()
+
+  assert len( model._split_blocks ) == 1
+  assert sim.metrics.num_split_blocks == 1
+
+  model.en.value = 1
+  for i in range( 4 ):
+    model.in_[i].value = i
+  sim.eval_combinational()
+  assert model.out == [ 1, 2, 3, 4 ]
+
+  # Changing one lane only evaluates the block for that lane
+
+  before = lanes_evals( sim )
+  model.in_[2].value = 7
+  sim.eval_combinational()
+  assert model.out == [ 1, 2, 8, 4 ]
+
+  after = lanes_evals( sim )
+  assert [ after[ 'top.comb_logic[{}]'.format(i) ] -
+           before[ 'top.comb_logic[{}]'.format(i) ] for i in range( 4 ) ] \
+         == [ 0, 0, 1, 0 ]
+
+  # Signals read by every iteration evaluate all lanes
+
+  model.en.value = 0
+  sim.eval_combinational()
+  assert model.out == [ 0, 0, 0, 0 ]
+
+def test_Crossbar():
+  from pclib.rtl import Crossbar
+
+  model = Crossbar( 4, 8 )
+  model.elaborate()
+  sim   = SimulationTool( model, split_sensitivity=True, collect_metrics=True )
+  sim.reset()
+
+  for i in range( 4 ):
+    model.in_[i].value = 10 + i
+    model.sel[i].value = 3 - i
+  sim.cycle()
+  assert model.out == [ 13, 12, 11, 10 ]
+
+  model.sel[1].value = 0
+  sim.cycle()
+  assert model.out == [ 13, 10, 11, 10 ]
+  assert sum( sim.metrics.split_saved_per_cycle ) > 0
+
+#-----------------------------------------------------------------------
+# Blocks which cannot be split
+#-----------------------------------------------------------------------
+class Unsplittable( Model ):
+  def __init__( s, nlanes ):
+    s.in_ = [ InPort ( 8 ) for _ in range( nlanes ) ]
+    s.out = [ OutPort( 8 ) for _ in range( nlanes ) ]
+    s.sum = OutPort( 8 )
+    s.any = OutPort( 1 )
+    s.first = OutPort( 8 )
+
+    # Statements outside of the loop
+    @s.combinational
+    def sum_logic():
+      total = 0
+      for i in range( nlanes ):
+        total = total + s.in_[i]
+      s.sum.value = total
+
+    # Iterations write the same signal
+    @s.combinational
+    def any_logic():
+      for i in range( nlanes ):
+        s.any.value = s.in_[i] != 0
+
+    # Iterations read signals written by other iterations
+    @s.combinational
+    def chain_logic():
+      for i in range( nlanes ):
+        if i == 0: s.out[i].value = s.in_[i]
+        else:      s.out[i].value = s.out[i-1] + s.in_[i]
+
+    # Iterations leave the loop early
+    @s.combinational
+    def first_logic():
+      for i in range( nlanes ):
+        s.first.value = s.in_[i]
+        break
+
+def test_Unsplittable():
+  model = Unsplittable( 4 )
+  model.elaborate()
+  sim   = SimulationTool( model, split_sensitivity=True )
+
+  for func in model.get_combinational_blocks():
+    assert split_comb_block( model, func ) is None
+  assert model._split_blocks == {}
+
+  sim.reset()
+  for i in range( 4 ):
+    model.in_[i].value = i
+  sim.eval_combinational()
+  assert model.sum   == 6
+  assert model.any   == 1
+  assert model.out   == [ 0, 1, 3, 6 ]
+  assert model.first == 0
@@ -0,0 +1,134 @@
+#=======================================================================
+# SimulationTool_storage_test.py
+#=======================================================================
+# Tests for array-backed signal storage.
+
+import gc
+import copy
+import pytest
+
+from pymtl import *
+
+#=======================================================================
+# Tests
+#=======================================================================
+
+# This imports all the SimulationTool tests. Below we will hack the
+# setup_sim() function call in each module to use a simulator with
+# array-backed signal storage.
+
+from SimulationTool_seq_test    import *
+from SimulationTool_comb_test   import *
+from SimulationTool_mix_test    import *
+from SimulationTool_struct_test import *
+from SimulationTool_wire_test   import *
+
+#=======================================================================
+# Test Config
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# local_setup_sim
+#-----------------------------------------------------------------------
+# - elaborate the module
+# - create a simulator with the SimulationTool using array storage
+#
+def local_setup_sim( model ):
+  model.elaborate()
+  sim = SimulationTool( model, array_storage=True )
+  return model, sim
+
+#-----------------------------------------------------------------------
+# codegen_setup_sim
+#-----------------------------------------------------------------------
+# - elaborate the module
+# - create a simulator with the SimulationTool using array storage and
+#   generated cycle functions
+#
+def codegen_setup_sim( model ):
+  model.elaborate()
+  sim = SimulationTool( model, array_storage=True, static_schedule=True,
+                        codegen=True )
+  return model, sim
+
+#=======================================================================
+# Storage Tests
+#=======================================================================
+
+def test_CodegenRegister():
+  test_Register( codegen_setup_sim )
+
+def test_CodegenRegisterReset():
+  test_RegisterReset( codegen_setup_sim )
+
+def test_StorageValues():
+  model, sim = local_setup_sim( Register( 8 ) )
+  storage = sim._storage
+
+  # Every net (in_, out, clk, reset) is allocated in storage
+  assert len( storage ) == 4
+  assert model.in_ in storage.views
+  assert model.out in storage.views
+
+  # Writes and flops go through the shared lists
+  model.in_.value = 0x2a
+  assert storage.values[ model.in_._idx ] == 0x2a
+  sim.cycle()
+  assert storage.values[ model.out._idx ] == 0x2a
+  assert storage.nexts [ model.out._idx ] == 0x2a
+  assert storage.dirty == []
+
+  # Views have no per-instance dictionary
+  assert not any( type( r ) is dict for r in gc.get_referents( model.out ) )
+
+  # Views behave like the original dtype
+  assert isinstance( model.out, Bits )
+  assert model.out.nbits == 8
+  assert model.out + 1   == 0x2b
+  assert model.out[0:4]  == 0xa
+
+  with pytest.raises( ValueError ):
+    model.in_.value = 0x100
+
+def test_StorageDetachedCopies():
+  model, sim = local_setup_sim( Register( 8 ) )
+  model.in_.value = 3
+
+  # Copies, slices and instantiations must not alias the storage
+  for value in [ copy.copy( model.in_ ), copy.deepcopy( model.in_ ),
+                 model.in_[:] ]:
+    assert value == 3
+    value.value = 4
+    assert model.in_ == 3
+
+  value = model.in_()
+  assert value == 0 and value.nbits == 8
+  assert value is not model.in_
+
+class StorageMsg( BitStructDefinition ):
+  def __init__( s ):
+    s.fieldA = BitField(  8 )
+    s.fieldB = BitField( 16 )
+
+class RegisterBitStruct( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( StorageMsg() )
+    s.out = OutPort( StorageMsg() )
+
+    @s.posedge_clk
+    def logic():
+      s.out.next = s.in_
+
+def test_StorageBitStruct():
+  model, sim = local_setup_sim( RegisterBitStruct() )
+  model.in_.value = 0x123478
+  sim.cycle()
+  assert model.out.fieldA == 0x12
+  assert model.out.fieldB == 0x3478
+  assert hash( model.out ) == hash( model.in_ )
+
+  # Instantiating the dtype yields the original BitStruct class
+  value = model.out()
+  assert value.fieldA == 0
+  assert value.bitfields == model.out.bitfields
+  assert type( value ) in type( model.out ).__mro__
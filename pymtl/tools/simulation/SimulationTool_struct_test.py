@@ -807,3 +807,117 @@ def test_BitStructLocal( setup_sim, src, dest ):
 
 
 
+
+#-----------------------------------------------------------------------
+# DeepPassThrough
+#-----------------------------------------------------------------------
+
+class DeepPassThrough( Model ):
+  def __init__( s, nbits, depth ):
+    s.in_ = InPort ( nbits )
+    s.out = OutPort( nbits )
+    if depth:
+      s.sub = DeepPassThrough( nbits, depth-1 )
+      s.connect( s.in_,     s.sub.in_ )
+      s.connect( s.sub.out, s.out     )
+    else:
+      s.connect( s.in_, s.out )
+
+def test_DeepPassThrough( setup_sim ):
+  passthrough_tester( setup_sim,
+                      lambda nbits: DeepPassThrough( nbits, 50 ) )
+
+#-----------------------------------------------------------------------
+# signals_to_nets
+#-----------------------------------------------------------------------
+
+def test_signals_to_nets():
+
+  from sim_utils import collect_signals, signals_to_nets
+
+  model = DeepPassThrough( 8, 3 )
+  model.const = ConstantSlice()
+  model.shift = ConstantModule()
+  model.elaborate()
+
+  signals = collect_signals( model )
+  nets, slice_connects = signals_to_nets( signals + signals )
+
+  # Every signal is in exactly one net, nets are ordered by their first
+  # signal in the model hierarchy
+
+  net_signals = [ x for net in nets for x in net ]
+  assert len( net_signals ) == len( set( net_signals ) )
+  assert set( signals ) <= set( net_signals )
+  assert [ net[0] for net in nets ] == \
+         sorted( [ net[0] for net in nets ], key=net_signals.index )
+
+  # The whole pass-through chain forms a single net
+
+  chain = [ model.in_, model.out ]
+  m = model
+  while hasattr( m, 'sub' ):
+    m = m.sub
+    chain += [ m.in_, m.out ]
+  assert [ net for net in nets if model.in_ in net ][0] == \
+         [ x for x in signals if x in chain ]
+
+  # Constants connected to whole signals become part of their net,
+  # constants connected to slices are only in the slice connections
+
+  shamt_net = [ net for net in nets if model.shift.shift.shamt in net ][0]
+  assert len( shamt_net ) == 2
+  assert any( isinstance( x, pymtl.model.signals.Constant )
+              for x in shamt_net )
+
+  assert len( slice_connects ) == 2
+  assert set( c.dest_node for c in slice_connects ) == \
+         set( [ model.const.out ] )
+
+#-----------------------------------------------------------------------
+# attribute names
+#-----------------------------------------------------------------------
+
+class BundleListNames( Model ):
+  def __init__( s ):
+    s.in_ = [ InValRdyBundle( 8 ) for _ in range( 2 ) ]
+    s.out = OutPort( 8 )
+    @s.combinational
+    def logic():
+      s.out.value = s.in_[0].msg + s.in_[1].msg
+
+def test_attr_names():
+
+  from sim_utils import _attr_path, _rebind_attr, _attr_name_to_object
+
+  assert _attr_path( 'out'           ) == ( 'out', )
+  assert _attr_path( 'in_[1].msg'    ) == ( 'in_', 1, 'msg' )
+  assert _attr_path( 's.a[2][10].b'  ) == ( 's', 'a', 2, 10, 'b' )
+
+  model = BundleListNames()
+  model.elaborate()
+  msg   = model.in_[1].msg
+  out   = model.out
+  sim   = SimulationTool( model )
+
+  # Signals have been rebound to the SignalValues of their nets
+
+  assert model.in_[1].msg is msg._signalvalue
+  assert model.out        is out._signalvalue
+
+  # Sensitivity list names resolve to SignalValues, lists and None
+
+  assert _attr_name_to_object( model, 's.out'           ) is model.out
+  assert _attr_name_to_object( model, 'self.in_[1].msg' ) is model.in_[1].msg
+  assert _attr_name_to_object( model, 's.in_[?].msg'    ) == \
+         ( model.in_, 's.in_', '.msg' )
+  assert _attr_name_to_object( model, 's.in_',   warn=False ) is None
+  assert _attr_name_to_object( model, 'x.out',   warn=False ) is None
+  assert _attr_name_to_object( model, 'Bits',    warn=False ) is None
+  assert 's.out' in model._name_table
+
+  sim.reset()
+  model.in_[0].msg.value = 3
+  model.in_[1].msg.value = 4
+  sim.eval_combinational()
+  assert model.out == 7
@@ -42,14 +42,28 @@ class DetectIncorrectValueNext( ast.NodeVisitor ):
 #------------------------------------------------------------------------
 # DetectMissingValueNext
 #------------------------------------------------------------------------
+# Checking an assignment target requires evaluating it in the closure of
+# the function, so the check is split in two steps: collect_targets()
+# compiles the targets which need checking, which only depends on the
+# AST, then check_targets() evaluates them for a particular function.
+# Collecting the targets modifies the AST. Calling visit() does both.
 class DetectMissingValueNext( ast.NodeVisitor ):
 
   def __init__( self, func, attr='next or value' ):
-    self.attr   = (attr, attr[0])
-    self.func   = func
-    self.dict_  = get_closure_dict( func )
+    self.attr    = (attr, attr[0])
+    self.func    = func
+    self.targets = None
 
-    self.src, self.funclineno = inspect.getsourcelines( self.func )
+  def visit( self, node ):
+    if self.targets is not None:
+      return super( DetectMissingValueNext, self ).visit( node )
+    self.check_targets( self.collect_targets( node ) )
+
+  def collect_targets( self, node ):
+    self.targets = []
+    self.visit( node )
+    targets, self.targets = self.targets, None
+    return targets
 
   def visit_Assign( self, node ):
 
@@ -66,6 +80,7 @@ class DetectMissingValueNext( ast.NodeVisitor ):
       else:
         from ..ast_helpers import print_simple_ast
         print_simple_ast( tgt )
+        src, funclineno = inspect.getsourcelines( self.func )
         raise Exception(
           'Unsupported assignment type ({kind})!\n'
           'Please notify the PyMTL developers!\n\n'
@@ -75,10 +90,10 @@ class DetectMissingValueNext( ast.NodeVisitor ):
           ' Line: {lineno}\n'.format(
             attr     = self.attr[0],
             kind     = tgt.__class__,
-            srccode  = self.src[ node.lineno - 1 ],
+            srccode  = src[ node.lineno - 1 ],
             filename = inspect.getfile( self.func ),
             funcname = self.func.func_name,
-            lineno   = self.funclineno + node.lineno - 1
+            lineno   = funclineno + node.lineno - 1
           )
         )
 
@@ -96,48 +111,58 @@ class DetectMissingValueNext( ast.NodeVisitor ):
         # TODO: this is super hacky. Grab each left-hand side (LHS)
         # target, give them Load() instead of Store() contexts, and wrap
         # them in an ast.Expression node. This allows us to compile the
-        # AST as an expression and execute it with eval(), which will
-        # return the object stored in the lhs target. The second argument
-        # to eval() is closure dictionary we extracted from the function.
-
-        ## DEBUG
-        #print inspect.getfile( self.func )
-        #print self.funclineno + node.lineno - 1, self.src[ node.lineno - 1 ]
-        ## DEBUG
+        # AST as an expression and execute it with eval() (see
+        # check_targets), which will return the object stored in the lhs
+        # target.
 
         # In order to handle lists of Signals, we replace all complex
         # Indexes with the value zero. This will return the first element
         # in the list.
-        try:
-          lhs     = ReplaceIndexesWithZero().visit( lhs )
-          lhs.ctx = ast.Load()
-          _code   = compile( ast.Expression( lhs ), '<ast>', 'eval' )
-          _temp   = eval( _code, self.dict_ )
-        except (NameError, AttributeError) as e:
-          # We can't really do anything about temporaries created inside
-          # the combinational block without performing a real type
-          # inference analysis pass.
-          _temp = None
-        except IndexError as e:
-          # Empty list, nothing to do.
-          _temp = None
-
-        # if the object stored in LHS is a Signal, raise a PyMTLError
-        if isinstance( _temp, Signal ):
-          raise PyMTLError(
-            'Attempting to write a(n) {kind} without .{attr}!\n\n'
-            ' {lineno} {srccode}\n'
-            ' File: {filename}\n'
-            ' Function: {funcname}\n'
-            ' Line: {lineno}\n'.format(
-              attr     = self.attr[0],
-              kind     = _temp.__class__.__name__,
-              srccode  = self.src[ node.lineno - 1 ],
-              filename = inspect.getfile( self.func ),
-              funcname = self.func.func_name,
-              lineno   = self.funclineno + node.lineno - 1
-            )
+        lhs     = ReplaceIndexesWithZero().visit( lhs )
+        lhs.ctx = ast.Load()
+        _code   = compile( ast.Expression( lhs ), '<ast>', 'eval' )
+        self.targets.append( ( node.lineno, _code ) )
+
+  def check_targets( self, targets ):
+
+    if not targets:
+      return
+
+    # The second argument to eval() is closure dictionary we extracted
+    # from the function.
+
+    dict_ = get_closure_dict( self.func )
+
+    for lineno, _code in targets:
+
+      try:
+        _temp = eval( _code, dict_ )
+      except (NameError, AttributeError) as e:
+        # We can't really do anything about temporaries created inside
+        # the combinational block without performing a real type
+        # inference analysis pass.
+        _temp = None
+      except IndexError as e:
+        # Empty list, nothing to do.
+        _temp = None
+
+      # if the object stored in LHS is a Signal, raise a PyMTLError
+      if isinstance( _temp, Signal ):
+        src, funclineno = inspect.getsourcelines( self.func )
+        raise PyMTLError(
+          'Attempting to write a(n) {kind} without .{attr}!\n\n'
+          ' {lineno} {srccode}\n'
+          ' File: {filename}\n'
+          ' Function: {funcname}\n'
+          ' Line: {lineno}\n'.format(
+            attr     = self.attr[0],
+            kind     = _temp.__class__.__name__,
+            srccode  = src[ lineno - 1 ],
+            filename = inspect.getfile( self.func ),
+            funcname = self.func.func_name,
+            lineno   = funclineno + lineno - 1
           )
+        )
 
 #------------------------------------------------------------------------
 # ReplaceIndexesWithZero
@@ -175,10 +200,14 @@ class DetectDecorators( ast.NodeVisitor ):
 # for determining 'reg' type variables during Verilog translation.
 class DetectLoadsAndStores( ast.NodeVisitor ):
 
-  def __init__( self ):
-    self.assign = False
-    self.load   = [ ]
-    self.store  = [ ]
+  # If loopvar is provided, subscripts indexed by exactly that variable
+  # are named '[#]' rather than '[?]' (used by split_blocks.py to find
+  # the signals accessed by each iteration of a loop).
+  def __init__( self, loopvar = None ):
+    self.assign  = False
+    self.load    = [ ]
+    self.store   = [ ]
+    self.loopvar = loopvar
 
   def enter( self, node ):
     self.visit( node )
@@ -265,6 +294,11 @@ class GetVariableName( ast.NodeVisitor ):
 
   def visit_Subscript( self, node ):
     self.parent.visit( node.slice )
+    loopvar = getattr( self.parent, 'loopvar', None )
+    if ( loopvar is not None and isinstance( node.slice, _ast.Index )
+         and isinstance( node.slice.value, _ast.Name )
+         and node.slice.value.id == loopvar ):
+      return self.visit( node.value ) + '[#]'
     # insert eval here to test for type...
     return self.visit( node.value ) + '[?]'
 
@@ -0,0 +1,195 @@
+#=======================================================================
+# codegen.py
+#=======================================================================
+# Generation of specialized cycle() and eval_combinational() functions
+# for SimulationTool.
+#
+# Rather than iterating over lists of blocks and dispatching through
+# several layers of method calls every cycle, we emit the source of a
+# single Python function containing the sequential block calls, the
+# register flop loop and the combinational logic evaluation as
+# straight-line code. All objects needed by the generated code are
+# passed into a factory function so they are accessed as closure
+# variables rather than through attribute lookups.
+
+from __future__ import print_function
+
+from sys import flags
+
+#-----------------------------------------------------------------------
+# create_cycle_funcs
+#-----------------------------------------------------------------------
+# Generate, compile and return the (cycle, eval_combinational) function
+# pair for the provided simulator.
+def create_cycle_funcs( sim, collect_metrics = False ):
+
+  src, names, objs = gen_cycle_src( sim, collect_metrics )
+
+  # Compile the factory and call it to create the closures
+
+  namespace = {}
+  code = compile( src, '<pymtl-codegen:{}>'.format( sim.model.class_name ),
+                  'exec' )
+  exec code in namespace
+
+  cycle, eval_combinational = namespace['create_funcs']( objs )
+
+  # Save the source so it can be inspected when debugging
+
+  cycle.src              = src
+  eval_combinational.src = src
+
+  return cycle, eval_combinational
+
+#-----------------------------------------------------------------------
+# gen_cycle_src
+#-----------------------------------------------------------------------
+# Generate the source for a factory function which creates the cycle()
+# and eval_combinational() closures. Returns the source, the names bound
+# by the factory function, and the list of objects to pass in. Objects
+# are passed as a single list since Python limits functions to 255
+# arguments.
+def gen_cycle_src( sim, collect_metrics = False ):
+
+  names = [ 'sim', 'model', 'metrics', 'eq', 'bv', 'rq', 'rd', 'regs' ]
+  objs  = [ sim, sim.model, sim.metrics, sim._event_queue,
+            sim._event_queue.func_bv, sim._register_queue,
+            sim._register_dirty, sim._registers ]
+
+  # Sequential blocks are called by name
+
+  seq_calls = []
+  for i, func in enumerate( sim._sequential_blocks ):
+    name = 'seq_{}'.format( i )
+    names.append( name )
+    objs .append( func )
+    seq_calls.append( '    {}()'.format( name ) )
+
+  # Combinational logic is either a straight-line levelized schedule or
+  # an inlined copy of the event queue loop
+
+  if sim._comb_schedule is not None:
+    eval_lines = _gen_static_eval( sim._comb_schedule, names, objs,
+                                   collect_metrics )
+  else:
+    eval_lines = _gen_dynamic_eval( collect_metrics )
+
+  # Clock generation is only needed by VCD tracing, and is skipped by
+  # _perf_cycle, so mirror that here.
+
+  clk_lines = []
+  if not flags.optimize:
+    clk_lines = [ '    model.clk.value = 0',
+                  '    model.clk.value = 1' ]
+
+  metrics_tick  = [ '    metrics.start_tick()'         ] if collect_metrics else []
+  metrics_cycle = [ '    metrics.incr_metrics_cycle()' ] if collect_metrics else []
+
+  # Nets in array storage are flopped in bulk (see SignalStorage.py)
+
+  storage_lines = []
+  if sim._storage is not None:
+    names.append( 'storage_flop' )
+    objs .append( sim._storage.flop )
+    storage_lines = [ '    storage_flop()' ]
+
+  # Inlined copy of SimulationTool._flop_registers
+
+  flop_lines = [ '    if rq:',
+                 '      changed = []',
+                 '      for idx in rq:',
+                 '        rd[ idx ] = 0',
+                 '        reg = regs[ idx ]',
+                 '        next_value = reg._next',
+                 '        if next_value != reg:',
+                 '          reg.write_value( next_value )',
+                 '          changed.append( reg )',
+                 '      del rq[:]',
+                 '      for reg in changed:',
+                 '        reg.notify_sim_comb_update()',
+                 '        for func in reg._slices: func()' ]
+
+  bind_lines = [ '  {} = objs[{}]'.format( name, i )
+                 for i, name in enumerate( names ) ]
+
+  lines = [ 'def create_funcs( objs ):',
+            '' ] \
+        + bind_lines \
+        + [ '',
+            '  fifo     = eq.fifo',
+            '  fifo_pop = fifo.pop',
+            '',
+            '  def eval_combinational():' ] \
+        + eval_lines \
+        + [ '',
+            '  def cycle():',
+            '    eval_combinational()' ] \
+        + clk_lines \
+        + metrics_tick \
+        + seq_calls \
+        + flop_lines \
+        + storage_lines \
+        + [ '    eval_combinational()',
+            '    sim.ncycles += 1' ] \
+        + metrics_cycle \
+        + [ '',
+            '  return cycle, eval_combinational',
+            '' ]
+
+  return '\n'.join( lines ), names, objs
+
+#-----------------------------------------------------------------------
+# _gen_dynamic_eval
+#-----------------------------------------------------------------------
+# Inlined version of SimulationTool._perf_eval/_dev_eval operating
+# directly on the EventQueue fifo.
+def _gen_dynamic_eval( collect_metrics ):
+
+  lines = [ '    while fifo:',
+            '      func = fifo_pop()',
+            '      bv[ func.id ] = False',
+            '      sim._current_func = func' ]
+  if collect_metrics:
+    lines.append( '      metrics.incr_comb_evals( func )' )
+  lines += [ '      func()',
+             '    sim._current_func = None' ]
+  return lines
+
+#-----------------------------------------------------------------------
+# _gen_static_eval
+#-----------------------------------------------------------------------
+# Straight-line evaluation of the levelized schedule. Each block is
+# guarded by its bit in the event queue so only blocks whose inputs
+# changed are executed. The StaticEventQueue sets eq.dirty if a block
+# is enqueued at or before the position currently being evaluated (only
+# possible for combinational loops), in which case we immediately
+# restart from the top of the schedule so the re-triggered block runs
+# before any of its consumers.
+def _gen_static_eval( schedule, names, objs, collect_metrics ):
+
+  # Positions match the per-block priorities in StaticEventQueue.levels
+
+  nblocks = sum( len( funcs ) for funcs in schedule )
+  lines   = [ '    while eq.dirty:',
+              '      eq.dirty  = False',
+              '      eq.cursor = -1' ]
+
+  pos = 0
+  for funcs in schedule:
+    for func in funcs:
+      name = 'comb_{}'.format( func.id )
+      names.append( name )
+      objs .append( func )
+      lines += [ '      if bv[{}]:'.format( func.id ),
+                 '        bv[{}] = False'.format( func.id ),
+                 '        eq.cursor = {}'.format( pos ),
+                 '        sim._current_func = {}'.format( name ) ]
+      if collect_metrics:
+        lines.append( '        metrics.incr_comb_evals( {} )'.format( name ) )
+      lines += [ '        {}()'.format( name ),
+                 '        if eq.dirty: continue' ]
+      pos += 1
+
+  lines += [ '      eq.cursor = {}'.format( nblocks ),
+             '    sim._current_func = None' ]
+  return lines
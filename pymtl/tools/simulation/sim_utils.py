@@ -2,12 +2,15 @@
 # sim_utils.py
 #=======================================================================
 
+import collections
+import re
 import warnings
 import greenlet
 
-from ..ast_helpers            import get_method_ast
+from ..ast_helpers            import get_method_ast, get_cached_analysis
 from ...datatypes.SignalValue import SignalValue
 
+from split_blocks import split_comb_block
 from ast_visitor import (
   DetectLoadsAndStores,
   DetectDecorators,
@@ -19,12 +22,17 @@ from ast_visitor import (
 # collect_signals
 #-----------------------------------------------------------------------
 # Utility function to collect all the Signal type objects (ports,
-# wires, constants) in the model.
+# wires, constants) in the model. Signals are returned in a list, in
+# the order of a pre-order walk of the model hierarchy.
 def collect_signals( model ):
   #self.metrics.reg_model( model )
-  signals = set( model.get_ports() + model.get_wires() )
-  for m in model.get_submodules():
-    signals.update( collect_signals( m ) )
+  signals = []
+  models  = [ model ]
+  while models:
+    m = models.pop()
+    signals.extend( m.get_ports() )
+    signals.extend( m.get_wires() )
+    models.extend( reversed( m.get_submodules() ) )
   return signals
 
 #-----------------------------------------------------------------------
@@ -33,66 +41,102 @@ def collect_signals( model ):
 # Generate nets describing structural connections in the model.  Each
 # net describes a set of Signal objects which have been interconnected,
 # either directly or indirectly, by calls to connect().
+#
+# Each Signal is given an integer id in the order they are encountered
+# (constants only become part of the design through their connections)
+# and nets are built with a union-find structure over these ids, so
+# construction is linear in the number of signals and connections. Nets
+# are returned as lists of Signals ordered by id, and connections
+# involving slices are returned separately, in the order first seen.
 def signals_to_nets( signals ):
 
-  nets           = []
-  slice_connects = set()
+  signal_list    = []   # id -> Signal
+  signal_ids     = {}   # id( Signal ) -> id
+  slice_connects = []
+  slice_seen     = set()
+
+  for signal in signals:
+    if id( signal ) not in signal_ids:
+      signal_ids[ id( signal ) ] = len( signal_list )
+      signal_list.append( signal )
+
+  parent = range( len( signal_list ) )  # parent id in union-find forest
+
+  # Union the endpoints of every connection. Connections are found from
+  # both endpoints but only need to be handled from the first one seen.
+  # Constants are given ids (and signal_list grows) as they are found.
+
+  idx = 0
+  while idx < len( signal_list ):
+    signal = signal_list[ idx ]
+    for c in signal.connections:
 
-  #---------------------------------------------------------------------
-  # valid_connection
-  #---------------------------------------------------------------------
-  # Utility function to filter only supported connections (ports/wires),
-  # ignore slices and constants.
-  def valid_connection( c ):
-    if c.src_slice != None or c.dest_slice != None:
       # TODO: collect slice connections somewhere else
-      slice_connects.add( c )
-      return False
+      if c.src_slice is not None or c.dest_slice is not None:
+        if id( c ) not in slice_seen:
+          slice_seen.add( id( c ) )
+          slice_connects.append( c )
+        continue
+
+      other     = c.dest_node if c.src_node is signal else c.src_node
+      other_idx = signal_ids.get( id( other ) )
+      if other_idx is None:
+        other_idx = signal_ids[ id( other ) ] = len( signal_list )
+        signal_list.append( other )
+        parent.append( other_idx )
+      elif other_idx < idx:
+        continue
+
+      # Link the root of the tree holding the higher id to the root of
+      # the other tree, so roots are always the lowest id of their net
+
+      a = parent[ idx ]
+      if parent[ a ] != a: a = _find_root( parent, idx )
+      b = parent[ other_idx ]
+      if parent[ b ] != b: b = _find_root( parent, other_idx )
+      if   a < b: parent[ b ] = a
+      elif b < a: parent[ a ] = b
+
+    idx += 1
+
+  # Group signals by the root of their tree. Each independent net will
+  # later be transformed into a single SignalValue object.
+
+  nets      = []
+  root_nets = {}
+  for idx, signal in enumerate( signal_list ):
+    root = parent[ idx ]
+    if parent[ root ] != root: root = _find_root( parent, idx )
+    if root == idx:
+      net = root_nets[ idx ] = [ signal ]
+      nets.append( net )
     else:
-      return True
-
-  #---------------------------------------------------------------------
-  # iter_dfs
-  #---------------------------------------------------------------------
-  # Iterative Depth-First-Search algorithm, borrowed from Listing 5-5
-  # in 'Python Algorithms': http://www.apress.com/9781430232377/
-  def iter_dfs( s ):
-    S, Q = set(), []
-    Q.append( s )
-    while Q:
-      u = Q.pop()
-      if u in S: continue
-      S.add( u )
-      connected_signals = [ x.other( u ) for x in u.connections
-                            if valid_connection( x ) ]
-      Q.extend( connected_signals )
-      #yield u
-    return S
-
-  # Initially signals contains all the Signal type objects in the model.
-  # We perform a depth-first search on the connections of each Signal
-  # object, and remove connected objects from the signals set.  The
-  # result is a collection of nets describing structural connections in
-  # the design. Each independent net will later be transformed into a
-  # single SignalValue object.
-
-  while signals:
-    s = signals.pop()
-    net = iter_dfs( s )
-    for i in net:
-      #if i is not s: signals.remove( i )
-      signals.discard( i )
-    nets.append( net )
+      root_nets[ root ].append( signal )
 
   return nets, slice_connects
 
+#-----------------------------------------------------------------------
+# _find_root
+#-----------------------------------------------------------------------
+# Find the root of the union-find tree holding idx, compressing the path
+# along the way.
+def _find_root( parent, idx ):
+  root = parent[ idx ]
+  while parent[ root ] != root:
+    root = parent[ root ]
+  while parent[ idx ] != root:
+    parent[ idx ], idx = root, parent[ idx ]
+  return root
+
 #---------------------------------------------------------------------
 # insert_signal_values
 #---------------------------------------------------------------------
 # Transform each net into a single SignalValue object. Model attributes
 # currently referencing Signal objects will be modified to reference
-# the SignalValue object of their associated net instead.
-def insert_signal_values( sim, nets ):
+# the SignalValue object of their associated net instead. If a
+# SignalStorage is provided, Bits-typed nets are allocated in it rather
+# than as individual objects.
+def insert_signal_values( sim, nets, storage = None ):
 
   # Utility functions which create SignalValue callbacks.
 
@@ -107,9 +151,19 @@ def insert_signal_values( sim, nets ):
   #-------------------------------------------------------------------
   # create_seq_update_cb
   #-------------------------------------------------------------------
+  # Registers are given an id in the simulator's register table, and a
+  # bitmap of dirty ids ensures each is queued at most once per cycle
+  # (see SimulationTool._flop_registers).
   def create_seq_update_cb( sim, svalue ):
+    idx   = len( sim._registers )
+    queue = sim._register_queue
+    dirty = sim._register_dirty
+    sim._registers.append( svalue )
+    dirty.append( 0 )
     def notify_sim_seq_update():
-      sim._register_queue.append( svalue )
+      if not dirty[ idx ]:
+        dirty[ idx ] = 1
+        queue.append( idx )
     return notify_sim_seq_update
 
   # Each grouping represents a single SignalValue object. Perform a swap
@@ -117,29 +171,36 @@ def insert_signal_values( sim, nets ):
   # grouping instead point to the SignalValue.
   for group in nets:
 
-    # Get an element out of the set and use it to determine the bitwidth
-    # of the net, needed to create a properly sized SignalValue object.
-    # TODO: no peek() so have to pop() then reinsert it! Another way?
+    # Use the first element of the net to determine the bitwidth of the
+    # net, needed to create a properly sized SignalValue object.
     # TODO: what about BitStructs?
-    temp = group.pop()
-    group.add( temp )
+    temp = group[0]
+
+    # If the simulator uses array storage, allocate the net there. The
+    # returned view already provides the sequential and combinational
+    # update callbacks (see SignalStorage.py).
+    if storage is not None and storage.supports( temp.dtype ):
+      svalue = storage.create_value( temp.dtype )
+
+    else:
 
-    # TODO: should this be visible to sim?
-    svalue       = temp.dtype()
-    svalue._next = temp.dtype()
+      # TODO: should this be visible to sim?
+      svalue       = temp.dtype()
+      svalue._next = temp.dtype()
 
-    #svalue._DEBUG_signal_names = group
+      #svalue._DEBUG_signal_names = group
 
-    # Add a callback to the SignalValue to notify SimulationTool every
-    # time a sequential update occurs (.next is written).
-    # TODO: currently all signals get this, necessary?
-    svalue.notify_sim_seq_update = create_seq_update_cb ( sim, svalue )
+      # Add a callback to the SignalValue to notify SimulationTool every
+      # time a sequential update occurs (.next is written).
+      # TODO: currently all signals get this, necessary?
+      if sim is not None:
+        svalue.notify_sim_seq_update = create_seq_update_cb( sim, svalue )
 
-    # Create a callback for the SignalValue to notify SimulationTool
-    # every time a combinational update occurs (.value is written).
-    # We just store the callback for now, only add it later if we detect
-    # that a combinational block is sensitive to us.
-    svalue._ucb                   = create_comb_update_cb( sim, svalue )
+      # Create a callback for the SignalValue to notify SimulationTool
+      # every time a combinational update occurs (.value is written).
+      # We just store the callback for now, only add it later if we detect
+      # that a combinational block is sensitive to us.
+      svalue._ucb                   = create_comb_update_cb( sim, svalue )
 
     # Modify model attributes currently referencing Signal objects to
     # reference SignalValue objects instead.
@@ -151,14 +212,44 @@ def insert_signal_values( sim, nets ):
         svalue.constant = True
       # Otherwise swap the value
       else:
-        # We need 'in locals()' because of the nested function above,
-        # see: http://stackoverflow.com/a/4484946
-        exec( "x.parent.{} = svalue".format( x.name ) ) in locals()
+        _rebind_attr( x.parent, x.name, svalue )
 
       # Also give signals a pointer to the SignalValue object.
       # (Needed for VCD tracing and slice logic generator).
       x._signalvalue = svalue
 
+#---------------------------------------------------------------------
+# _attr_path
+#---------------------------------------------------------------------
+# Split the name of a model attribute, as assigned during elaboration
+# (e.g., 'in_', 'bundle.msg', 'ports[3]' or 'reqs[2].val'), into a tuple
+# of attribute names and list indices. Names are shared between all
+# instances of a model class, so parsed paths are cached.
+
+_attr_paths   = {}
+_attr_path_re = re.compile( r'(\w+)|\[(\d+)\]' )
+
+def _attr_path( name ):
+  try:
+    return _attr_paths[ name ]
+  except KeyError:
+    path = tuple( attr if attr else int( index )
+                  for attr, index in _attr_path_re.findall( name ) )
+    _attr_paths[ name ] = path
+    return path
+
+#---------------------------------------------------------------------
+# _rebind_attr
+#---------------------------------------------------------------------
+# Equivalent to exec( "obj.{} = value".format( name ) ).
+def _rebind_attr( obj, name, value ):
+  path = _attr_path( name )
+  for step in path[:-1]:
+    obj = obj[ step ] if step.__class__ is int else getattr( obj, step )
+  last = path[-1]
+  if last.__class__ is int: obj[ last ] = value
+  else:                     setattr( obj, last, value )
+
 #---------------------------------------------------------------------
 # register_seq_blocks
 #---------------------------------------------------------------------
@@ -178,41 +269,85 @@ def register_seq_blocks( model ):
   for i in all_models:
     for func in i.get_tick_blocks() + i.get_posedge_clk_blocks():
 
-      # Grab the AST and src code of each function
-      tree, src = get_method_ast( func )
-
       # Check there were no mistakes in use of .value/.next
-      DetectIncorrectValueNext( func, 'value' ).visit( tree )
-      DetectMissingValueNext  ( func, 'next'  ).visit( tree )
+      _check_value_next( func, 'value', 'next' )
 
       # If function is decorated with tick_fl, wrap it with a greenlet
-      if 'tick_fl' in DetectDecorators().enter( tree ):
+      decorators = get_cached_analysis( func, 'decorators',
+                     lambda tree: DetectDecorators().enter( tree ) )
+      if 'tick_fl' in decorators:
         func = _pausable_tick( func )
 
       sequential_blocks.append( func )
 
     for func in i.get_combinational_blocks():
-
-      tree, _ = get_method_ast( func )
-      DetectIncorrectValueNext( func, 'next'  ).visit( tree )
-      DetectMissingValueNext  ( func, 'value' ).visit( tree )
+      _check_value_next( func, 'next', 'value' )
 
   return sequential_blocks
 
+#---------------------------------------------------------------------
+# _check_value_next
+#---------------------------------------------------------------------
+# Check that a block never writes .incorrect and that it does not write
+# signals without using .missing. The AST analyses are shared by all
+# blocks with the same code, only evaluating the assignment targets in
+# the closure of the block is repeated for every instance.
+def _check_value_next( func, incorrect, missing ):
+
+  def check_incorrect( tree ):
+    DetectIncorrectValueNext( func, incorrect ).visit( tree )
+    return True
+
+  def collect_targets( tree ):
+    # Collecting the targets modifies the AST, use a private copy
+    tree, _ = get_method_ast( func )
+    return DetectMissingValueNext( func, missing ).collect_targets( tree )
+
+  get_cached_analysis( func, 'incorrect_' + incorrect, check_incorrect )
+
+  targets = get_cached_analysis( func, 'targets_' + missing,
+                                 collect_targets, persist=False )
+  DetectMissingValueNext( func, missing ).check_targets( targets )
+
+#---------------------------------------------------------------------
+# _get_loads_and_stores
+#---------------------------------------------------------------------
+# Names of the signals read and written by a block.
+def _get_loads_and_stores( func ):
+  return get_cached_analysis( func, 'loads_and_stores',
+           lambda tree: DetectLoadsAndStores().enter( tree ) )
+
 #---------------------------------------------------------------------
 # register_comb_blocks
 #---------------------------------------------------------------------
 # Register all decorated @combinational functions with the simulator.
 # Combinational logic blocks are registered with SignalValue objects
-# and get added to the event queue when values are updated.
-def register_comb_blocks( model, event_queue ):
+# and get added to the event queue when values are updated. If split is
+# True, blocks looping over lists of ports are registered as one
+# callback per loop index where possible (see split_blocks.py).
+def register_comb_blocks( model, event_queue, split = False ):
+
+  # Names are resolved against the SignalValues inserted by
+  # insert_signal_values, start with a fresh name table
+
+  model._name_table   = {}
+  model._split_blocks = {}
 
   # Get the sensitivity list of each event driven (combinational) block
   # TODO: do before or after we swap value nodes?
 
   for func in model.get_combinational_blocks():
-    tree, _ = get_method_ast( func )
-    loads, stores = DetectLoadsAndStores().enter( tree )
+
+    if split:
+      parts = split_comb_block( model, func )
+      if parts is not None:
+        model._split_blocks[ func ] = [ part for part, _, _ in parts ]
+        for part, reads, writes in parts:
+          part.writes = writes
+          model._newsenses[ part ].extend( reads )
+        continue
+
+    loads, stores = _get_loads_and_stores( func )
     for name in loads:
       _add_senses( func, model, name )
 
@@ -243,7 +378,7 @@ def register_comb_blocks( model, event_queue ):
 
   # Recursively perform for submodules
   for m in model.get_submodules():
-    register_comb_blocks( m, event_queue )
+    register_comb_blocks( m, event_queue, split )
 
 #-----------------------------------------------------------------------
 # _add_senses
@@ -251,63 +386,94 @@ def register_comb_blocks( model, event_queue ):
 # Utility function to recursively add signals/lists of signals to
 # the sensitivity list.
 def _add_senses( func, model, name ):
-  obj = _attr_name_to_object( model, name )
+  model._newsenses[ func ].extend( _name_to_nets( model, name ) )
+
+#-----------------------------------------------------------------------
+# _name_to_nets
+#-----------------------------------------------------------------------
+# Utility function to recursively turn a name acquired from the ast into
+# the list of nets (SignalValue objects created by insert_signal_values)
+# it refers to.
+def _name_to_nets( model, name, warn=True ):
+  nets = []
+  obj  = _attr_name_to_object( model, name, warn )
   # If name_to_object returned a tuple, this is a list inside of a
   # for loop.  Iteratively go through each object in the list and
-  # recursively call add_senses on it.
+  # recursively call name_to_nets on it.
   if   isinstance( obj, tuple ):
     obj_list, list_name, attr = obj
     for i, o in enumerate( obj_list ):
       obj_name = "{}[{}]{}".format( list_name, i, attr )
-      _add_senses( func, model, obj_name )
+      nets.extend( _name_to_nets( model, obj_name, warn ) )
 
-  # If this is a signal value, add it to the sensitivity list
+  # If this is a signal value, add it to the list of nets
   elif isinstance( obj, SignalValue ):
 
     # Distinguish between attributes storing signals (InPort/OutPort/Wire)
     # and SignalValues (e.g., Bits), by checking the _ucb attribute.
     target_bits = obj._target_bits
     if hasattr( target_bits, '_ucb' ):
-      model._newsenses[ func ].append( target_bits )
-    elif model._debug:
+      nets.append( target_bits )
+    elif model._debug and warn:
       warnings.warn( "Cannot add SignalValue '{}' to sensitivity list."
                      "".format( name ), Warning )
 
+  return nets
+
 #-----------------------------------------------------------------------
 # _attr_name_to_object
 #-----------------------------------------------------------------------
 # Utility function to turn attributes/names acquired from the ast
-# into Python objects
-# TODO: should never use eval... but this is easy
+# into Python objects. Results are memoized in a name table kept on
+# each model, since the same names are looked up by every block reading
+# a signal and again when scheduling.
 # TODO: how to handle when self is neither 's' nor 'self'?
 # TODO: how to handle temps!
-def _attr_name_to_object( model, name ):
-  # Temporarily creates the names 'self' and 's' in the current
-  # scope.  SUPER HACKY
-  self = s = model
-  # If slice or list, get name components previous to indexing
-  if '[?]' in name:
-    name, extra = name.split('[?]', 1)
+def _attr_name_to_object( model, name, warn=True ):
+  try:
+    table = model._name_table
+  except AttributeError:
+    table = model._name_table = {}
+  try:
+    x = table[ name ]
+  except KeyError:
+    x = table[ name ] = _lookup_attr_name( model, name )
   # Try to return the Python object attached to the name. If the
   # object is not a  SignalValue or a list, we can't add it to
   # the sensitivity list.  Sometimes this is okay (eg. constants),
   # but sometimes this indicates an error in the user's code, so
   # display a warning.
+  if x is None and model._debug and warn:
+    warnings.warn( "Cannot add variable '{}' to sensitivity list."
+                   "".format( name ), Warning )
+  return x
+
+#-----------------------------------------------------------------------
+# _lookup_attr_name
+#-----------------------------------------------------------------------
+# Resolve a name of the form 's.a.b[2].c' (or starting with 'self')
+# by walking the attributes and list indices from the model. Returns
+# the SignalValue named, a tuple for lists (see below), or None if the
+# name does not refer to either.
+def _lookup_attr_name( model, name ):
+  # If slice or list, get name components previous to indexing
+  extra = None
+  if '[?]' in name:
+    name, extra = name.split('[?]', 1)
+  path = _attr_path( name )
+  if not path or path[0] not in ( 's', 'self' ):
+    return None
+  x = model
+  for step in path[1:]:
+    x = x[ step ] if step.__class__ is int else getattr( x, step )
   # In the case of a list, we need to reconstruct the name of each
   # item in the list so we can try to add it to the sensitivity
   # list. Return a tuple containing the list object, the list name
   # and the attribute string the appears after the list indexing.
-  try:
-    x = eval( name )
-    if   isinstance( x, SignalValue ): return x
-    elif isinstance( x, list        ): return ( x, name, extra )
-    else:                              raise NameError
-  except NameError:
-    if model._debug:
-      warnings.warn( "Cannot add variable '{}' to sensitivity list."
-                     "".format( name ), Warning )
-    return None
-
+  if   isinstance( x, SignalValue ):        return x
+  elif isinstance( x, list ) and extra is not None:
+                                            return ( x, name, extra )
+  else:                                     return None
 
 #-----------------------------------------------------------------------
 # create_slice_callbacks
@@ -317,6 +483,8 @@ def _attr_name_to_object( model, name ):
 # graph update logic.
 def create_slice_callbacks( slice_connects, event_queue ):
 
+  slice_callbacks = []
+
   for c in slice_connects:
     src = c.src_node._signalvalue
     # If slice is connect to a Constant, don't create a callback.
@@ -336,6 +504,67 @@ def create_slice_callbacks( slice_connects, event_queue ):
       event_queue.enq( func_ptr.cb, func_ptr.id )
       #self.metrics.reg_eval( func_ptr.cb, is_slice = True )
       #self._DEBUG_signal_cbs[ signal_value ].append( func_ptr )
+      slice_callbacks.append( func_ptr )
+
+  return slice_callbacks
+
+#-----------------------------------------------------------------------
+# register_metrics
+#-----------------------------------------------------------------------
+# Register the models and the blocks evaluated by the simulator with a
+# SimulationMetrics instance. Blocks are named by their position in the
+# model hierarchy, e.g. 'top.xbar.comb_logic[3]' for index 3 of a split
+# block.
+def register_metrics( metrics, model, slice_callbacks ):
+
+  def visit( m, prefix ):
+    metrics.reg_model( m )
+    for block in m.get_combinational_blocks():
+      parts = m._split_blocks.get( block )
+      if parts is None:
+        metrics.reg_eval( block, name = prefix + block.__name__ )
+        continue
+      for part in parts:
+        metrics.reg_eval( part, name = prefix + part.__name__,
+                          split = ( prefix + block.__name__, len( parts ) ) )
+    for subm in m.get_submodules():
+      visit( subm, prefix + subm.name + '.' )
+
+  visit( model, model.name + '.' )
+
+  for func in slice_callbacks:
+    metrics.reg_eval( func, is_slice = True )
+
+#-----------------------------------------------------------------------
+# register_profiler
+#-----------------------------------------------------------------------
+# Register the blocks executed by the simulator with a
+# SimulationProfiler, together with the path of the model instance each
+# block belongs to. Slice connections are attributed to the top-level
+# model.
+def register_profiler( profiler, model, sequential_blocks, slice_callbacks ):
+
+  tick_paths = {}
+
+  def visit( m, path ):
+    path = path + ( m.name, )
+    for func in m.get_tick_blocks() + m.get_posedge_clk_blocks():
+      tick_paths[ func ] = path
+    for func in m._newsenses:
+      profiler.register( func, path, func.__name__ )
+    for subm in m.get_submodules():
+      visit( subm, path )
+
+  visit( model, () )
+
+  # Pausable (tick_fl) blocks are wrapped, see _pausable_tick
+
+  for func in sequential_blocks:
+    block = getattr( func, 'tick_func', func )
+    profiler.register( func, tick_paths[ block ], block.__name__ )
+
+  for func in slice_callbacks:
+    profiler.register( func, ( model.name, ), '[slices]' )
 
 #-----------------------------------------------------------------------
 # _create_slice_cb_closure
@@ -351,8 +580,130 @@ def _create_slice_cb_closure( c ):
     # to a BitSlice will updates the Bits it was sliced from, but
     # not vice versa.
     dest_bits.v = src[ src_addr ]
+  # Keep track of the nets we read and write, these are needed when
+  # creating a static schedule of the combinational logic.
+  slice_cb.src  = src
+  slice_cb.dest = dest
   return slice_cb
 
+#-----------------------------------------------------------------------
+# create_comb_schedule
+#-----------------------------------------------------------------------
+# Create a static schedule for all @combinational blocks and slice
+# callbacks in the design. We build a dependency graph where an edge
+# from block A to block B means A writes a net that B reads, find the
+# strongly connected components (SCCs) of this graph, and topologically
+# sort them. The returned schedule is a list of levels, each level is a
+# list of blocks. Blocks in an acyclic design each get their own level;
+# all blocks in a combinational loop share a single level.
+def create_comb_schedule( model, slice_callbacks ):
+
+  blocks = []
+  reads  = {}
+  writes = {}
+
+  # Collect the nets read and written by every @combinational block.
+  # Reads are the sensitivity list built by register_comb_blocks,
+  # writes are detected by analyzing the stores in the block's AST.
+
+  def collect_blocks( m ):
+    for block in m.get_combinational_blocks():
+      # Split blocks are scheduled as their per-index callbacks
+      for func in m._split_blocks.get( block, [ block ] ):
+        # Blocks with an empty sensitivity list are never executed
+        if func not in m._newsenses: continue
+        blocks.append( func )
+        reads [ func ] = m._newsenses[ func ]
+        if func is not block:
+          writes[ func ] = func.writes
+          continue
+        loads, stores = _get_loads_and_stores( func )
+        writes[ func ] = [ net for name in stores
+                               for net  in _name_to_nets( m, name, warn=False ) ]
+    for subm in m.get_submodules():
+      collect_blocks( subm )
+
+  collect_blocks( model )
+
+  # Slice callbacks read their source net and write their dest net.
+
+  for func in slice_callbacks:
+    blocks.append( func )
+    reads [ func ] = [ func.src  ]
+    writes[ func ] = [ func.dest ]
+
+  # Map each net to the blocks that read it, then connect every block
+  # to the readers of the nets it writes.
+
+  readers = collections.defaultdict( list )
+  for func in blocks:
+    for net in reads[ func ]:
+      readers[ net ].append( func )
+
+  edges = {}
+  for func in blocks:
+    edges[ func ] = [ dst for net in writes[ func ]
+                          for dst in readers[ net ] ]
+
+  # Tarjan's algorithm returns the SCCs in reverse topological order.
+  # Blocks within an SCC are kept in the order they were registered.
+
+  position = { func : i for i, func in enumerate( blocks ) }
+  return [ sorted( scc, key=position.get )
+           for scc in reversed( _find_sccs( blocks, edges ) ) ]
+
+#-----------------------------------------------------------------------
+# _find_sccs
+#-----------------------------------------------------------------------
+# Iterative implementation of Tarjan's strongly connected components
+# algorithm (avoids hitting the recursion limit on large designs).
+def _find_sccs( nodes, edges ):
+
+  index    = {}
+  lowlink  = {}
+  on_stack = set()
+  stack    = []
+  sccs     = []
+
+  for root in nodes:
+    if root in index: continue
+
+    index[ root ] = lowlink[ root ] = len( index )
+    stack.append( root )
+    on_stack.add( root )
+    work = [ ( root, iter( edges[ root ] ) ) ]
+
+    while work:
+      node, children = work[-1]
+
+      # Descend into the first unvisited child, if any
+      for child in children:
+        if child not in index:
+          index[ child ] = lowlink[ child ] = len( index )
+          stack.append( child )
+          on_stack.add( child )
+          work.append( ( child, iter( edges[ child ] ) ) )
+          break
+        elif child in on_stack:
+          lowlink[ node ] = min( lowlink[ node ], index[ child ] )
+
+      # All children visited, pop the node and emit an SCC if root
+      else:
+        work.pop()
+        if work:
+          parent = work[-1][0]
+          lowlink[ parent ] = min( lowlink[ parent ], lowlink[ node ] )
+        if lowlink[ node ] == index[ node ]:
+          scc = []
+          while True:
+            x = stack.pop()
+            on_stack.discard( x )
+            scc.append( x )
+            if x is node: break
+          sccs.append( scc )
+
+  return sccs
+
 
 #---------------------------------------------------------------------
 # _pausable_tick
@@ -389,6 +740,7 @@ def _pausable_tick( func ):
   def outer_wrapper():
     func._pausable_tick.switch()
 
+  outer_wrapper.tick_func = func
   return outer_wrapper
 
 #-----------------------------------------------------------------------
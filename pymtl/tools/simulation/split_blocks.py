@@ -0,0 +1,238 @@
+#=======================================================================
+# split_blocks.py
+#=======================================================================
+# Split sensitivity for @combinational blocks.
+#
+# A block whose body is a single loop over a range of indices, e.g.
+#
+#   @s.combinational
+#   def comb_logic():
+#     for i in range( nports ):
+#       s.out[i].value = s.in_[ s.sel[i] ]
+#
+# is normally re-evaluated as a whole whenever any signal it reads
+# changes. When split sensitivity is enabled (see SimulationTool), such
+# blocks are replaced by one callback per index which executes a single
+# iteration of the loop and is only sensitive to the signals read by
+# that iteration, so a change to sel[3] only re-evaluates index 3.
+#
+# Blocks are only split when this cannot change their behavior: the
+# loop must be the only statement of the block, iterations may not
+# carry state in local variables or leave the loop early (break,
+# continue, return), and the nets written by each iteration may neither
+# overlap nor be read by any other iteration.
+
+import ast, _ast
+
+from ..ast_helpers import get_method_ast, get_cached_analysis
+from ast_visitor   import DetectLoadsAndStores
+
+#-----------------------------------------------------------------------
+# split_comb_block
+#-----------------------------------------------------------------------
+# Returns a list of ( callback, reads, writes ) tuples, one per loop
+# index, where reads and writes are the nets (SignalValues) accessed by
+# that index. Returns None if the block cannot be split. Must be called
+# after insert_signal_values.
+def split_comb_block( model, func ):
+
+  from sim_utils import _name_to_nets
+
+  info = get_cached_analysis( func, 'split_block', _analyze_split )
+  if info is None:
+    return None
+  loopvar, loads, stores = info
+
+  # Create the function executing one iteration of the loop, using the
+  # current values of the variables the block closes over
+
+  try:
+    cells = [ c.cell_contents for c in func.func_closure or () ]
+  except ValueError:
+    return None
+
+  factory = get_cached_analysis( func, 'split_factory',
+              lambda tree: _compile_split( func, loopvar ), persist=False )
+  body, indices = factory( *cells )
+
+  if not indices or not all( isinstance( k, ( int, long ) ) for k in indices ):
+    return None
+
+  # Resolve the signals accessed by each iteration. Stores to anything
+  # but a local variable must resolve to nets, otherwise we cannot tell
+  # whether iterations are independent.
+
+  def resolve( names, k ):
+    index = '[{}]'.format( k )
+    return [ net for name in names
+                 for net  in _name_to_nets( model, name.replace( '[#]', index ),
+                                            warn=False ) ]
+
+  reads  = [ resolve( loads, k ) for k in indices ]
+  writes = []
+  for k in indices:
+    nets = []
+    for name in stores:
+      if '.' in name or '[' in name:
+        store_nets = resolve( [ name ], k )
+        if not store_nets:
+          return None
+        nets.extend( store_nets )
+    writes.append( nets )
+
+  writer = {}
+  for j, nets in enumerate( writes ):
+    for net in nets:
+      if writer.setdefault( id( net ), j ) != j:
+        return None
+  for k, nets in enumerate( reads ):
+    for net in nets:
+      if writer.get( id( net ), k ) != k:
+        return None
+
+  return [ ( _create_part( func, body, k ), r, w )
+           for k, r, w in zip( indices, reads, writes ) ]
+
+#-----------------------------------------------------------------------
+# _create_part
+#-----------------------------------------------------------------------
+def _create_part( func, body, k ):
+  def part():
+    body( k )
+  part.__name__    = '{}[{}]'.format( func.__name__, k )
+  part.split_block = func
+  return part
+
+#-----------------------------------------------------------------------
+# _analyze_split
+#-----------------------------------------------------------------------
+# Checks whether the shape of a block allows it to be split. Returns
+# the name of the loop variable and the names loaded and stored by the
+# loop body (with '[#]' marking subscripts by the loop variable), or
+# None if the block cannot be split.
+def _analyze_split( tree ):
+
+  func = tree.body[0]
+  body = func.body
+  if body and isinstance( body[0], _ast.Expr ) \
+          and isinstance( body[0].value, _ast.Str ):
+    body = body[1:]
+
+  args = func.args
+  if args.args or args.vararg or args.kwarg:
+    return None
+
+  if len( body ) != 1 or not isinstance( body[0], _ast.For ):
+    return None
+
+  loop = body[0]
+  if ( loop.orelse or not isinstance( loop.target, _ast.Name )
+       or not isinstance( loop.iter, _ast.Call )
+       or not isinstance( loop.iter.func, _ast.Name )
+       or loop.iter.func.id not in ( 'range', 'xrange' ) ):
+    return None
+
+  loopvar = loop.target.id
+  if not _iterations_independent( loop.body, loopvar ):
+    return None
+
+  loads, stores = DetectLoadsAndStores( loopvar ) \
+                    .enter( _ast.Module( body=loop.body ) )
+  return loopvar, loads, stores
+
+#-----------------------------------------------------------------------
+# _iterations_independent
+#-----------------------------------------------------------------------
+# Iterations must not leave the loop early, define nested scopes, or
+# read a local variable before assigning it in the same iteration
+# (which would observe the value left by the previous iteration). Only
+# unconditional assignments at the top level of the loop body count as
+# defining a local.
+def _iterations_independent( stmts, loopvar ):
+
+  unsupported = ( _ast.Break, _ast.Continue, _ast.Return, _ast.Yield,
+                  _ast.Global, _ast.Exec, _ast.FunctionDef, _ast.ClassDef,
+                  _ast.Lambda )
+
+  stored = set()
+  for node in ast.walk( _ast.Module( body=stmts ) ):
+    if isinstance( node, unsupported ):
+      return False
+    if isinstance( node, _ast.Name ) and \
+       isinstance( node.ctx, ( _ast.Store, _ast.Del ) ):
+      stored.add( node.id )
+
+  if loopvar in stored:
+    return False
+
+  defined = set()
+  for stmt in stmts:
+
+    loaded = set()
+    for node in ast.walk( stmt ):
+      if isinstance( node, _ast.Name ) and isinstance( node.ctx, _ast.Load ):
+        loaded.add( node.id )
+      elif isinstance( node, _ast.AugAssign ):
+        if not isinstance( node.target, _ast.Name ):
+          return False
+        loaded.add( node.target.id )
+
+    if ( loaded & stored ) - defined:
+      return False
+
+    if isinstance( stmt, _ast.Assign ):
+      for target in stmt.targets:
+        for node in ast.walk( target ):
+          if isinstance( node, _ast.Name ):
+            defined.add( node.id )
+
+  return True
+
+#-----------------------------------------------------------------------
+# _compile_split
+#-----------------------------------------------------------------------
+# Compiles a factory which, given the values of the free variables of
+# the block, returns a function executing the loop body for a single
+# index and the list of indices the loop iterates over:
+#
+#   def __split_factory( <free variables> ):
+#     def <block name>( <loop variable> ):
+#       <loop body>
+#     return <block name>, list( <loop range> )
+#
+# Line numbers match the original block so tracebacks point at the
+# user's code.
+def _compile_split( func, loopvar ):
+
+  code = func.__code__
+  tree = get_method_ast( func )[0]
+
+  func_def = tree.body[0]
+  loop     = [ stmt for stmt in func_def.body
+                    if isinstance( stmt, _ast.For ) ][0]
+
+  def arguments( names ):
+    return _ast.arguments( args=[ _ast.Name( id=name, ctx=_ast.Param() )
+                                  for name in names ],
+                           vararg=None, kwarg=None, defaults=[] )
+
+  body_def = _ast.FunctionDef( name=func_def.name, args=arguments( [ loopvar ] ),
+                               body=loop.body, decorator_list=[] )
+  indices  = _ast.Call( func=_ast.Name( id='list', ctx=_ast.Load() ),
+                        args=[ loop.iter ], keywords=[],
+                        starargs=None, kwargs=None )
+  ret      = _ast.Return( value=_ast.Tuple(
+                 elts=[ _ast.Name( id=func_def.name, ctx=_ast.Load() ), indices ],
+                 ctx=_ast.Load() ) )
+  factory  = _ast.FunctionDef( name='__split_factory',
+                               args=arguments( code.co_freevars ),
+                               body=[ body_def, ret ], decorator_list=[] )
+
+  for node in ( body_def, ret, factory ):
+    ast.copy_location( node, loop )
+  module = ast.fix_missing_locations( _ast.Module( body=[ factory ] ) )
+  ast.increment_lineno( module, code.co_firstlineno - 1 )
+
+  namespace = {}
+  exec compile( module, code.co_filename, 'exec' ) in func.func_globals, namespace
+  return namespace['__split_factory']
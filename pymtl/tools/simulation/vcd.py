@@ -7,14 +7,43 @@
 # - http://support.ema-eda.com/search/eslfiles/default/main/sl_legacy_releaseinfo/staging/sl3/release_info/psd142/vlogref/chap20.html#1031979
 # - http://staff.ustc.edu.cn/~songch/download/IEEE.1364-2005.pdf
 #
+# VCD output is enabled by setting the vcd_file attribute of the
+# top-level model before creating the simulator. The following model
+# attributes further configure the output:
+#
+# - vcd_timescale: the timescale written to the VCD header
+# - vcd_scopes:    list of hierarchy prefixes (e.g., 'top.proc.dpath'
+#                  or 'top.mem.resps[0]'), only signals under one of
+#                  them are dumped
+# - vcd_window:    if N > 0, only the last N cycles are kept in memory
+#                  and the VCD file is only written by sim.vcd.flush(),
+#                  or when an exception is raised by the simulator or a
+#                  test fails (see flush_vcd_windows)
+#
+# VCD files whose name ends with '.gz' are compressed with gzip by a
+# background thread.
+#
 # TODO:
 #
 # - distinguish reg signals from wire signals (maybe)
 
 from __future__ import print_function
 
+import atexit
+import collections
+import functools
+import gzip
+import Queue
+import threading
 import time
 import sys
+import weakref
+
+from cStringIO import StringIO
+
+# Size of the write buffer of VCD files opened by VCDUtil
+
+VCD_BUFFER_SIZE = 1 << 20
 
 #-----------------------------------------------------------------------
 # get_vcd_timescale
@@ -26,6 +55,17 @@ def get_vcd_timescale( model ):
   except AttributeError:
     return DEFAULT_TIMESCALE
 
+#-----------------------------------------------------------------------
+# get_vcd_window
+#-----------------------------------------------------------------------
+# The default window can be set for all tests with --vcd-window.
+DEFAULT_WINDOW = 0
+def get_vcd_window( model ):
+  try:
+    return model.vcd_window
+  except AttributeError:
+    return DEFAULT_WINDOW
+
 #-----------------------------------------------------------------------
 # write_vcd_header
 #-----------------------------------------------------------------------
@@ -60,13 +100,26 @@ def mangle_name( name ):
 #-----------------------------------------------------------------------
 # write_vcd_signal_defs
 #-----------------------------------------------------------------------
-def write_vcd_signal_defs( o, model ):
+# Define the signals of the design and return the list of nets they
+# belong to. If scopes is a list of hierarchy prefixes, only signals
+# under one of them are defined.
+def write_vcd_signal_defs( o, model, scopes = None ):
 
   vcd_symbol = _gen_vcd_symbol()
-  all_nets   = set()
+  all_nets   = []
+
+  def under( path, prefix ):
+    return path == prefix or path.startswith( prefix + '.' ) \
+                          or path.startswith( prefix + '[' )
+
+  def in_scope( path ):
+    return scopes is None or any( under( path, p ) for p in scopes )
+
+  def contains_scope( path ):
+    return scopes is None or any( under( p, path ) for p in scopes )
 
   # Inner utility function to perform recursive descent of the model.
-  def recurse_models( model, level ):
+  def recurse_models( model, path ):
 
     # Create a new scope for this module
     print( "$scope module {name} $end".format( name=model.name ), file=o )
@@ -74,74 +127,164 @@ def write_vcd_signal_defs( o, model ):
     # Define all signals for this model.
     for i in model.get_ports() + model.get_wires():
 
+      if not in_scope( path + '.' + i.name ):
+        continue
+
       # Multiple signals may be collapsed into a single net in the
       # simulator if they are connected. Generate new vcd symbols per
       # net, not per signal as an optimization.
       net = i._signalvalue
       if not hasattr( net, '_vcd_symbol' ):
         net._vcd_symbol = vcd_symbol.next()
-        net._vcd_is_clk = i.name == 'clk'
+        all_nets.append( net )
       symbol = net._vcd_symbol
 
       print( "$var {type} {nbits} {symbol} {name} $end".format(
           type='reg', nbits=i.nbits, symbol=symbol, name=mangle_name(i.name),
       ), file=o )
 
-      all_nets.add( net )
-
-    # Recursively visit all submodels.
+    # Recursively visit all submodels containing dumped signals.
     for submodel in model.get_submodules():
-      recurse_models( submodel, level+1 )
+      subpath = path + '.' + submodel.name
+      if in_scope( subpath ) or contains_scope( subpath ):
+        recurse_models( submodel, subpath )
 
     print( "$upscope $end", file=o )
 
   # Begin recursive descent from the top-level model.
-  recurse_models( model, 0 )
+  recurse_models( model, model.name )
 
   # Once all models and their signals have been defined, end the
-  # definition section of the vcd and print the initial values of all
-  # nets in the design.
+  # definition section of the vcd.
   print( "$enddefinitions $end\n", file=o )
-  for net in all_nets:
-    print( "b{value} {symbol}".format(
-        value=net.bin(), symbol=net._vcd_symbol,
-    ), file=o )
 
   return all_nets
 
 #-----------------------------------------------------------------------
-# insert_vcd_callbacks
+# write_vcd_values
 #-----------------------------------------------------------------------
-# Add callbacks which write the vcd file for each net in the design.
-def insert_vcd_callbacks( sim, nets ):
+# Write the time stamp and values of all nets at the start of the dump.
+def write_vcd_values( o, time, formats, values ):
+  o.write( '#{}\n$dumpvars\n'.format( time ) )
+  o.write( ''.join( [ fmt( value ) for fmt, value in zip( formats, values ) ] ) )
+  o.write( '$end\n' )
 
-  # A utility function which creates callbacks that write a nets current
-  # value to the vcd file. The returned callback function is a closure
-  # which is executed by the simulator whenever the net's value changes.
-  def create_vcd_callback( sim, net ):
-
-    # Each signal writes its binary value and unique identifier to the
-    # specified vcd file
-    if not net._vcd_is_clk:
-      cb = lambda: print( 'b%s %s\n' % (net.bin(), net._vcd_symbol),
-                          file=sim.vcd )
+#-----------------------------------------------------------------------
+# _vcd_formatter
+#-----------------------------------------------------------------------
+# Returns a function formatting the value of a net as a vcd value change
+# line. The format strings are cached per bitwidth.
+_vcd_formats = {}
+def _vcd_formatter( nbits, symbol ):
+  try:
+    fmt = _vcd_formats[ nbits ]
+  except KeyError:
+    fmt = _vcd_formats[ nbits ] = 'b{{:0{}b}} '.format( nbits )
+  symbol = symbol.replace( '{', '{{' ).replace( '}', '}}' )
+  return ( fmt + symbol + '\n' ).format
 
-    # The clock signal additionally must update the vcd time stamp
+#-----------------------------------------------------------------------
+# insert_vcd_callbacks
+#-----------------------------------------------------------------------
+# Add callbacks which write the vcd file for each net in the design.
+#
+# Nets may change several times while the simulator evaluates a cycle,
+# so instead of writing every change, the callback of each net only
+# marks the net as dirty. The values of the dirty nets are written once
+# at the end of each call to cycle() and eval_combinational(), and
+# before each new time stamp, which is written when the clock changes.
+# If window is a VCDWindow, changes are recorded in the window instead.
+def insert_vcd_callbacks( sim, nets, clk, window = None ):
+
+  dirty   = set()
+  formats = [ _vcd_formatter( net.nbits, net._vcd_symbol ) for net in nets ]
+  values  = [ net.uint for net in nets ]
+  clk_idx = None
+  for i, net in enumerate( nets ):
+    if net is clk:
+      clk_idx = i
+
+  # Write the current values of all dirty nets
+
+  if window is None:
+
+    def write_changes():
+      if dirty:
+        sim.vcd.write( ''.join( [ formats[i]( values[i]() ) for i in dirty ] ) )
+        dirty.clear()
+
+  else:
+
+    def write_changes():
+      if dirty:
+        window.step.update( [ ( i, values[i]() ) for i in dirty ] )
+        dirty.clear()
+
+  # The clock signal additionally must update the vcd time stamp, all
+  # changes made before the clock edge belong to the previous one
+
+  def clock_edge():
+    write_changes()
+    time = 100*sim.ncycles + 50*clk.uint()
+    if window is None:
+      sim.vcd.write( '#{}\n'.format( time ) )
+      if clk_idx is not None:
+        sim.vcd.write( formats[ clk_idx ]( clk.uint() ) )
     else:
-      cb = lambda: print( '#%s\nb%s %s\n' % (100*sim.ncycles+50*net.uint(),
-                          net.bin(), net._vcd_symbol),
-                          file=sim.vcd )
-
-    # Return the callback
-    return cb
-
-  # For each net in the simulator, create a callback and register it with
-  # the net to be fired whenever the value changes. We repurpose the
-  # existing callback facilities designed for slices (these execute
-  # immediately), rather than the default callback mechanism (these are
-  # put on the event queue to execute later).
-  for net in nets:
-    net.register_slice( create_vcd_callback( sim, net ) )
+      window.new_step( time )
+      if clk_idx is not None:
+        window.step[ clk_idx ] = clk.uint()
+
+  # For each net in the simulator, register a callback with the net to
+  # be fired whenever the value changes. We repurpose the existing
+  # callback facilities designed for slices (these execute immediately),
+  # rather than the default callback mechanism (these are put on the
+  # event queue to execute later).
+
+  for i, net in enumerate( nets ):
+    if net is not clk:
+      net.register_slice( functools.partial( dirty.add, i ) )
+  clk.register_slice( clock_edge )
+
+  # Write the changes made by cycle() and eval_combinational(). When
+  # only keeping a window of the simulation, dump the window if the
+  # simulator raises an exception.
+
+  cycle              = sim.cycle
+  eval_combinational = sim.eval_combinational
+
+  if window is None:
+
+    def vcd_cycle():
+      cycle()
+      write_changes()
+
+    def vcd_eval_combinational():
+      eval_combinational()
+      write_changes()
+
+  else:
+
+    def vcd_cycle():
+      try:
+        cycle()
+      except:
+        write_changes()
+        window.flush()
+        raise
+      write_changes()
+
+    def vcd_eval_combinational():
+      try:
+        eval_combinational()
+      except:
+        write_changes()
+        window.flush()
+        raise
+      write_changes()
+
+  sim.cycle              = vcd_cycle
+  sim.eval_combinational = vcd_eval_combinational
 
 #-----------------------------------------------------------------------
 # _gen_vcd_symbol
@@ -169,6 +312,168 @@ def _gen_vcd_symbol():
     yield next_vcd_symbol(n)
     n += 1
 
+#-----------------------------------------------------------------------
+# open_vcd_file
+#-----------------------------------------------------------------------
+# Open a file for writing VCD output, files whose name ends with '.gz'
+# are compressed by a background thread.
+def open_vcd_file( filename ):
+  if filename.endswith( '.gz' ):
+    return GzipWriter( filename )
+  return open( filename, 'w', VCD_BUFFER_SIZE )
+
+#-----------------------------------------------------------------------
+# GzipWriter
+#-----------------------------------------------------------------------
+# File-like object writing a gzip file. Data is collected in a buffer
+# and compressed and written by a background thread, so compression
+# overlaps with simulation. The file is closed when the writer is
+# garbage collected or the interpreter exits. Errors raised while
+# writing the file are raised by the next write, flush or close.
+class GzipWriter( object ):
+
+  def __init__( self, filename ):
+    self.name    = filename
+    self.closed  = False
+    self._gzfile = gzip.open( filename, 'wb', 1 )
+    self._queue  = Queue.Queue( maxsize=8 )
+    self._errors = []
+    self._chunks = []
+    self._size   = 0
+    self._thread = threading.Thread( target=_gzip_worker,
+                                     args=( self._queue, self._gzfile,
+                                            self._errors ) )
+    self._thread.daemon = True
+    self._thread.start()
+    atexit.register( _close_at_exit, weakref.ref( self ) )
+
+  def write( self, data ):
+    self._chunks.append( data )
+    self._size += len( data )
+    if self._size >= VCD_BUFFER_SIZE:
+      self._put()
+
+  def _put( self ):
+    self._check()
+    if self._chunks:
+      self._queue.put( ''.join( self._chunks ) )
+      self._chunks = []
+      self._size   = 0
+
+  def _check( self ):
+    if self._errors:
+      raise self._errors[0]
+
+  # Wait until all data has been compressed and written to the file
+
+  def flush( self ):
+    self._put()
+    self._queue.join()
+    self._check()
+    self._gzfile.flush()
+
+  def close( self ):
+    if not self.closed:
+      self.closed = True
+      if self._chunks and not self._errors:
+        self._queue.put( ''.join( self._chunks ) )
+      self._chunks = []
+      self._queue.put( None )
+      self._thread.join()
+      try:
+        self._check()
+      finally:
+        self._gzfile.close()
+
+  def __del__( self ):
+    self.close()
+
+# Once writing failed the worker keeps draining the queue, so that the
+# writer never blocks on a full queue before it reports the error
+
+def _gzip_worker( queue, gzfile, errors ):
+  while True:
+    data = queue.get()
+    try:
+      if data is None:
+        return
+      if not errors:
+        gzfile.write( data )
+    except Exception as e:
+      errors.append( e )
+    finally:
+      queue.task_done()
+
+def _close_at_exit( ref ):
+  writer = ref()
+  if writer is not None:
+    writer.close()
+
+#-----------------------------------------------------------------------
+# VCDWindow
+#-----------------------------------------------------------------------
+# Keeps the value changes of the last ncycles cycles of a simulation in
+# memory and writes them as a VCD file on demand. Changes are kept per
+# timestep (two per cycle, one per clock edge) as a dict mapping nets
+# to their new values. Timesteps leaving the window are folded into the
+# values of all nets at the start of the window.
+class VCDWindow( object ):
+
+  def __init__( self, filename, ncycles, header, formats, values ):
+    self.filename = filename
+    self.ncycles  = ncycles
+    self.header   = header
+    self.formats  = formats
+    self.base     = dict( enumerate( values ) )
+    self.steps    = collections.deque()
+    self.time     = 0
+    self.step     = {}
+    _vcd_windows.add( self )
+
+  # Start a new timestep
+
+  def new_step( self, time ):
+    self.steps.append( ( self.time, self.step ) )
+    if len( self.steps ) > 2*self.ncycles:
+      self.base.update( self.steps.popleft()[1] )
+    self.time = time
+    self.step = {}
+
+  # Write the window to the VCD file
+
+  def flush( self ):
+
+    steps = list( self.steps ) + [ ( self.time, self.step ) ]
+    start = dict( self.base )
+    start.update( steps[0][1] )
+
+    o = open_vcd_file( self.filename )
+    o.write( self.header )
+    write_vcd_values( o, steps[0][0], self.formats,
+                      [ start[i] for i in range( len( self.formats ) ) ] )
+    for time, changes in steps[1:]:
+      o.write( '#{}\n'.format( time ) )
+      o.write( ''.join( [ self.formats[i]( value )
+                          for i, value in changes.items() ] ) )
+    o.close()
+
+# All windows, flushed by flush_vcd_windows()
+
+_vcd_windows = weakref.WeakSet()
+
+#-----------------------------------------------------------------------
+# flush_vcd_windows
+#-----------------------------------------------------------------------
+# Write the VCD files of all simulators only keeping a window of the
+# simulation, and forget about them. Called by the py.test hooks in
+# conftest.py when a test fails.
+def flush_vcd_windows():
+  for window in list( _vcd_windows ):
+    window.flush()
+  clear_vcd_windows()
+
+def clear_vcd_windows():
+  _vcd_windows.clear()
 
 #-----------------------------------------------------------------------
 # VCDUtil
@@ -180,21 +485,44 @@ class VCDUtil():
 
   def __init__(self, simulator, outfile=None):
 
-    # Select the output for VCD
+    model  = simulator.model
+    scopes = getattr( model, 'vcd_scopes', None )
+    window = get_vcd_window( model )
 
-    if not outfile:
+    if window and not isinstance( outfile, str ):
+      raise ValueError( "A VCD window requires a vcd_file name!" )
+
+    # Select the output for VCD, windows are written to a buffer and
+    # only copied to the file when flushed
+
+    if window:
+      filename = outfile
+      outfile  = StringIO()
+    elif not outfile:
       outfile = sys.stdout
     elif isinstance(outfile, str):
-      outfile = open( outfile, 'w' )
+      outfile = open_vcd_file( outfile )
     else:
       outfile = outfile
 
     # Write out vcd header, signal definitions, and initial state
 
-    write_vcd_header( outfile, simulator.model )
-    nets = write_vcd_signal_defs( outfile, simulator.model )
+    write_vcd_header( outfile, model )
+    nets = write_vcd_signal_defs( outfile, model, scopes )
+    clk  = [ port for port in model.get_ports()
+                  if port.name == 'clk' ][0]._signalvalue
+
+    formats = [ _vcd_formatter( net.nbits, net._vcd_symbol ) for net in nets ]
+    values  = [ net.uint() for net in nets ]
+
+    if window:
+      outfile = VCDWindow( filename, window, outfile.getvalue(),
+                           formats, values )
+      insert_vcd_callbacks( simulator, nets, clk, outfile )
+    else:
+      write_vcd_values( outfile, 0, formats, values )
+      insert_vcd_callbacks( simulator, nets, clk )
 
     # Enable vcd mode on the simulator, set simulator output file name
 
     simulator.vcd = outfile
-    insert_vcd_callbacks( simulator, nets )
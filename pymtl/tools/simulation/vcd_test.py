@@ -2,7 +2,13 @@
 # vcd_test.py
 #=======================================================================
 
+import re
+import gzip
+import errno
 import inspect
+import pytest
+
+from vcd import flush_vcd_windows, open_vcd_file, VCD_BUFFER_SIZE
 
 #=======================================================================
 # Tests
@@ -37,3 +43,227 @@ def local_setup_sim( model ):
 
   sim = SimulationTool( model )
   return model, sim
+
+#=======================================================================
+# VCD Output Tests
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# Glitch
+#-----------------------------------------------------------------------
+# Writes tmp twice in every evaluation of the block.
+class Glitch( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 8 )
+    s.out = OutPort( 8 )
+    s.tmp = Wire   ( 8 )
+
+    @s.combinational
+    def comb_logic():
+      s.tmp.value = 0
+      s.tmp.value = s.in_
+
+    @s.tick
+    def seq_logic():
+      s.out.next = s.tmp
+
+#-----------------------------------------------------------------------
+# read_vcd
+#-----------------------------------------------------------------------
+# Returns a dict mapping the names of the signals to their symbols (the
+# first signal with a name, i.e., the outermost one, for duplicates),
+# and a list of ( time, [ ( symbol, value ) ] ) tuples, one per
+# timestep. Initial values ($dumpvars) are skipped.
+def read_vcd( filename ):
+  symbols = {}
+  steps   = []
+  depth   = 0
+  dump    = False
+  vcd     = gzip.open( filename ) if filename.endswith( '.gz' ) else open( filename )
+  for line in vcd:
+    fields = line.split()
+    if not fields or dump and fields[0] != '$end':
+      continue
+    if   fields[0] == '$dumpvars': dump = True
+    elif fields[0] == '$end':      dump = False
+    elif fields[0] == '$scope':    depth += 1
+    elif fields[0] == '$upscope':  depth -= 1
+    elif fields[0] == '$var':
+      symbols.setdefault( fields[4], fields[3] )
+    elif fields[0].startswith( '#' ):
+      steps.append( ( int( fields[0][1:] ), [] ) )
+    elif steps:
+      assert re.match( r'^b[01]+ \S+$', line )
+      steps[-1][1].append( ( fields[1], int( fields[0][1:], 2 ) ) )
+  return symbols, steps
+
+def test_vcd_output( tmpdir ):
+  model = Glitch()
+  model.vcd_file = str( tmpdir.join( 'glitch.vcd' ) )
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+  for i in range( 1, 5 ):
+    model.in_.value = i
+    sim.cycle()
+  sim.vcd.flush()
+
+  symbols, steps = read_vcd( model.vcd_file )
+
+  # Time stamps increase at every clock edge, every net is written at
+  # most once per timestep
+
+  assert [ t for t, _ in steps ] == range( 0, 600, 50 )
+  for t, changes in steps:
+    written = [ symbol for symbol, _ in changes ]
+    assert len( written ) == len( set( written ) )
+
+  # Inputs (and the combinational logic they drive) change before the
+  # falling edge, outputs of registers at the rising edge
+
+  def value_at( name, time ):
+    value = None
+    for t, changes in steps:
+      if t > time: break
+      for symbol, v in changes:
+        if symbol == symbols[ name ]:
+          value = v
+    return value
+
+  for i in range( 1, 5 ):
+    assert value_at( 'in_', 100*i     + 50 ) == i
+    assert value_at( 'tmp', 100*i     + 50 ) == i
+    assert value_at( 'out', 100*(i+1) + 50 ) == i
+
+def run_glitch( vcd_file, ncycles, **attrs ):
+  model = Glitch()
+  model.vcd_file = vcd_file
+  for name, value in attrs.items():
+    setattr( model, name, value )
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+  for i in range( 1, ncycles+1 ):
+    model.in_.value = i
+    sim.cycle()
+  return model, sim
+
+def test_vcd_gzip( tmpdir ):
+  model, sim = run_glitch( str( tmpdir.join( 'glitch.vcd.gz' ) ), 4 )
+  sim.vcd.close()
+  symbols, steps = read_vcd( model.vcd_file )
+  assert [ t for t, _ in steps ] == range( 0, 600, 50 )
+
+# Errors writing the file are reported instead of hanging the writer
+
+def test_vcd_gzip_error( tmpdir, monkeypatch ):
+
+  def write( self, data ):
+    raise IOError( errno.ENOSPC, 'No space left on device' )
+
+  monkeypatch.setattr( gzip.GzipFile, 'write', write )
+  writer = open_vcd_file( str( tmpdir.join( 'full.vcd.gz' ) ) )
+  with pytest.raises( IOError ):
+    for i in range( 100 ):
+      writer.write( 'x' * VCD_BUFFER_SIZE )
+  with pytest.raises( IOError ):
+    writer.close()
+
+  writer = open_vcd_file( str( tmpdir.join( 'full.vcd.gz' ) ) )
+  writer.write( 'x' )
+  with pytest.raises( IOError ):
+    writer.close()
+
+def test_vcd_scopes( tmpdir ):
+
+  class Pair( Model ):
+    def __init__( s ):
+      s.in_ = InPort ( 8 )
+      s.out = OutPort( 8 )
+      s.a   = Glitch()
+      s.b   = Glitch()
+      s.connect( s.in_,   s.a.in_ )
+      s.connect( s.a.out, s.b.in_ )
+      s.connect( s.b.out, s.out   )
+
+  model = Pair()
+  model.vcd_file   = str( tmpdir.join( 'pair.vcd' ) )
+  model.vcd_scopes = [ 'top.b', 'top.a.tmp' ]
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+  model.in_.value = 3
+  sim.cycle()
+  sim.cycle()
+  sim.cycle()
+  sim.vcd.flush()
+
+  # Only signals under the prefixes are defined, time stamps are written
+  # even though the clock is not dumped
+
+  names = [ line.split()[4] for line in open( model.vcd_file )
+            if line.startswith( '$var' ) ]
+  assert sorted( names ) == sorted( [ 'tmp', 'reset', 'clk', 'in_',
+                                      'out', 'tmp' ] )
+
+  symbols, steps = read_vcd( model.vcd_file )
+  assert [ t for t, _ in steps ] == range( 0, 500, 50 )
+  assert ( symbols[ 'out' ], 3 ) in dict( steps )[ 350 ]
+
+def test_vcd_window( tmpdir ):
+  vcd_file   = str( tmpdir.join( 'window.vcd' ) )
+  model, sim = run_glitch( vcd_file, 20, vcd_window=3 )
+
+  # Nothing is written until the window is flushed
+
+  assert not tmpdir.join( 'window.vcd' ).check()
+  sim.vcd.flush()
+
+  # The window holds the last 3 cycles and starts with the values of
+  # all nets at its first timestep (which includes the inputs for the
+  # next cycle)
+
+  symbols, steps = read_vcd( vcd_file )
+  assert [ t for t, _ in steps ] == range( 1850, 2200, 50 )
+  assert ( symbols[ 'out' ], 20 ) in dict( steps )[ 2150 ]
+
+  with open( vcd_file ) as fd:
+    dump = fd.read().split( '$dumpvars' )[1].split( '$end' )[0].split()
+  start = dict( zip( dump[1::2], [ int( x[1:], 2 ) for x in dump[0::2] ] ) )
+  assert len( start ) == len( set( symbols.values() ) )
+  assert start[ symbols[ 'in_' ] ] == 18
+  assert start[ symbols[ 'tmp' ] ] == 18
+  assert start[ symbols[ 'out' ] ] == 17
+
+def test_vcd_window_on_failure( tmpdir ):
+
+  class Checked( Glitch ):
+    def __init__( s ):
+      super( Checked, s ).__init__()
+
+      @s.tick
+      def check():
+        assert s.out < 5
+
+  model = Checked()
+  model.vcd_file   = str( tmpdir.join( 'checked.vcd' ) )
+  model.vcd_window = 2
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+
+  # Exceptions raised by the simulator write the window
+
+  with pytest.raises( AssertionError ):
+    for i in range( 10 ):
+      model.in_.value = i
+      sim.cycle()
+
+  symbols, steps = read_vcd( model.vcd_file )
+  assert steps[-1][0] == 100*sim.ncycles + 50
+  tmpdir.join( 'checked.vcd' ).remove()
+
+  # Failures detected by the test are written by the py.test hooks
+
+  flush_vcd_windows()
+  assert tmpdir.join( 'checked.vcd' ).check()
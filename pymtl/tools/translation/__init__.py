@@ -1,2 +1,3 @@
-from verilator_sim import TranslationTool
-from cpp_sim       import get_cpp
+from verilator_sim   import TranslationTool
+from verilator_batch import VerilatorBatchSim
+from cpp_sim         import get_cpp
@@ -0,0 +1,295 @@
+#=======================================================================
+# build_cache.py
+#=======================================================================
+# A content-addressed cache for compiled simulators, shared between
+# processes. Each entry is a directory named by a key hashed from all
+# the inputs of the build (see hash_key), so an entry can be reused by
+# any process, checkout or working directory which would produce the
+# exact same build.
+#
+# The cache is safe for concurrent producers and consumers:
+#
+# - builds run in a private temporary directory which is published by
+#   atomically renaming it to the entry directory, so an entry is either
+#   complete or absent,
+# - a per-key lock file (fcntl.flock) ensures only one process builds a
+#   given key while the others wait for it, and prevents an entry from
+#   being evicted while it is being loaded.
+#
+# When the total size of the cache exceeds its limit, the least recently
+# used entries are evicted. Entries are touched every time they are
+# used, so the modification time of an entry directory is its last use.
+#
+# The location and size of the cache can be set with the following
+# environment variables:
+#
+#   PYMTL_BUILD_CACHE       cache directory (default: ~/.cache/pymtl)
+#   PYMTL_BUILD_CACHE_SIZE  maximum size in megabytes (default: 1024)
+#
+
+import os
+import time
+import fcntl
+import errno
+import shutil
+import hashlib
+import tempfile
+
+from contextlib import contextmanager
+
+DEFAULT_CACHE_SIZE = 1024          # megabytes
+STALE_TEMP_AGE     = 24 * 60 * 60  # seconds
+
+#-----------------------------------------------------------------------
+# get_build_cache
+#-----------------------------------------------------------------------
+# Returns the build cache configured by the environment.
+def get_build_cache():
+
+  cache_dir = os.environ.get( 'PYMTL_BUILD_CACHE' )
+  if not cache_dir:
+    cache_home = os.environ.get( 'XDG_CACHE_HOME' ) \
+                 or os.path.join( os.path.expanduser( '~' ), '.cache' )
+    cache_dir  = os.path.join( cache_home, 'pymtl' )
+
+  max_size = os.environ.get( 'PYMTL_BUILD_CACHE_SIZE' )
+  max_size = float( max_size ) if max_size else DEFAULT_CACHE_SIZE
+
+  return BuildCache( cache_dir, int( max_size * 1024 * 1024 ) )
+
+#-----------------------------------------------------------------------
+# hash_key
+#-----------------------------------------------------------------------
+# Hash the given strings into a cache key. Each part is prefixed with
+# its length so that different splits of the same text hash differently.
+def hash_key( *parts ):
+  h = hashlib.sha1()
+  for part in parts:
+    part = str( part )
+    h.update( '{}:'.format( len( part ) ) )
+    h.update( part )
+  return h.hexdigest()
+
+#-----------------------------------------------------------------------
+# BuildCache
+#-----------------------------------------------------------------------
+class BuildCache( object ):
+
+  def __init__( self, cache_dir, max_size ):
+
+    self.cache_dir = os.path.abspath( cache_dir )
+    self.max_size  = max_size
+
+    try:
+      os.makedirs( self.cache_dir )
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+
+  #---------------------------------------------------------------------
+  # entry_dir
+  #---------------------------------------------------------------------
+  def entry_dir( self, key ):
+    return os.path.join( self.cache_dir, key )
+
+  #---------------------------------------------------------------------
+  # lock
+  #---------------------------------------------------------------------
+  # Lock the given key, shared locks are taken to use an entry and
+  # exclusive locks to create or evict it.
+  #
+  # Lock files are removed by evict() while holding an exclusive lock, so
+  # a process may end up locking a file which has been removed (or
+  # replaced by a new lock file) after it opened it. The lock is only
+  # taken once the locked file is still the one at the lock path.
+  @contextmanager
+  def lock( self, key, shared=False, blocking=True ):
+
+    path  = self.entry_dir( key ) + '.lock'
+    flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+      flags |= fcntl.LOCK_NB
+
+    while True:
+      fd = os.open( path, os.O_RDWR | os.O_CREAT )
+      try:
+        fcntl.flock( fd, flags )
+        locked = True
+      except IOError as e:
+        os.close( fd )
+        if e.errno not in ( errno.EAGAIN, errno.EACCES ):
+          raise
+        locked = False
+        break
+      try:
+        if os.fstat( fd ).st_ino == os.stat( path ).st_ino:
+          break
+      except OSError as e:
+        if e.errno != errno.ENOENT:
+          os.close( fd )
+          raise
+      os.close( fd )
+
+    try:
+      yield locked
+    finally:
+      if locked:
+        os.close( fd )
+
+  #---------------------------------------------------------------------
+  # get
+  #---------------------------------------------------------------------
+  # Returns the result of load( entry_dir ) for the given key, first
+  # running build( build_dir ) to create the entry if it is not in the
+  # cache. The build function must write all the files of the entry in
+  # the given directory. Returns a ( result, cached ) tuple.
+  def get( self, key, build, load ):
+
+    entry = self.entry_dir( key )
+
+    # Fast path, the entry already exists
+
+    with self.lock( key, shared=True ):
+      if os.path.isdir( entry ):
+        os.utime( entry, None )
+        return load( entry ), True
+
+    # Build the entry, unless another process built it while we were
+    # waiting for the lock
+
+    with self.lock( key ):
+      cached = os.path.isdir( entry )
+      if not cached:
+        self._build( key, build )
+      os.utime( entry, None )
+      result = load( entry )
+
+    if not cached:
+      self.evict()
+
+    return result, cached
+
+  #---------------------------------------------------------------------
+  # _build
+  #---------------------------------------------------------------------
+  def _build( self, key, build ):
+
+    build_dir = tempfile.mkdtemp( prefix='.tmp-{}-'.format( key ),
+                                  dir=self.cache_dir )
+    try:
+      build( build_dir )
+      os.rename( build_dir, self.entry_dir( key ) )
+
+    # If the build failed, or another process published the same entry
+    # (e.g., a stale lock file was removed by eviction), drop our copy
+
+    except OSError:
+      shutil.rmtree( build_dir, ignore_errors=True )
+      if not os.path.isdir( self.entry_dir( key ) ):
+        raise
+    except:
+      shutil.rmtree( build_dir, ignore_errors=True )
+      raise
+
+  #---------------------------------------------------------------------
+  # entries
+  #---------------------------------------------------------------------
+  # Returns a list of ( last use, size, key ) tuples for every entry in
+  # the cache, from least to most recently used.
+  def entries( self ):
+
+    entries = []
+    for key in os.listdir( self.cache_dir ):
+      path = self.entry_dir( key )
+      if key.startswith( '.' ) or not os.path.isdir( path ):
+        continue
+      try:
+        entries.append( ( os.stat( path ).st_mtime, dir_size( path ), key ) )
+      except OSError:
+        pass # evicted by another process
+
+    return sorted( entries )
+
+  #---------------------------------------------------------------------
+  # size
+  #---------------------------------------------------------------------
+  def size( self ):
+    return sum( size for _, size, _ in self.entries() )
+
+  #---------------------------------------------------------------------
+  # evict
+  #---------------------------------------------------------------------
+  # Evict least recently used entries until the cache fits in its size
+  # limit. Entries which are being used or built by other processes are
+  # skipped, as is the whole eviction if another process is evicting.
+  def evict( self ):
+
+    with self.lock( '.evict', blocking=False ) as locked:
+      if not locked:
+        return
+
+      self._remove_stale_files()
+
+      entries = self.entries()
+      total   = sum( size for _, size, _ in entries )
+
+      for _, size, key in entries:
+        if total <= self.max_size:
+          break
+        with self.lock( key, blocking=False ) as locked:
+          if not locked:
+            continue
+
+          # Move the entry out of the way before deleting it so that it
+          # disappears atomically, then remove the lock file so that
+          # lock files do not accumulate
+
+          trash = tempfile.mkdtemp( prefix='.trash-', dir=self.cache_dir )
+          try:
+            os.rename( self.entry_dir( key ), os.path.join( trash, key ) )
+            os.remove( self.entry_dir( key ) + '.lock' )
+          except OSError:
+            pass
+          shutil.rmtree( trash, ignore_errors=True )
+          total -= size
+
+  #---------------------------------------------------------------------
+  # _remove_stale_files
+  #---------------------------------------------------------------------
+  # Remove build directories left behind by killed processes, and the
+  # lock files of keys which failed to build.
+  def _remove_stale_files( self ):
+
+    now = time.time()
+    for name in os.listdir( self.cache_dir ):
+      path = os.path.join( self.cache_dir, name )
+
+      if name.startswith( ( '.tmp-', '.trash-' ) ):
+        try:
+          if now - os.stat( path ).st_mtime > STALE_TEMP_AGE:
+            shutil.rmtree( path, ignore_errors=True )
+        except OSError:
+          pass
+
+      elif name.endswith( '.lock' ) and not name.startswith( '.' ):
+        key = name[:-len( '.lock' )]
+        with self.lock( key, blocking=False ) as locked:
+          if locked and not os.path.isdir( self.entry_dir( key ) ):
+            try:
+              os.remove( path )
+            except OSError:
+              pass
+
+#-----------------------------------------------------------------------
+# dir_size
+#-----------------------------------------------------------------------
+# Returns the total size of the files in a directory tree.
+def dir_size( path ):
+  total = 0
+  for dirpath, dirnames, filenames in os.walk( path ):
+    for filename in filenames:
+      try:
+        total += os.lstat( os.path.join( dirpath, filename ) ).st_size
+      except OSError:
+        pass
+  return total
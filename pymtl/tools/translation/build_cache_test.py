@@ -0,0 +1,201 @@
+#=======================================================================
+# build_cache_test.py
+#=======================================================================
+
+import os
+import time
+import pytest
+import threading
+import multiprocessing
+
+from build_cache import BuildCache, hash_key
+
+#-----------------------------------------------------------------------
+# Utility Functions
+#-----------------------------------------------------------------------
+
+def write_file( filename, text ):
+  with open( filename, 'w' ) as fd:
+    fd.write( text )
+
+def read_file( filename ):
+  with open( filename ) as fd:
+    return fd.read()
+
+# Returns a build function writing a file of the given size and
+# logging each build to the given log file
+
+def make_build( nbytes, log_file=None, delay=0 ):
+  def build( build_dir ):
+    if log_file:
+      with open( log_file, 'a' ) as fd:
+        fd.write( '{}\n'.format( os.getpid() ) )
+    time.sleep( delay )
+    write_file( os.path.join( build_dir, 'lib.so' ), 'x' * nbytes )
+  return build
+
+def fail_build( build_dir ):
+  write_file( os.path.join( build_dir, 'lib.so' ), 'partial' )
+  raise RuntimeError( 'compiler error' )
+
+def load( entry_dir ):
+  return read_file( os.path.join( entry_dir, 'lib.so' ) )
+
+def set_last_use( cache, key, timestamp ):
+  os.utime( cache.entry_dir( key ), ( timestamp, timestamp ) )
+
+#-----------------------------------------------------------------------
+# test_hash_key
+#-----------------------------------------------------------------------
+
+def test_hash_key():
+  assert hash_key( 'ab', 'c' ) == hash_key( 'ab', 'c' )
+  assert hash_key( 'ab', 'c' ) != hash_key( 'a', 'bc' )
+  assert hash_key( 'ab', 'c' ) != hash_key( 'abc' )
+  assert hash_key( 'ab', 1 ) == hash_key( 'ab', '1' )
+
+#-----------------------------------------------------------------------
+# test_get
+#-----------------------------------------------------------------------
+
+def test_get( tmpdir ):
+  log_file = str( tmpdir.join( 'builds' ) )
+  cache    = BuildCache( str( tmpdir.join( 'cache' ) ), 1000 )
+
+  assert cache.get( 'a', make_build( 10, log_file ), load ) \
+         == ( 'x' * 10, False )
+  assert cache.get( 'a', make_build( 20, log_file ), load ) \
+         == ( 'x' * 10, True )
+  assert cache.get( 'b', make_build( 20, log_file ), load ) \
+         == ( 'x' * 20, False )
+
+  assert len( read_file( log_file ).split() ) == 2
+  assert [ key for _, _, key in cache.entries() ] == [ 'a', 'b' ]
+  assert cache.size() == 30
+
+#-----------------------------------------------------------------------
+# test_build_failure
+#-----------------------------------------------------------------------
+
+def test_build_failure( tmpdir ):
+  cache = BuildCache( str( tmpdir ), 1000 )
+
+  with pytest.raises( RuntimeError ):
+    cache.get( 'a', fail_build, load )
+
+  # Nothing is published, and the next attempt builds again
+
+  assert cache.entries() == []
+  assert not [ x for x in os.listdir( str( tmpdir ) ) if x.startswith( '.tmp' ) ]
+  assert cache.get( 'a', make_build( 10 ), load ) == ( 'x' * 10, False )
+
+#-----------------------------------------------------------------------
+# test_concurrent_builds
+#-----------------------------------------------------------------------
+
+def build_in_process( cache_dir, log_file, queue ):
+  cache = BuildCache( cache_dir, 1000 )
+  queue.put( cache.get( 'a', make_build( 10, log_file, 0.2 ), load ) )
+
+def test_concurrent_builds( tmpdir ):
+  cache_dir = str( tmpdir.join( 'cache' ) )
+  log_file  = str( tmpdir.join( 'builds' ) )
+  queue     = multiprocessing.Queue()
+
+  procs = [ multiprocessing.Process( target=build_in_process,
+                                     args=( cache_dir, log_file, queue ) )
+            for i in range( 4 ) ]
+  for proc in procs:
+    proc.start()
+  results = [ queue.get( timeout=30 ) for proc in procs ]
+  for proc in procs:
+    proc.join()
+
+  # Only one process built the entry, the others waited for it
+
+  assert len( read_file( log_file ).split() ) == 1
+  assert sorted( results ) == [ ( 'x' * 10, False ) ] + [ ( 'x' * 10, True ) ] * 3
+
+#-----------------------------------------------------------------------
+# test_evict
+#-----------------------------------------------------------------------
+
+def test_evict( tmpdir ):
+  cache = BuildCache( str( tmpdir ), 250 )
+  now   = time.time()
+
+  for i, key in enumerate( 'abc' ):
+    cache.get( key, make_build( 100 ), load )
+    set_last_use( cache, key, now - 100 + i )
+
+  # The cache was over its size limit after c, a was least recently used
+
+  assert [ key for _, _, key in cache.entries() ] == [ 'b', 'c' ]
+  assert not os.path.exists( cache.entry_dir( 'a' ) + '.lock' )
+
+  # Using an entry makes it the most recently used
+
+  assert cache.get( 'b', make_build( 100 ), load )[1]
+  cache.get( 'd', make_build( 100 ), load )
+  assert [ key for _, _, key in cache.entries() ] == [ 'b', 'd' ]
+
+  # Entries being used by another process are not evicted
+
+  with cache.lock( 'b', shared=True ):
+    cache.get( 'e', make_build( 100 ), load )
+  assert [ key for _, _, key in cache.entries() ] == [ 'b', 'e' ]
+
+#-----------------------------------------------------------------------
+# test_lock_removed
+#-----------------------------------------------------------------------
+# A process waiting on a lock file which is removed while it waits
+# (as evict does) must lock the new lock file instead of the removed one
+
+def test_lock_removed( tmpdir ):
+  cache    = BuildCache( str( tmpdir ), 1000 )
+  path     = cache.entry_dir( 'a' ) + '.lock'
+  acquired = threading.Event()
+  release  = threading.Event()
+
+  def wait_for_lock():
+    with cache.lock( 'a' ):
+      acquired.set()
+      release.wait( 10 )
+
+  with cache.lock( 'a' ):
+    thread = threading.Thread( target=wait_for_lock )
+    thread.start()
+    time.sleep( 0.1 )
+    os.remove( path )
+
+  try:
+    assert acquired.wait( 10 )
+    assert os.path.exists( path )
+    with cache.lock( 'a', blocking=False ) as locked:
+      assert not locked
+  finally:
+    release.set()
+    thread.join()
+
+#-----------------------------------------------------------------------
+# test_evict_stale_files
+#-----------------------------------------------------------------------
+
+def test_evict_stale_files( tmpdir ):
+  cache = BuildCache( str( tmpdir ), 250 )
+
+  stale = tmpdir.mkdir( '.tmp-a-stale' )
+  fresh = tmpdir.mkdir( '.tmp-a-fresh' )
+  os.utime( str( stale ), ( 0, 0 ) )
+
+  with pytest.raises( RuntimeError ):
+    cache.get( 'b', fail_build, load )
+  assert os.path.exists( cache.entry_dir( 'b' ) + '.lock' )
+
+  # Eviction runs after every new entry
+
+  cache.get( 'c', make_build( 10 ), load )
+  assert not stale.check()
+  assert fresh.check()
+  assert not os.path.exists( cache.entry_dir( 'b' ) + '.lock' )
+  assert     os.path.exists( cache.entry_dir( 'c' ) + '.lock' )
@@ -161,10 +161,7 @@ def declare_signals( nets, ast_next, o ):
   all_ports    = []
 
   shadows = []
-  for id_, n in enumerate( nets ):
-
-    # each net is a set, convert it to a list
-    net   = list( n )
+  for id_, net in enumerate( nets ):
 
     # returns the type, if it is an object/class generate the C def
     type_ = get_type( net[0].dtype(), o ) # TODO: add obj decl to extern
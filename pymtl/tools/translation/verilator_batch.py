@@ -0,0 +1,152 @@
+#=======================================================================
+# verilator_batch.py
+#=======================================================================
+
+from __future__ import print_function
+
+import array
+
+#-----------------------------------------------------------------------
+# VerilatorBatchSim
+#-----------------------------------------------------------------------
+# Drives a model returned by TranslationTool for many cycles per call
+# into the verilated model (see run_cycles in verilator_wrapper.templ.c),
+# instead of crossing the CFFI boundary for every evaluation and clock
+# edge as SimulationTool does. Inputs are given for every cycle, outputs
+# are sampled in every cycle before the rising clock edge, i.e., where
+# a test bench calling sim.eval_combinational() then sim.cycle() checks
+# them:
+#
+#   vmodel = TranslationTool( model )
+#   sim    = VerilatorBatchSim( vmodel )
+#   sim.reset()
+#   outs   = sim.run({ 'in_': [ 1, 2, 3 ] })
+#   assert outs['out'] == [ 0, 1, 2 ]
+#
+# The batch simulator drives the verilated model directly, the PyMTL
+# ports of the model are not updated, so a model instance should either
+# be simulated with SimulationTool or VerilatorBatchSim. Inputs which
+# are not given keep the value they had in the last cycle of the
+# previous batch (initially zero).
+#
+# Buffers can also be packed directly (e.g., as NumPy uint32 arrays) and
+# passed to run_packed(). Each cycle is a row of in_words (out_words)
+# 32-bit words, with each port taking nbits/32 words (rounded up), least
+# significant word first, in the order of the inputs (outputs) list.
+#
+class VerilatorBatchSim( object ):
+
+  def __init__( self, model ):
+
+    if not hasattr( model, '_batch_inputs' ):
+      raise TypeError( "VerilatorBatchSim requires a model translated "
+                       "with TranslationTool!" )
+
+    self.model   = model
+    self.ncycles = 0
+
+    self.inputs    = [ name for name, nbits in model._batch_inputs  ]
+    self.outputs   = [ name for name, nbits in model._batch_outputs ]
+    self._inputs   = self._layout( model._batch_inputs  )
+    self._outputs  = self._layout( model._batch_outputs )
+    self.in_words  = sum( nwords for _, _, _, nwords in self._inputs  )
+    self.out_words = sum( nwords for _, _, _, nwords in self._outputs )
+
+    # input values of the last simulated cycle
+    self._last_inputs = array.array( 'I', [0] ) * self.in_words
+
+  def _layout( self, batch_ports ):
+    layout, offset = [], 0
+    for name, nbits in batch_ports:
+      nwords = ( nbits - 1 ) / 32 + 1
+      layout.append( ( name, nbits, offset, nwords ) )
+      offset += nwords
+    return layout
+
+  #---------------------------------------------------------------------
+  # reset
+  #---------------------------------------------------------------------
+  # Reset the model for two cycles, then deassert reset.
+  def reset( self ):
+    self.run({ 'reset' : [ 1, 1 ] })
+    for name, nbits, offset, nwords in self._inputs:
+      if name == 'reset':
+        self._last_inputs[ offset ] = 0
+
+  #---------------------------------------------------------------------
+  # run
+  #---------------------------------------------------------------------
+  # Simulate one cycle per input value, inputs maps input port names to
+  # sequences of values of the same length. Returns a dictionary mapping
+  # each output port name to the list of its values in every cycle.
+  def run( self, inputs, ncycles=None ):
+
+    unknown = set( inputs ) - set( self.inputs )
+    if unknown:
+      raise ValueError( "Unknown input ports: {}"
+                        .format( ', '.join( sorted( unknown ) ) ) )
+
+    if ncycles is None:
+      lengths = set( len( values ) for values in inputs.values() )
+      if len( lengths ) != 1:
+        raise ValueError( "Input sequences must all have the same length!" )
+      ncycles = lengths.pop()
+
+    # Pack the inputs, each word of a port is a strided slice of the
+    # buffer, inputs which are not given keep their last value
+
+    in_buf  = self._last_inputs * ncycles
+    out_buf = array.array( 'I', [0] ) * ( ncycles * self.out_words )
+
+    for name, nbits, offset, nwords in self._inputs:
+      if name not in inputs:
+        continue
+      values = inputs[ name ]
+      if len( values ) != ncycles:
+        raise ValueError( "Expected {} values for input port {}!"
+                          .format( ncycles, name ) )
+
+      mask   = ( 1 << nbits ) - 1
+      values = [ int( x ) & mask for x in values ]
+      for i in range( nwords ):
+        in_buf[ offset+i::self.in_words ] = \
+          array.array( 'I', [ ( x >> 32*i ) & 0xffffffff for x in values ] )
+
+    self.run_packed( in_buf, out_buf, ncycles )
+
+    # Unpack the outputs
+
+    outputs = {}
+    for name, nbits, offset, nwords in self._outputs:
+      values = out_buf[ offset::self.out_words ].tolist()
+      for i in range( 1, nwords ):
+        words  = out_buf[ offset+i::self.out_words ]
+        values = [ x | ( long( w ) << 32*i ) for x, w in zip( values, words ) ]
+      outputs[ name ] = values
+
+    return outputs
+
+  #---------------------------------------------------------------------
+  # run_packed
+  #---------------------------------------------------------------------
+  # Simulate ncycles cycles using packed input and output buffers, which
+  # can be any objects supporting the buffer protocol (array.array,
+  # NumPy arrays, bytearray, ...) of at least ncycles rows of in_words
+  # and out_words 32-bit words.
+  def run_packed( self, in_buf, out_buf, ncycles ):
+
+    ffi  = self.model._cffi
+    ins  = ffi.from_buffer( 'unsigned int[]', in_buf )
+    outs = ffi.from_buffer( 'unsigned int[]', out_buf, require_writable=True )
+
+    if len( ins  ) < ncycles * self.in_words or \
+       len( outs ) < ncycles * self.out_words:
+      raise ValueError( "Buffers are too small for {} cycles!"
+                        .format( ncycles ) )
+
+    self.model._ffi.run_cycles( self.model._m, ncycles, ins, outs )
+    self.ncycles += ncycles
+
+    if ncycles:
+      last = ( ncycles - 1 ) * self.in_words
+      self._last_inputs = array.array( 'I', ins[ last:last+self.in_words ] )
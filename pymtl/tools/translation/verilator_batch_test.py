@@ -0,0 +1,290 @@
+#=======================================================================
+# verilator_batch_test.py
+#=======================================================================
+# Tests for VerilatorBatchSim. The verilated model is replaced by a
+# small C++ class with the same interface, so these tests exercise the
+# generated C and Python wrappers without requiring Verilator.
+
+import array
+import random
+import pytest
+
+from pymtl             import *
+from verilator_cffi    import create_c_wrapper
+from verilator_cffi    import create_shared_lib, create_verilator_py_wrapper
+from verilator_cffi    import verilator_mangle
+from verilator_sim     import load_wrapper
+from verilator_batch   import VerilatorBatchSim
+from verilator_cffi_test import build_env, requires_cxx
+
+import verilog_structural
+
+pytestmark = requires_cxx
+
+#-----------------------------------------------------------------------
+# Batch
+#-----------------------------------------------------------------------
+# Registers inputs of each kind of Verilator port type: CData (8b),
+# QData (40b) and WData (70b).
+
+class Batch( Model ):
+  def __init__( s ):
+    s.a = InPort ( 8 )
+    s.b = InPort ( 40 )
+    s.c = InPort ( 70 )
+    s.y = OutPort( 8 )
+    s.z = OutPort( 40 )
+    s.w = OutPort( 70 )
+
+# Stand-in for the verilated model: y = a + 1, z = b, w = c, registered
+
+verilated_header = '''
+#include <stdint.h>
+class VBatch {
+ public:
+  unsigned char clk, reset, a, y, prev_clk;
+  uint64_t      b, z;
+  uint32_t      c[3], w[3];
+  VBatch() : clk(0), reset(0), a(0), y(0), prev_clk(0), b(0), z(0) {
+    for ( int i = 0; i < 3; i++ ) c[i] = w[i] = 0;
+  }
+  void eval() {
+    if ( clk && !prev_clk ) {
+      y = reset ? 0 : a + 1;
+      z = reset ? 0 : b;
+      for ( int i = 0; i < 3; i++ ) w[i] = reset ? 0 : c[i];
+    }
+    prev_clk = clk;
+  }
+  void final() {}
+};
+'''
+
+def translate( build_dir, model_type=Batch, header=verilated_header ):
+
+  model = model_type()
+  model.elaborate()
+  for port in model.get_ports():
+    port.verilog_name   = verilog_structural.mangle_name( port.name )
+    port.verilator_name = verilator_mangle( port.verilog_name )
+
+  name = model.class_name
+  build_dir.mkdir( 'obj_dir_' + name ).join( 'V{}.h'.format( name ) ) \
+           .write( header.replace( 'VBatch', 'V' + name ) )
+
+  cdefs = create_c_wrapper( model, str( build_dir.join( name + '_v.cpp' ) ), '' )
+  create_shared_lib( name, name + '_v.cpp', 'lib{}_v.so'.format( name ), '',
+                     str( build_dir ) )
+  create_verilator_py_wrapper( model, str( build_dir.join( name + '_v.py' ) ),
+                               'lib{}_v.so'.format( name ), cdefs )
+
+  module      = load_wrapper( str( build_dir.join( name + '_v.py' ) ) )
+  model_class = module.__dict__[ name ]
+  return model_class, model_class()
+
+#-----------------------------------------------------------------------
+# test_run
+#-----------------------------------------------------------------------
+
+def test_run( build_env ):
+
+  model_class, model = translate( build_env )
+  sim = VerilatorBatchSim( model )
+
+  assert sim.inputs  == [ 'a', 'b', 'c', 'reset' ]
+  assert sim.outputs == [ 'w', 'y', 'z' ]
+  assert ( sim.in_words, sim.out_words ) == ( 1 + 2 + 3 + 1, 3 + 1 + 2 )
+
+  sim.reset()
+  assert sim.ncycles == 2
+
+  rng  = random.Random( 0x7e57 )
+  a    = [ rng.getrandbits( 8  ) for _ in range( 100 ) ]
+  b    = [ rng.getrandbits( 40 ) for _ in range( 100 ) ]
+  c    = [ rng.getrandbits( 70 ) for _ in range( 100 ) ]
+  outs = sim.run({ 'a' : a, 'b' : b, 'c' : c })
+
+  # Outputs are sampled before the clock edge
+
+  assert outs['y'] == [ 0 ] + [ ( x + 1 ) % 256 for x in a[:-1] ]
+  assert outs['z'] == [ 0 ] + b[:-1]
+  assert outs['w'] == [ 0 ] + c[:-1]
+
+  assert sim.ncycles == 102
+
+  # Inputs which are not given hold their value, out of range values
+  # are truncated
+
+  outs = sim.run({ 'a' : [ 0x1ff, 3, 3 ] })
+  assert outs['y'] == [ ( a[-1] + 1 ) % 256, 0, 4 ]
+  assert outs['w'] == [ c[-1], c[-1], c[-1] ]
+
+  with pytest.raises( ValueError ):
+    sim.run({ 'y' : [ 0 ] })
+  with pytest.raises( ValueError ):
+    sim.run({ 'a' : [ 0 ], 'b' : [ 1, 2 ] })
+
+#-----------------------------------------------------------------------
+# test_run_packed
+#-----------------------------------------------------------------------
+
+def test_run_packed( build_env ):
+
+  model_class, model = translate( build_env )
+  sim = VerilatorBatchSim( model )
+  sim.reset()
+
+  # Row layout: a, b (2 words), c (3 words), reset
+
+  in_buf  = array.array( 'I', [ 5, 0x12345678, 0xab, 1, 2, 0x3f, 0 ] * 2 )
+  out_buf = array.array( 'I', [ 0 ] * ( 2 * sim.out_words ) )
+  sim.run_packed( in_buf, out_buf, 2 )
+  assert list( out_buf[ sim.out_words: ] ) == [ 1, 2, 0x3f, 6, 0x12345678, 0xab ]
+
+  outs = sim.run({ 'a' : [ 0 ] })
+  assert ( outs['y'], outs['z'] ) == ( [ 6 ], [ 0xab12345678 ] )
+
+  with pytest.raises( ValueError ):
+    sim.run_packed( in_buf, out_buf, 3 )
+
+  with pytest.raises( TypeError ):
+    VerilatorBatchSim( Batch() )
+
+#-----------------------------------------------------------------------
+# test_simulation_tool
+#-----------------------------------------------------------------------
+# The batch simulation matches driving the wrapper with SimulationTool
+
+def test_simulation_tool( build_env ):
+
+  model_class, model = translate( build_env )
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+
+  rng  = random.Random( 0xba7c4 )
+  a    = [ rng.getrandbits( 8  ) for _ in range( 20 ) ]
+  c    = [ rng.getrandbits( 70 ) for _ in range( 20 ) ]
+
+  ref = []
+  for x, y in zip( a, c ):
+    model.a.value = x
+    model.c.value = y
+    sim.eval_combinational()
+    ref.append( ( model.y.uint(), model.w.uint() ) )
+    sim.cycle()
+
+  # Wide inputs are copied when they are the only input changing
+
+  model.c.value = 1 << 69
+  sim.cycle()
+  assert model.w == 1 << 69
+
+  batch = VerilatorBatchSim( model_class() )
+  batch.reset()
+  outs  = batch.run({ 'a' : a, 'c' : c })
+  assert zip( outs['y'], outs['w'] ) == ref
+
+#-----------------------------------------------------------------------
+# test_run_test_vector_sim
+#-----------------------------------------------------------------------
+
+def test_run_test_vector_sim( build_env, monkeypatch ):
+
+  from pclib.test import test_utils
+
+  model_class, model = translate( build_env )
+  monkeypatch.setattr( test_utils, 'TranslationTool', lambda x: model )
+
+  test_vectors = [
+    # a     b   c         y*    z*         w*
+    [ 'a',  'b', 'c',     'y*', 'z*',      'w*'    ],
+    [ 0xff, 1,   1 << 69, 0,    0,         0       ],
+    [ 2,    -1,  3,       0,    1,         1 << 69 ],
+    [ 2,    0,   3,       3,    2**40 - 1, '?'     ],
+  ]
+  test_utils.run_test_vector_sim( Batch(), test_vectors,
+                                  test_verilog=True, batch=True )
+
+  test_vectors[-1][3] = 4
+  with pytest.raises( AssertionError ):
+    test_utils.run_test_vector_sim( Batch(), test_vectors,
+                                    test_verilog=True, batch=True )
+
+#-----------------------------------------------------------------------
+# test_change_driven
+#-----------------------------------------------------------------------
+# The wrapper only evaluates the verilated model when an input changed,
+# and only writes the combinational outputs after such an eval.
+
+class Accum( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 8 )
+    s.out = OutPort( 16 )
+    s.acc = OutPort( 16 )
+
+    @s.combinational
+    def comb_logic():
+      s.out.value = s.in_ + s.acc
+
+    @s.tick
+    def seq_logic():
+      s.acc.next = 0 if s.reset else s.out
+
+accum_header = '''
+class VBatch {
+ public:
+  unsigned char  clk, reset, in_, prev_clk;
+  unsigned short out, acc;
+  VBatch() : clk(0), reset(0), in_(0), prev_clk(0), out(0), acc(0) {}
+  void eval() {
+    if ( clk && !prev_clk ) acc = reset ? 0 : out;
+    out = in_ + acc;
+    prev_clk = clk;
+  }
+  void final() {}
+};
+'''
+
+class CountEvals( object ):
+  def __init__( self, lib ):
+    self.lib    = lib
+    self.nevals = 0
+  def eval( self, m ):
+    self.nevals += 1
+    self.lib.eval( m )
+  def __getattr__( self, name ):
+    return getattr( self.lib, name )
+
+def test_change_driven( build_env ):
+
+  model_class, model = translate( build_env, Accum, accum_header )
+
+  src = build_env.join( model_class.__name__ + '_v.py' ).read()
+  assert 's.out.value' in     src
+  assert 's.acc.value' not in src
+
+  model.elaborate()
+  sim = SimulationTool( model )
+  sim.reset()
+  lib = model._ffi = CountEvals( model._ffi )
+
+  model.in_.value = 3
+  sim.eval_combinational()
+  assert ( model.out, model.acc, lib.nevals ) == ( 3, 0, 1 )
+
+  # The clock edge updates both the registered and combinational outputs
+
+  sim.cycle()
+  assert ( model.out, model.acc, lib.nevals ) == ( 6, 3, 3 )
+
+  # Inputs restored to their previous value do not trigger an eval
+
+  model.in_.value = 5
+  model.in_.value = 3
+  sim.eval_combinational()
+  assert ( model.out, model.acc, lib.nevals ) == ( 6, 3, 3 )
+
+  model.in_.value = 1
+  sim.eval_combinational()
+  assert ( model.out, model.acc, lib.nevals ) == ( 4, 3, 4 )
@@ -5,27 +5,40 @@
 from __future__ import print_function
 
 import os
+import sys
+import ast
+import glob
 import shutil
 
 import verilog_structural
 from ...tools.simulation.vcd import get_vcd_timescale
 
 from subprocess          import check_output, STDOUT, CalledProcessError
+from multiprocessing     import cpu_count
+from multiprocessing.pool import ThreadPool
+from distutils.spawn     import find_executable
 from ...model.signals    import InPort, OutPort
 from ...model.PortBundle import PortBundle
+from ..integration       import verilog
+from ..simulation.sim_utils import collect_signals, signals_to_nets
+from ..simulation.sim_utils import _attr_path, _get_loads_and_stores
+from ..ast_helpers       import get_cached_analysis
 from exceptions          import VerilatorCompileError
+from build_cache         import get_build_cache, hash_key
 
 #-----------------------------------------------------------------------
 # verilog_to_pymtl
 #-----------------------------------------------------------------------
-# Create a PyMTL compatible interface for Verilog HDL.
+# Create a PyMTL compatible interface for Verilog HDL. All file names
+# are relative to build_dir, where all the outputs are written.
 def verilog_to_pymtl( model, verilog_file, c_wrapper_file,
-                      lib_file, py_wrapper_file, vcd_file, lint ):
+                      lib_file, py_wrapper_file, vcd_file, lint,
+                      build_dir='.', opt='fast-compile' ):
 
   model_name = model.class_name
 
   # Verilate the model  # TODO: clean this up
-  verilate_model( verilog_file, model_name, vcd_file, lint )
+  verilate_model( verilog_file, model_name, vcd_file, lint, build_dir, opt )
 
   # Add names to ports of module
   for port in model.get_ports():
@@ -33,20 +46,56 @@ def verilog_to_pymtl( model, verilog_file, c_wrapper_file,
     port.verilator_name = verilator_mangle( port.verilog_name )
 
   # Create C++ Wrapper
-  cdefs = create_c_wrapper( model, c_wrapper_file, vcd_file )
+  cdefs = create_c_wrapper( model, os.path.join( build_dir, c_wrapper_file ),
+                            vcd_file )
 
   # Create Shared C Library
-  create_shared_lib( model_name, c_wrapper_file, lib_file, vcd_file )
+  create_shared_lib( model_name, c_wrapper_file, lib_file, vcd_file,
+                     build_dir, opt )
 
   # Create PyMTL wrapper for CFFI interface to Verilated model
-  create_verilator_py_wrapper( model, py_wrapper_file, lib_file, cdefs )
+  create_verilator_py_wrapper( model,
+                               os.path.join( build_dir, py_wrapper_file ),
+                               lib_file, cdefs )
+
+#-----------------------------------------------------------------------
+# get_verilator_flags
+#-----------------------------------------------------------------------
+def get_verilator_flags( vcd_file, lint, opt='fast-compile' ):
+  return ' '.join([
+    '-Wno-lint' if not lint else '',
+    '-Wno-UNOPTFLAT',
+    '--unroll-count 1000000',
+    '--unroll-stmts 1000000',
+    '--output-split 20000',
+    '--trace' if vcd_file else '',
+    get_opt_profile( opt )[ 'verilator' ],
+  ])
+
+#-----------------------------------------------------------------------
+# get_verilator_version
+#-----------------------------------------------------------------------
+# Returns the output of verilator --version, or an empty string if
+# verilator is not installed.
+_verilator_version = None
+
+def get_verilator_version():
+  global _verilator_version
+  if _verilator_version is None:
+    try:
+      _verilator_version = check_output( [ 'verilator', '--version' ],
+                                         stderr=STDOUT ).strip()
+    except ( OSError, CalledProcessError ):
+      _verilator_version = ''
+  return _verilator_version
 
 #-----------------------------------------------------------------------
 # verilate_model
 #-----------------------------------------------------------------------
 # Convert Verilog HDL into a C++ simulator using Verilator.
 # http://www.veripool.org/wiki/verilator
-def verilate_model( filename, model_name, vcd_file, lint ):
+def verilate_model( filename, model_name, vcd_file, lint, build_dir='.',
+                    opt='fast-compile' ):
 
   # verilator commandline template
 
@@ -57,18 +106,12 @@ def verilate_model( filename, model_name, vcd_file, lint ):
 
   source  = filename
   obj_dir = 'obj_dir_' + model_name
-  flags   = ' '.join([
-              '-Wno-lint' if not lint else '',
-              '-Wno-UNOPTFLAT',
-              '--unroll-count 1000000',
-              '--unroll-stmts 1000000',
-              '--trace' if vcd_file else '',
-            ])
+  flags   = get_verilator_flags( vcd_file, lint, opt )
 
   # remove the obj_dir because issues with staleness
 
-  if os.path.exists( obj_dir ):
-    shutil.rmtree( obj_dir )
+  if os.path.exists( os.path.join( build_dir, obj_dir ) ):
+    shutil.rmtree( os.path.join( build_dir, obj_dir ) )
 
   # create the verilator compile command
 
@@ -78,7 +121,8 @@ def verilate_model( filename, model_name, vcd_file, lint ):
 
   try:
     print( compile_cmd )
-    result = check_output( compile_cmd, stderr=STDOUT, shell=True )
+    result = check_output( compile_cmd, stderr=STDOUT, shell=True,
+                           cwd=build_dir )
     print( result )
 
   # handle verilator failure
@@ -147,6 +191,12 @@ def create_c_wrapper( model, c_wrapper_file, vcd_file ):
   port_decls   = indent_zero.join( [ port_to_decl( x ) for x in ports ] )
   port_inits   = indent_two .join( [ port_to_init( x ) for x in ports ] )
 
+  # Create the statements packing/unpacking ports for run_cycles
+  inports, outports = get_batch_ports( model )
+
+  pack_inputs  = indent_four.join( pack_stmts( inports,  'in',  True  ) )
+  pack_outputs = indent_four.join( pack_stmts( outports, 'out', False ) )
+
   # Generate the source code using the template
   with open( template_filename , 'r' ) as template, \
        open( c_wrapper_file,     'w' ) as output:
@@ -159,12 +209,80 @@ def create_c_wrapper( model, c_wrapper_file, vcd_file ):
                           vcd_prefix    = vcd_file[:-4],
                           vcd_timescale = get_vcd_timescale( model ),
                           dump_vcd      = '1' if vcd_file else '0',
+                          in_words      = batch_words( inports  ),
+                          out_words     = batch_words( outports ),
+                          pack_inputs   = pack_inputs,
+                          pack_outputs  = pack_outputs,
                         )
 
     output.write( c_src )
 
   return port_decls.replace( indent_zero, indent_six )
 
+#-----------------------------------------------------------------------
+# get_batch_ports
+#-----------------------------------------------------------------------
+# Returns the input and output ports exchanged by run_cycles, in the
+# order they are packed in the buffers (sorted by name). Every port
+# takes nbits/32 32-bit words (rounded up), least significant first.
+def get_batch_ports( model ):
+  key      = lambda port: port.name
+  inports  = sorted( [ x for x in model.get_inports() if x.name != 'clk' ],
+                     key=key )
+  outports = sorted( model.get_outports(), key=key )
+  return inports, outports
+
+def batch_words( ports ):
+  return sum( ( port.nbits - 1 ) / 32 + 1 for port in ports )
+
+#-----------------------------------------------------------------------
+# pack_stmts
+#-----------------------------------------------------------------------
+# Generate the C statements copying ports from (inputs) or to (outputs)
+# a packed buffer of 32-bit words. Inputs are masked to their bitwidth.
+def pack_stmts( ports, buf, inputs ):
+
+  stmts  = []
+  offset = 0
+  for port in ports:
+    name  = port.verilator_name
+    nbits = port.nbits
+
+    if nbits <= 32:
+      mask = hex( ( 1 << nbits ) - 1 ).rstrip( 'L' )
+      if inputs:
+        stmts.append( '*m->{} = {}[{}] & {};'.format( name, buf, offset, mask ) )
+      else:
+        stmts.append( '{}[{}] = *m->{};'.format( buf, offset, name ) )
+      offset += 1
+
+    elif nbits <= 64:
+      mask = hex( ( 1 << nbits ) - 1 ).rstrip( 'L' ) + 'UL'
+      if inputs:
+        stmts.append( '*m->{0} = ( (unsigned long) {1}[{2}] | '
+                      '(unsigned long) {1}[{3}] << 32 ) & {4};'
+                      .format( name, buf, offset, offset+1, mask ) )
+      else:
+        stmts.append( '{0}[{1}] = *m->{2}; {0}[{3}] = *m->{2} >> 32;'
+                      .format( buf, offset, name, offset+1 ) )
+      offset += 2
+
+    else:
+      nwords = ( nbits - 1 ) / 32 + 1
+      for i in range( nwords ):
+        last = i == nwords - 1 and nbits % 32
+        if inputs and last:
+          mask = hex( ( 1 << ( nbits % 32 ) ) - 1 ).rstrip( 'L' )
+          stmts.append( 'm->{}[{}] = {}[{}] & {};'
+                        .format( name, i, buf, offset+i, mask ) )
+        elif inputs:
+          stmts.append( 'm->{}[{}] = {}[{}];'.format( name, i, buf, offset+i ) )
+        else:
+          stmts.append( '{}[{}] = m->{}[{}];'.format( buf, offset+i, name, i ) )
+      offset += nwords
+
+  return stmts
+
 #-----------------------------------------------------------------------
 # create_shared_lib
 #-----------------------------------------------------------------------
@@ -210,60 +328,191 @@ def create_c_wrapper( model, c_wrapper_file, vcd_file ):
 #
 # http://www.veripool.org/projects/verilator/wiki/Manual-verilator
 #
-def create_shared_lib( model_name, c_wrapper_file, lib_file, vcd_file ):
-
-  # gcc template string
-
-  compile_cmd  = 'g++ {flags} -I {include_dir} -o {libname} {cpp_sources}'
-
-  flags        = '-O1 -fstrict-aliasing -fPIC -shared'
-  include_dir  = os.environ['PYMTL_VERILATOR_INCLUDE_DIR']
-  libname      = lib_file
-  cpp_sources  = ' '.join( [
-                   'obj_dir_{model_name}/V{model_name}.cpp',
-                   'obj_dir_{model_name}/V{model_name}__Syms.cpp',
-                   '{include_dir}/verilated.cpp',
-                   '{c_wrapper}'
-                 ]
-                 # Add the following sources only if vcd_file
-                 + ( [] if not vcd_file else [
-                   '{include_dir}/verilated_vcd_c.cpp',
-                   'obj_dir_{model_name}/V{model_name}__Trace.cpp',
-                   'obj_dir_{model_name}/V{model_name}__Trace__Slow.cpp',
-                 ]))
-
-  # substitute flags in compiler string, then any remaining flags
+# The optimization profiles of TranslationTool follow this advice, the
+# default 'fast-compile' profile uses OPT_FAST="-O1 -fstrict-aliasing"
+# and leaves the slow-path files unoptimized, while 'fast-run' lets
+# Verilator optimize the design and compiles the fast path with -O3.
+#
+# Each translation unit is compiled separately, in parallel, using
+# ccache if it is installed. Verilator is run with --output-split so that
+# large designs are split into several translation units. The Verilator
+# runtime (verilated.cpp, verilated_vcd_c.cpp) is compiled once and
+# shared by all models through the build cache.
+#
+OPT_PROFILES = {
+  'fast-compile' : {
+    'verilator' : '',
+    'opt_fast'  : '-O1 -fstrict-aliasing',
+    'opt_slow'  : '-O0',
+  },
+  'fast-run' : {
+    'verilator' : '-O3 --noassert',
+    'opt_fast'  : '-O3 -fstrict-aliasing',
+    'opt_slow'  : '-O1',
+  },
+}
 
-  compile_cmd = compile_cmd.format( **vars() )
-  compile_cmd = compile_cmd.format( model_name  = model_name,
-                                    c_wrapper   = c_wrapper_file,
-                                    include_dir = include_dir )
+CXX_FLAGS       = '-fPIC'
+RUNTIME_SOURCES = [ 'verilated.cpp', 'verilated_vcd_c.cpp' ]
 
-  # try compilation
+def create_shared_lib( model_name, c_wrapper_file, lib_file, vcd_file,
+                       build_dir='.', opt='fast-compile' ):
+
+  profile     = get_opt_profile( opt )
+  include_dir = os.environ['PYMTL_VERILATOR_INCLUDE_DIR']
+  obj_dir     = 'obj_dir_' + model_name
+
+  # verilated sources, large designs are split into several files
+
+  sources = [ os.path.relpath( x, build_dir ) for x in
+              sorted( glob.glob( os.path.join( build_dir, obj_dir, '*.cpp' ) ) )
+              if '__ALL' not in x ]
 
+  # compile the design and the precompiled runtime
+
+  cmds, objects = get_compile_cmds( sources + [ c_wrapper_file ], obj_dir,
+                                    include_dir, profile )
+
+  run_compile_cmds( cmds, build_dir )
+
+  runtime = [ 'verilated.o' ] + ( [ 'verilated_vcd_c.o' ] if vcd_file else [] )
+  get_verilator_runtime( include_dir, profile,
+                         os.path.join( build_dir, obj_dir ), runtime )
+
+  # link the shared library
+
+  link_cmd = get_compiler() + [ '-shared', '-o', lib_file ] + objects \
+           + [ os.path.join( obj_dir, x ) for x in runtime ]
+
+  run_compile_cmds( [ link_cmd ], build_dir )
+
+#-----------------------------------------------------------------------
+# get_opt_profile
+#-----------------------------------------------------------------------
+def get_opt_profile( opt ):
   try:
-    result = check_output( compile_cmd.split() , stderr=STDOUT )
+    return OPT_PROFILES[ opt ]
+  except KeyError:
+    raise ValueError( "Unknown optimization profile '{}', expected one of: {}"
+                      .format( opt, ', '.join( sorted( OPT_PROFILES ) ) ) )
 
-  # handle gcc/llvm failure
+#-----------------------------------------------------------------------
+# get_compiler
+#-----------------------------------------------------------------------
+# Returns the C++ compiler command, which can be set with $CXX.
+def get_compiler():
+  return os.environ.get( 'CXX', 'g++' ).split()
 
-  except CalledProcessError as e:
-    error_msg = """
-      Module did not compile!
+#-----------------------------------------------------------------------
+# get_compiler_version
+#-----------------------------------------------------------------------
+_compiler_versions = {}
+
+def get_compiler_version():
+  cxx = tuple( get_compiler() )
+  if cxx not in _compiler_versions:
+    try:
+      _compiler_versions[ cxx ] = check_output( list( cxx ) + [ '--version' ],
+                                                stderr=STDOUT ).strip()
+    except ( OSError, CalledProcessError ):
+      _compiler_versions[ cxx ] = ''
+  return _compiler_versions[ cxx ]
 
-      Command:
-      {command}
+#-----------------------------------------------------------------------
+# get_compile_cmds
+#-----------------------------------------------------------------------
+# Returns the commands compiling each source into an object file in
+# obj_dir, and the list of object files. Files which Verilator puts on
+# the slow path (constructors, initial blocks, trace setup) and the
+# symbol table are compiled with the slow-path optimization flags.
+def get_compile_cmds( sources, obj_dir, include_dir, profile ):
+
+  cxx = get_compiler()
+  if find_executable( 'ccache' ) and 'ccache' not in cxx[0]:
+    cxx = [ 'ccache' ] + cxx
+
+  includes = [ '-I', include_dir ]
+  if os.path.isdir( os.path.join( include_dir, 'vltstd' ) ):
+    includes += [ '-I', os.path.join( include_dir, 'vltstd' ) ]
+
+  cmds, objects = [], []
+  for source in sources:
+    slow   = '__Slow' in source or '__Syms' in source
+    opt    = profile[ 'opt_slow' if slow else 'opt_fast' ]
+    obj    = os.path.join( obj_dir,
+                           os.path.splitext( os.path.basename( source ) )[0] + '.o' )
+    cmds.append( cxx + CXX_FLAGS.split() + opt.split() + includes
+                 + [ '-c', source, '-o', obj ] )
+    objects.append( obj )
+
+  return cmds, objects
 
-      Error:
-      {error}
-    """
+#-----------------------------------------------------------------------
+# run_compile_cmds
+#-----------------------------------------------------------------------
+# Run the given compiler commands in parallel, by default one per CPU
+# which can be changed with $PYMTL_VERILATOR_JOBS.
+def run_compile_cmds( cmds, build_dir='.', jobs=None ):
 
-    # Source:
-    # \x1b[31m {source} \x1b[0m
+  def run( cmd ):
+    try:
+      check_output( cmd, stderr=STDOUT, cwd=build_dir )
 
-    raise Exception( error_msg.format(
-      command = ' '.join( e.cmd ),
-      error   = e.output
-    ))
+    # handle gcc/llvm failure
+
+    except CalledProcessError as e:
+      error_msg = """
+        Module did not compile!
+
+        Command:
+        {command}
+
+        Error:
+        {error}
+      """
+
+      raise Exception( error_msg.format(
+        command = ' '.join( e.cmd ),
+        error   = e.output
+      ))
+
+  if jobs is None:
+    jobs = int( os.environ.get( 'PYMTL_VERILATOR_JOBS', 0 ) ) or cpu_count()
+  jobs = min( jobs, len( cmds ) )
+
+  if jobs <= 1:
+    for cmd in cmds:
+      run( cmd )
+    return
+
+  pool = ThreadPool( jobs )
+  try:
+    pool.map( run, cmds )
+  finally:
+    pool.close()
+    pool.join()
+
+#-----------------------------------------------------------------------
+# get_verilator_runtime
+#-----------------------------------------------------------------------
+# Copy the given precompiled runtime objects into obj_dir. The runtime
+# is compiled once per Verilator installation, compiler and flags, and
+# kept in the build cache.
+def get_verilator_runtime( include_dir, profile, obj_dir, objects ):
+
+  key = hash_key( 'verilator-runtime', include_dir, get_verilator_version(),
+                  get_compiler_version(), CXX_FLAGS, profile[ 'opt_fast' ] )
+
+  def build( runtime_dir ):
+    sources = [ os.path.join( include_dir, x ) for x in RUNTIME_SOURCES ]
+    cmds, _ = get_compile_cmds( sources, '.', include_dir, profile )
+    run_compile_cmds( cmds, runtime_dir )
+
+  def load( runtime_dir ):
+    for obj in objects:
+      shutil.copy( os.path.join( runtime_dir, obj ), obj_dir )
+
+  get_build_cache().get( key, build, load )
 
 #-----------------------------------------------------------------------
 # create_verilator_py_wrapper
@@ -282,19 +531,25 @@ def create_verilator_py_wrapper( model, wrapper_filename, lib_file, cdefs ):
   for x in model.get_ports( preserve_hierarchy=True ):
     recurse_port_hierarchy( x, port_defs )
 
-  for port in model.get_inports():
-    if port.name == 'clk': continue
-    input_ = set_input_stmt( port )
-    set_inputs.extend( input_ )
+  inports = [ x for x in model.get_inports() if x.name != 'clk' ]
+  for i, port in enumerate( inports ):
+    set_inputs.extend( set_input_stmt( port, i ) )
 
+  comb_outports = get_comb_outports( model )
   for port in model.get_outports():
     comb, next_ = set_output_stmt( port )
-    set_comb.extend( comb  )
+    if port.name in comb_outports:
+      set_comb.extend( comb )
     set_next.extend( next_ )
 
+  inports, outports = get_batch_ports( model )
+  batch_inputs  = [ ( x.name, x.nbits ) for x in inports  ]
+  batch_outputs = [ ( x.name, x.nbits ) for x in outports ]
+
   # pretty printing
-  indent_four = '\n    '
-  indent_six  = '\n      '
+  indent_four  = '\n    '
+  indent_six   = '\n      '
+  indent_eight = '\n        '
 
   # create source
   with open( template_filename , 'r' ) as template, \
@@ -302,13 +557,16 @@ def create_verilator_py_wrapper( model, wrapper_filename, lib_file, cdefs ):
 
     py_src = template.read()
     py_src = py_src.format(
-        model_name  = model.class_name,
-        port_decls  = cdefs,
-        lib_file    = lib_file,
-        port_defs   = indent_four.join( port_defs ),
-        set_inputs  = indent_six .join( set_inputs ),
-        set_comb    = indent_six .join( set_comb ),
-        set_next    = indent_six .join( set_next ),
+        model_name    = model.class_name,
+        port_decls    = cdefs,
+        lib_file      = lib_file,
+        port_defs     = indent_four.join( port_defs ),
+        num_inputs    = len( inports ),
+        set_inputs    = indent_six  .join( set_inputs ),
+        set_comb      = indent_eight.join( set_comb ),
+        set_next      = indent_six  .join( set_next ),
+        batch_inputs  = batch_inputs,
+        batch_outputs = batch_outputs,
     )
 
     #py_src += 'XTraceEverOn()' # TODO: add for tracing?
@@ -316,6 +574,145 @@ def create_verilator_py_wrapper( model, wrapper_filename, lib_file, cdefs ):
     output.write( py_src )
     #print( py_src )
 
+#-----------------------------------------------------------------------
+# get_comb_outports
+#-----------------------------------------------------------------------
+# Returns the names of the output ports with a combinational path from
+# an input port (other than clk), the other outputs only change on a
+# clock edge. Verilator does not export its dependency graph, so paths
+# are found in the PyMTL model the Verilog was translated from: nets
+# are connected through the @combinational blocks (every net a block
+# loads drives every net it stores) and slice connections. Imported
+# Verilog is opaque, so all its outputs are assumed to depend on all
+# its inputs, as are all outputs when a block cannot be analyzed: it
+# stores to a name which is not a signal of the model (e.g., an alias
+# of a port bound by a for loop) or calls a function for its side
+# effects (e.g., a helper method writing ports).
+def get_comb_outports( model ):
+
+  outports = set( port.name for port in model.get_outports() )
+  if isinstance( model, verilog.VerilogModel ):
+    return outports
+
+  nets, slice_connects = signals_to_nets( collect_signals( model ) )
+
+  # Map signals, and the SignalValues replacing them in models which
+  # have been simulated, to the index of their net
+
+  net_ids = {}
+  for i, net in enumerate( nets ):
+    for signal in net:
+      net_ids[ id( signal ) ] = i
+      value = getattr( signal, '_signalvalue', None )
+      if value is not None and not isinstance( value, ( int, long ) ):
+        net_ids[ id( value ) ] = i
+
+  edges = [ set() for net in nets ]
+
+  def connect( srcs, dests ):
+    for src in srcs:
+      edges[ src ].update( dests )
+
+  def ports_to_nets( ports ):
+    return [ net_ids[ id( port ) ] for port in ports ]
+
+  def collect_edges( m ):
+    if isinstance( m, verilog.VerilogModel ):
+      connect( ports_to_nets( m.get_inports()  ),
+               ports_to_nets( m.get_outports() ) )
+      return
+    for func in m.get_combinational_blocks():
+      if _has_side_effect_calls( func ):
+        raise _UnresolvedStore( func.__name__ )
+      loads, stores = _get_loads_and_stores( func )
+      connect( [ net for name in loads  for net in _name_to_net_ids( m, name, net_ids ) ],
+               [ net for name in stores for net in _name_to_net_ids( m, name, net_ids,
+                                                                     store=True ) ] )
+    for subm in m.get_submodules():
+      collect_edges( subm )
+
+  try:
+    collect_edges( model )
+  except ( _UnresolvedStore, AttributeError, IndexError, KeyError, TypeError ):
+    return outports
+
+  for c in slice_connects:
+    src  = net_ids.get( id( c.src_node  ) )
+    dest = net_ids.get( id( c.dest_node ) )
+    if src is not None and dest is not None:
+      edges[ src ].add( dest )
+
+  # Walk the nets reachable from the inputs
+
+  visited = set( ports_to_nets( [ x for x in model.get_inports()
+                                  if x.name != 'clk' ] ) )
+  pending = list( visited )
+  while pending:
+    for net in edges[ pending.pop() ]:
+      if net not in visited:
+        visited.add( net )
+        pending.append( net )
+
+  return set( port.name for port in model.get_outports()
+              if net_ids[ id( port ) ] in visited )
+
+#-----------------------------------------------------------------------
+# _UnresolvedStore
+#-----------------------------------------------------------------------
+# Raised when the signals written by a block cannot be determined.
+class _UnresolvedStore( Exception ):
+  pass
+
+#-----------------------------------------------------------------------
+# _has_side_effect_calls
+#-----------------------------------------------------------------------
+# Returns True if a block calls a function without using its result,
+# the signals written by such a call are not visible in the block.
+def _has_side_effect_calls( func ):
+  return get_cached_analysis( func, 'side_effect_calls',
+           lambda tree: any( isinstance( node, ast.Expr ) and
+                             isinstance( node.value, ast.Call )
+                             for node in ast.walk( tree ) ) )
+
+#-----------------------------------------------------------------------
+# _name_to_net_ids
+#-----------------------------------------------------------------------
+# Resolve a name acquired from the ast (e.g., 's.out[?].msg.value') to
+# the indices of the nets it refers to. Names which are not attributes
+# of the model (temporaries) or not signals (parameters) have no nets.
+# Stores must either be to a temporary or resolve to signals, otherwise
+# _UnresolvedStore is raised since we cannot tell what is written.
+def _name_to_net_ids( model, name, net_ids, store=False ):
+
+  extra = ''
+  if '[?]' in name:
+    name, extra = name.split( '[?]', 1 )
+  path = _attr_path( name )
+  if not path or path[0] not in ( 's', 'self' ):
+    if store and ( extra or len( path ) != 1 ):
+      raise _UnresolvedStore( name )
+    return []
+
+  # Stop at the first signal, the rest of the path is an attribute of
+  # the signal (e.g., value or next)
+
+  x = model
+  for step in path[1:]:
+    if id( x ) in net_ids: break
+    x = x[ step ] if step.__class__ is int else getattr( x, step )
+
+  if   id( x ) in net_ids:
+    return [ net_ids[ id( x ) ] ]
+  elif isinstance( x, PortBundle ):
+    return [ net_ids[ id( port ) ] for port in x.get_ports() ]
+  elif isinstance( x, list ):
+    return [ net for i in range( len( x ) )
+                 for net in _name_to_net_ids( model,
+                   '{}[{}]{}'.format( name, i, extra ), net_ids, store ) ]
+  elif store:
+    raise _UnresolvedStore( name )
+  return []
+
 #-----------------------------------------------------------------------
 # get_indices
 #-----------------------------------------------------------------------
@@ -327,37 +724,83 @@ def get_indices( port ):
   return [ ( i, '[{}:{}]'.format( i*32, min( i*32+32, port.nbits) ) )
            for i in range(num_assigns) ]
 
+#-----------------------------------------------------------------------
+# get_wide_nbytes
+#-----------------------------------------------------------------------
+# Verilator stores ports wider than 64 bits as arrays of 32-bit words,
+# least significant word first. On little-endian hosts this is exactly
+# the little-endian byte representation of the value (see Bits.to_bytes)
+# so wide ports are copied with a single memmove rather than word by
+# word. Returns the size of the array in bytes, or None if the port
+# must be copied word by word.
+def get_wide_nbytes( port ):
+  if port.nbits <= 64 or sys.byteorder != 'little':
+    return None
+  return len( get_indices( port ) ) * 4
+
+#-----------------------------------------------------------------------
+# get_value_expr
+#-----------------------------------------------------------------------
+# Utility function for reading the value of an output port, wide ports
+# are copied out of the verilated model in one go where possible.
+def get_value_expr( port ):
+  nbytes = get_wide_nbytes( port )
+  if nbytes:
+    return 'Bits.from_bytes( {}, s._cffi.buffer( s._m.{}, {} )[:] )' \
+           .format( port.nbits, port.verilator_name, nbytes )
+  return ' | '.join( 's._m.{}[{}]{}'.format( port.verilator_name, idx,
+                                            ' << {}'.format( idx*32 ) if idx else '' )
+                     for idx, offset in get_indices( port ) )
+
 #-----------------------------------------------------------------------
 # set_input_stmt
 #-----------------------------------------------------------------------
-def set_input_stmt( port ):
-  inputs = []
-  for idx, offset in get_indices( port ):
-    inputs.append( 's._m.{v_name}[{idx}] = s.{py_name}{offset}' \
-                    .format( v_name  = port.verilator_name,
-                             py_name = port.name,
-                             idx     = idx,
-                             offset  = offset )
-                   )
+# Inputs are only written to the Verilator model when they changed since
+# the last eval, last_inputs[i] holds the value last written for the
+# port. The changed flag tells whether the model needs to be evaluated.
+#
+# Note that wide inputs call to_bytes through the class, the simulator
+# only adds s.{port} to the sensitivity list of the block if it appears
+# on its own rather than as s.{port}.to_bytes.
+def set_input_stmt( port, i ):
+
+  nbytes = get_wide_nbytes( port )
+  if nbytes:
+    value = 'Bits.to_bytes( s.{}, {} )'.format( port.name, nbytes )
+  else:
+    value = 'int( s.{} )'.format( port.name )
+
+  inputs = [ 'value = {}'.format( value ),
+             'if value != last_inputs[{}]:'.format( i ),
+             '  last_inputs[{}] = value'.format( i ) ]
+
+  indices = get_indices( port )
+  if nbytes:
+    inputs.append( '  s._cffi.memmove( s._m.{}, value, {} )'
+                   .format( port.verilator_name, nbytes ) )
+  else:
+    for idx, offset in indices:
+      inputs.append( '  s._m.{v_name}[{idx}] = {value}' \
+                      .format( v_name = port.verilator_name,
+                               idx    = idx,
+                               value  = 'value' if len( indices ) == 1 else
+                                        'value >> {} & 0xffffffff'.format( idx*32 ) )
+                     )
+  inputs.append( '  changed = True' )
   return inputs
 
 #-----------------------------------------------------------------------
 # set_output_stmt
 #-----------------------------------------------------------------------
-# TODO: no way to distinguish between combinational and sequential
-#       outputs, so we set outputs both ways...
-#       This seems broken, but I can't think of a better way.
+# Returns the statements writing an output port after the combinational
+# eval (value) and after the clock edge (next). Both phases only write
+# an output when its value changed.
 def set_output_stmt( port ):
-  comb, next_ = [], []
-  for idx, offset in get_indices( port ):
-    assign = 's.{py_name}{offset}.{sigtype} = s._m.{v_name}[{idx}]' \
-             .format( v_name  = port.verilator_name,
-                      py_name = port.name,
-                      idx     = idx,
-                      offset  = offset,
-                      sigtype = '{sigtype}' )
-    comb .append( assign.format( sigtype = 'value' ) )
-    next_.append( assign.format( sigtype = 'next'  ) )
+  value = get_value_expr( port )
+  comb  = [ 's.{}.value = {}'.format( port.name, value ) ]
+  next_ = [ 'value = {}'.format( value ),
+            'if value != s.{}:'.format( port.name ),
+            '  s.{}.next = value'.format( port.name ) ]
   return comb, next_
 
 #-----------------------------------------------------------------------
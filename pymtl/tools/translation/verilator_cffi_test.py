@@ -0,0 +1,222 @@
+#=======================================================================
+# verilator_cffi_test.py
+#=======================================================================
+# Tests for the compilation of verilated models into shared libraries.
+# The verilated sources and Verilator runtime are replaced by small C++
+# files, so these tests only require a C++ compiler.
+
+import os
+import ctypes
+import pytest
+
+import verilator_cffi
+
+from pymtl          import *
+from pclib.rtl      import Reg, Mux
+from pclib.rtl.queues import SingleElementPipelinedQueue
+from build_cache    import get_build_cache
+from verilator_cffi import OPT_PROFILES, get_opt_profile, get_compile_cmds
+from verilator_cffi import run_compile_cmds, create_shared_lib
+from verilator_cffi import get_comb_outports
+
+_has = lambda x: verilator_cffi.find_executable( x ) != None
+
+requires_cxx = pytest.mark.skipif( not _has('g++'), reason='requires g++' )
+
+#-----------------------------------------------------------------------
+# Test Config
+#-----------------------------------------------------------------------
+
+@pytest.fixture
+def build_env( tmpdir, monkeypatch ):
+
+  include_dir = tmpdir.mkdir( 'include' )
+  include_dir.join( 'verilated.h' ).write(
+    '#include <stdlib.h>\nint vl_runtime();\n' )
+  include_dir.join( 'verilated.cpp' ).write(
+    '#include "verilated.h"\nint vl_runtime() { return 40; }\n' )
+  include_dir.join( 'verilated_vcd_c.cpp' ).write(
+    'int vl_vcd() { return 0; }\n' )
+  include_dir.join( 'verilated_vcd_c.h' ).write( '' )
+
+  monkeypatch.setenv( 'PYMTL_VERILATOR_INCLUDE_DIR', str( include_dir ) )
+  monkeypatch.setenv( 'PYMTL_BUILD_CACHE', str( tmpdir.join( 'cache' ) ) )
+  monkeypatch.setenv( 'CXX', 'g++' )
+  monkeypatch.setattr( verilator_cffi, 'find_executable',
+                       lambda x: None if x == 'ccache' else x )
+
+  return tmpdir
+
+def make_model( build_dir ):
+  obj_dir = build_dir.mkdir( 'obj_dir_Top' )
+  obj_dir.join( 'VTop.h' ).write( 'int top_fast();\nint top_slow();\n' )
+  obj_dir.join( 'VTop.cpp' ).write(
+    '#include "VTop.h"\nint top_fast() { return 1; }\n' )
+  obj_dir.join( 'VTop__Slow.cpp' ).write(
+    '#include "VTop.h"\nint top_slow() { return 1; }\n' )
+  build_dir.join( 'Top_v.cpp' ).write(
+    '#include "obj_dir_Top/VTop.h"\n#include "verilated.h"\n'
+    'extern "C" int eval() { return vl_runtime() + top_fast() + top_slow(); }\n' )
+
+#-----------------------------------------------------------------------
+# test_get_opt_profile
+#-----------------------------------------------------------------------
+
+def test_get_opt_profile():
+  assert get_opt_profile( 'fast-run' ) is OPT_PROFILES[ 'fast-run' ]
+  with pytest.raises( ValueError ):
+    get_opt_profile( 'fast' )
+  with pytest.raises( ValueError ):
+    TranslationTool( Reg(8), opt='fast' )
+
+#-----------------------------------------------------------------------
+# test_get_compile_cmds
+#-----------------------------------------------------------------------
+
+def test_get_compile_cmds( monkeypatch ):
+  monkeypatch.setenv( 'CXX', 'clang++ -g' )
+  monkeypatch.setattr( verilator_cffi, 'find_executable', lambda x: x )
+
+  profile       = OPT_PROFILES[ 'fast-run' ]
+  sources       = [ 'obj_dir_Top/VTop.cpp', 'obj_dir_Top/VTop__Slow.cpp',
+                    'obj_dir_Top/VTop__Syms.cpp', 'Top_v.cpp' ]
+  cmds, objects = get_compile_cmds( sources, 'obj_dir_Top', '/inc', profile )
+
+  assert objects == [ 'obj_dir_Top/VTop.o', 'obj_dir_Top/VTop__Slow.o',
+                      'obj_dir_Top/VTop__Syms.o', 'obj_dir_Top/Top_v.o' ]
+
+  for cmd, obj, slow in zip( cmds, objects, [ 0, 1, 1, 0 ] ):
+    assert cmd[:3] == [ 'ccache', 'clang++', '-g' ]
+    assert cmd[-2:] == [ '-o', obj ]
+    assert ' '.join( cmd ).count( profile[ 'opt_slow' if slow else 'opt_fast' ] )
+
+#-----------------------------------------------------------------------
+# test_run_compile_cmds
+#-----------------------------------------------------------------------
+
+@pytest.mark.parametrize( 'jobs', [ 1, 4 ] )
+def test_run_compile_cmds( tmpdir, jobs ):
+  cmds = [ [ 'touch', 'file{}'.format( i ) ] for i in range( 8 ) ]
+  run_compile_cmds( cmds, str( tmpdir ), jobs )
+  assert sorted( x.basename for x in tmpdir.listdir() ) \
+         == [ 'file{}'.format( i ) for i in range( 8 ) ]
+
+  with pytest.raises( Exception ) as e:
+    run_compile_cmds( cmds + [ [ 'sh', '-c', 'echo oops; exit 1' ] ],
+                      str( tmpdir ), jobs )
+  assert 'oops' in str( e.value )
+
+#-----------------------------------------------------------------------
+# test_create_shared_lib
+#-----------------------------------------------------------------------
+
+@requires_cxx
+@pytest.mark.parametrize( 'opt', sorted( OPT_PROFILES ) )
+def test_create_shared_lib( build_env, opt ):
+
+  for name in [ 'build0', 'build1' ]:
+    build_dir = build_env.mkdir( name )
+    make_model( build_dir )
+    create_shared_lib( 'Top', 'Top_v.cpp', 'libTop_v.so', '',
+                       str( build_dir ), opt )
+
+    lib = ctypes.CDLL( str( build_dir.join( 'libTop_v.so' ) ) )
+    assert lib.eval() == 42
+
+  # The runtime was compiled once and shared by both models
+
+  entries = get_build_cache().entries()
+  assert len( entries ) == 1
+  assert sorted( os.listdir( get_build_cache().entry_dir( entries[0][2] ) ) ) \
+         == [ 'verilated.o', 'verilated_vcd_c.o' ]
+
+#-----------------------------------------------------------------------
+# test_get_comb_outports
+#-----------------------------------------------------------------------
+
+class SliceConnect( Model ):
+  def __init__( s ):
+    s.in_  = InPort ( 8 )
+    s.out  = OutPort( 8 )
+    s.regd = OutPort( 8 )
+    s.reg  = Reg( 4 )
+    s.connect( s.in_[0:4], s.out[0:4]  )
+    s.connect( s.in_[4:8], s.reg.in_   )
+    s.connect( s.reg.out,  s.out[4:8]  )
+    s.connect( s.reg.out,  s.regd[0:4] )
+
+# The queue has a combinational path from deq.rdy to enq.rdy, but
+# deq.rdy is not driven by an input
+
+class Bypass( Model ):
+  def __init__( s ):
+    s.in_ = [ InPort( 8 ) for _ in range( 2 ) ]
+    s.out = OutPort( 8 )
+    s.sel = OutPort( 8 )
+    s.q   = SingleElementPipelinedQueue( 8 )
+
+    s.connect( s.in_[0], s.q.enq.msg )
+
+    @s.combinational
+    def comb_logic():
+      s.out.value = 0
+      for i in range( 2 ):
+        s.out.value = s.out | s.in_[i]
+
+    @s.combinational
+    def sel_logic():
+      s.sel.value = s.q.enq.rdy
+
+# Blocks writing ports through an alias or a helper method cannot be
+# analyzed, all outputs are then assumed to be combinational
+
+class AliasedStore( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 8 )
+    s.out = [ OutPort( 8 ) for _ in range( 2 ) ]
+    s.reg = OutPort( 8 )
+
+    @s.combinational
+    def comb_logic():
+      for port in s.out:
+        port.value = s.in_
+
+    @s.tick
+    def seq_logic():
+      s.reg.next = s.in_
+
+class HelperStore( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 8 )
+    s.out = OutPort( 8 )
+    s.reg = OutPort( 8 )
+
+    @s.combinational
+    def comb_logic():
+      s.set_out()
+
+    @s.tick
+    def seq_logic():
+      s.reg.next = s.in_
+
+  def set_out( s ):
+    s.out.value = s.in_
+
+def test_get_comb_outports():
+
+  for model, comb in [
+    ( Reg( 8 ),                        set() ),
+    ( Mux( 8, 4 ),                     { 'out' } ),
+    ( SingleElementPipelinedQueue( 8 ), { 'enq.rdy', 'deq.val' } ),
+    ( SliceConnect(),                  { 'out' } ),
+    ( Bypass(),                        { 'out' } ),
+    ( AliasedStore(),                  { 'out[0]', 'out[1]', 'reg' } ),
+    ( HelperStore(),                   { 'out', 'reg' } ),
+  ]:
+    model.elaborate()
+    assert get_comb_outports( model ) == comb
+
+    # Models can also be analyzed after being simulated
+
+    SimulationTool( model )
+    assert get_comb_outports( model ) == comb
@@ -5,31 +5,53 @@
 from __future__ import print_function
 
 import os
+import imp
 import sys
-import filecmp
+import shutil
+import tempfile
 import verilog
+import StringIO
 
-from os.path        import exists
-from verilator_cffi import verilog_to_pymtl
+from verilator_cffi import verilog_to_pymtl, get_verilator_flags
+from verilator_cffi import get_verilator_version, get_compiler_version
+from verilator_cffi import get_opt_profile, CXX_FLAGS
+from build_cache    import get_build_cache, hash_key
+from ..simulation.vcd import get_vcd_timescale
+
+# Sources which determine the generated wrappers, part of the cache key
+
+_this_dir          = os.path.dirname( os.path.abspath( __file__ ) )
+_wrapper_templates = [ os.path.join( _this_dir, x ) for x in [
+                       'verilator_wrapper.templ.c',
+                       'verilator_wrapper.templ.py',
+                       'verilator_cffi.py',
+                       'cpp_helpers.py',
+                     ]]
 
 #-----------------------------------------------------------------------
 # TranslationTool
 #-----------------------------------------------------------------------
-def TranslationTool( model_inst, lint=False ):
+def TranslationTool( model_inst, lint=False, opt='fast-compile' ):
   """Translates a PyMTL model into Python-wrapped Verilog.
 
   model_inst: an un-elaborated Model instance
   lint:       run verilator linter, warnings are fatal
               (disables -Wno-lint flag)
+  opt:        optimization profile, 'fast-compile' or 'fast-run'
+              (see verilator_cffi.create_shared_lib)
+
+  Verilated models are kept in the shared build cache (see
+  build_cache.py) and only rebuilt when the generated Verilog or the
+  build setup changes. A copy of the generated Verilog is written to
+  the current directory.
   """
 
+  profile = get_opt_profile( opt )
+
   model_inst.elaborate()
 
-  # Translate the PyMTL module to Verilog, if we've already done
-  # translation check if there's been any changes to the source
   model_name      = model_inst.class_name
   verilog_file    = model_name + '.v'
-  temp_file       = model_name + '.v.tmp'
   c_wrapper_file  = model_name + '_v.cpp'
   py_wrapper_file = model_name + '_v.py'
   lib_file        = 'lib{}_v.so'.format( model_name )
@@ -39,33 +61,84 @@ def TranslationTool( model_inst, lint=False ):
   except AttributeError:
     vcd_file      = ''
 
-  # Write the output to a temporary file
-  with open( temp_file, 'w+' ) as fd:
-    verilog.translate( model_inst, fd )
+  # Translate the PyMTL module to Verilog
+
+  fd = StringIO.StringIO()
+  verilog.translate( model_inst, fd )
+  verilog_src = fd.getvalue()
 
-  # Check if the temporary file matches an existing file (caching)
-  cached = False
-  if exists(verilog_file) and exists(py_wrapper_file) and exists(lib_file):
-    cached = filecmp.cmp( temp_file, verilog_file )
-    if not cached:
-      os.system( ' diff %s %s'%( temp_file, verilog_file ))
+  write_atomic( verilog_file, verilog_src )
 
-  # Rename temp to actual output
-  os.rename( temp_file, verilog_file )
+  # The cache key covers everything the verilated model depends on
 
-  # Verilate the module only if we've updated the verilog source
-  if not cached:
+  key = hash_key(
+    verilog_src,
+    get_verilator_flags( vcd_file, lint, opt ),
+    get_vcd_timescale( model_inst ) if vcd_file else '',
+    CXX_FLAGS,
+    sorted( profile.items() ),
+    get_verilator_version(),
+    get_compiler_version(),
+    os.environ.get( 'PYMTL_VERILATOR_INCLUDE_DIR', '' ),
+    *[ open( x ).read() for x in _wrapper_templates ]
+  )
+
+  # Verilate the module only if it is not in the cache
+
+  def build( build_dir ):
     print( "NOT CACHED", verilog_file )
+    write_atomic( os.path.join( build_dir, verilog_file ), verilog_src )
     verilog_to_pymtl( model_inst, verilog_file, c_wrapper_file,
-                      lib_file, py_wrapper_file, vcd_file, lint )
+                      lib_file, py_wrapper_file, vcd_file, lint,
+                      build_dir, opt )
+
+    # The verilated C++ is compiled into the shared library, there is
+    # no need to keep it in the cache
+    shutil.rmtree( os.path.join( build_dir, 'obj_dir_' + model_name ) )
 
-  # Use some trickery to import the verilated version of the model
-  sys.path.append( os.getcwd() )
-  __import__( py_wrapper_file[:-3] )
-  imported_module = sys.modules[ py_wrapper_file[:-3] ]
+  def load( entry_dir ):
+    return load_wrapper( os.path.join( entry_dir, py_wrapper_file ) )
+
+  imported_module, cached = get_build_cache().get( key, build, load )
 
   # Get the model class from the module, instantiate and elaborate it
   model_class = imported_module.__dict__[ model_name ]
   model_inst  = model_class( vcd_file )
 
   return model_inst
+
+#-----------------------------------------------------------------------
+# load_wrapper
+#-----------------------------------------------------------------------
+# Import the Python wrapper of a verilated model. Wrappers are loaded
+# from their file without writing bytecode into the shared cache, and
+# only once per process so that all instances share the same class.
+_wrappers = {}
+
+def load_wrapper( filename ):
+
+  if filename not in _wrappers:
+    module_name = os.path.splitext( os.path.basename( filename ) )[0]
+    module      = imp.new_module( module_name )
+    module.__file__ = filename
+    with open( filename ) as fd:
+      exec( compile( fd.read(), filename, 'exec' ), module.__dict__ )
+    sys.modules[ module_name ] = module
+    _wrappers  [ filename    ] = module
+
+  return _wrappers[ filename ]
+
+#-----------------------------------------------------------------------
+# write_atomic
+#-----------------------------------------------------------------------
+# Write a file through a temporary file, so that concurrent processes
+# never see a partially written file.
+def write_atomic( filename, text ):
+
+  fd, temp_file = tempfile.mkstemp( prefix=os.path.basename( filename ),
+                                    suffix='.tmp',
+                                    dir=os.path.dirname( filename ) or '.' )
+  with os.fdopen( fd, 'w' ) as output:
+    output.write( text )
+  os.chmod( temp_file, 0644 )
+  os.rename( temp_file, filename )
@@ -46,3 +46,16 @@ def test_reg8():
 
 def test_reg16():
   reg_test( Reg(16) )
+
+def test_cached( tmpdir, monkeypatch ):
+  monkeypatch.setenv( 'PYMTL_BUILD_CACHE', str( tmpdir ) )
+
+  from build_cache import get_build_cache
+  reg_test( Reg(8) )
+  entries = get_build_cache().entries()
+  assert len( entries ) == 1
+
+  # A second translation of the same design reuses the cached model
+
+  reg_test( Reg(8) )
+  assert get_build_cache().entries()[0][2] == entries[0][2]
@@ -41,6 +41,8 @@ extern "C" {{
   V{model_name}_t * create_model( const char * );
   void destroy_model( V{model_name}_t *);
   void eval( V{model_name}_t * );
+  void run_cycles( V{model_name}_t *, unsigned int,
+                   const unsigned int *, unsigned int * );
 }}
 
 
@@ -132,3 +134,41 @@ void eval( V{model_name}_t * m ) {{
 #endif
 
 }}
+
+//----------------------------------------------------------------------
+// run_cycles()
+//----------------------------------------------------------------------
+// Simulate ncycles cycles without returning to Python. For every cycle,
+// in_buf holds the packed inputs ({in_words} 32-bit words, see
+// verilator_cffi.get_batch_ports) which are applied before evaluating
+// the combinational logic, and the outputs are packed into out_buf
+// ({out_words} words) right before the rising clock edge.
+//
+void run_cycles( V{model_name}_t * m, unsigned int ncycles,
+                 const unsigned int * in_buf, unsigned int * out_buf ) {{
+
+  V{model_name} * model = (V{model_name} *) m->model;
+
+  for ( unsigned int i = 0; i < ncycles; i++ ) {{
+
+    const unsigned int * in  = in_buf  + i * {in_words};
+    unsigned int       * out = out_buf + i * {out_words};
+
+    // set inputs and evaluate combinational logic
+
+    {pack_inputs}
+    eval( m );
+
+    // sample outputs
+
+    {pack_outputs}
+
+    // rising clock edge
+
+    model->clk = 0;
+    eval( m );
+    model->clk = 1;
+    eval( m );
+  }}
+
+}}
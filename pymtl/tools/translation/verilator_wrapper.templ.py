@@ -15,6 +15,10 @@ from cffi  import FFI
 class {model_name}( Model ):
   id_ = 0
 
+  # ( name, nbits ) of the ports packed by run_cycles, in buffer order
+  _batch_inputs  = {batch_inputs}
+  _batch_outputs = {batch_outputs}
+
   def __init__( s, vcd_file='' ):
 
     # initialize FFI, define the exposed interface
@@ -33,6 +37,8 @@ class {model_name}( Model ):
       V{model_name}_t * create_model( const char * );
       void destroy_model( V{model_name}_t *);
       void eval( V{model_name}_t * );
+      void run_cycles( V{model_name}_t *, unsigned int,
+                       const unsigned int *, unsigned int * );
 
     ''')
 
@@ -44,9 +50,12 @@ class {model_name}( Model ):
       filen, ext         = os.path.splitext( vcd_file )
       verilator_vcd_file = '{{}}.verilator{{}}{{}}'.format(filen, s.id_, ext)
 
-    # import the shared library containing the model and construct it
-    s._ffi = ffi.dlopen('./{lib_file}')
-    s._m   = s._ffi.create_model( ffi.new("char[]", verilator_vcd_file) )
+    # import the shared library containing the model and construct it,
+    # the library is in the same directory as this wrapper
+    lib_dir = os.path.dirname( os.path.abspath( __file__ ) )
+    s._cffi = ffi
+    s._ffi  = ffi.dlopen( os.path.join( lib_dir, '{lib_file}' ) )
+    s._m    = s._ffi.create_model( ffi.new("char[]", verilator_vcd_file) )
 
     # dummy class to emulate PortBundles
     class BundleProxy( PortBundle ):
@@ -63,18 +72,23 @@ class {model_name}( Model ):
 
   def elaborate_logic( s ):
 
+    # values last written to the inputs of the verilated model
+    last_inputs = [ None ] * {num_inputs}
+
     @s.combinational
     def logic():
 
-      # set inputs
+      # set the inputs which changed since the last eval
+      changed = False
       {set_inputs}
 
-      # execute combinational logic
-      s._ffi.eval( s._m )
+      # execute combinational logic, unless no input changed
+      if changed:
+        s._ffi.eval( s._m )
 
-      # set outputs
-      # FIXME: currently write all outputs, not just combinational outs
-      {set_comb}
+        # set outputs with a combinational path from an input, the
+        # other outputs only change on a clock edge
+        {set_comb}
 
     @s.posedge_clk
     def tick():
@@ -84,7 +98,6 @@ class {model_name}( Model ):
       s._m.clk[0] = 1
       s._ffi.eval( s._m )
 
-      # double buffer register outputs
-      # FIXME: currently write all outputs, not just registered outs
+      # double buffer outputs, both registered and combinational outputs
+      # may change when the state of the model is updated
       {set_next}
-